@@ -0,0 +1,123 @@
+"""compare downloading big archives with a default aiohttp session and with the tuned one
+
+a stand-in for the mirror runs in its own process on localhost and serves archives of
+ARCHIVE_MB, written in 64 KiB pieces like a real server. NUM_DOWNLOADERS workers download
+NUM_ARCHIVES of them, as run_async_download does. on localhost there is no dns lookup or
+network latency, so this mostly shows the cost of reading; keep-alive and dns caching
+only add to the difference against the real mirror
+
+run from the package root: python benchmarks/bench_download.py
+"""
+import os
+import sys
+import time
+import asyncio
+import tracemalloc
+import multiprocessing
+
+from aiohttp import web, ClientSession
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from wiki_counts import download  # noqa: E402
+from wiki_counts.session import make_session  # noqa: E402
+
+PORT = 8766
+ARCHIVE_MB = 128
+NUM_ARCHIVES = 12
+NUM_DOWNLOADERS = 3
+ROOT = f'http://localhost:{PORT}/2020/2020-05/'
+
+
+def serve():
+    """the stand-in mirror, archives are served from memory so the disk isn't measured"""
+    archive = os.urandom(ARCHIVE_MB * 1024 ** 2)
+    piece = 64 * 1024
+
+    async def handle_archive(request):
+        response = web.StreamResponse(headers={'Content-Length': str(len(archive))})
+        await response.prepare(request)
+        view = memoryview(archive)
+        for start in range(0, len(archive), piece):
+            await response.write(view[start:start + piece])
+        return response
+
+    async def handle_md5sums(request):
+        # nothing published, so fetch_archive doesn't check anything
+        return web.Response(text='')
+
+    app = web.Application()
+    app.router.add_get('/2020/2020-05/md5sums.txt', handle_md5sums)
+    app.router.add_get('/2020/2020-05/{name}', handle_archive)
+    web.run_app(app, port=PORT, print=None)
+
+
+async def read_whole(session: ClientSession, url: str):
+    """how archives were downloaded before, the whole response read at once"""
+    async with session.get(url) as response:
+        response.raise_for_status()
+        return await response.read()
+
+
+async def read_chunks(session: ClientSession, url: str):
+    """fetch_archive's reading, without the md5"""
+    contents = bytearray()
+    async with session.get(url) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(download.DOWNLOAD_CHUNK_BYTES):
+            contents += chunk
+    return contents
+
+
+async def run(make, fetch, urls):
+    """download urls with NUM_DOWNLOADERS workers sharing one session"""
+    queue = asyncio.Queue()
+    for url in urls:
+        queue.put_nowait(url)
+
+    async def worker(session):
+        while not queue.empty():
+            await fetch(session, queue.get_nowait())
+
+    async with make() as session:
+        await asyncio.gather(*(worker(session) for _ in range(NUM_DOWNLOADERS)))
+
+
+def measure(name, make, fetch):
+    urls = [f'{ROOT}pageviews-20200501-{i:02}0000.gz' for i in range(NUM_ARCHIVES)]
+
+    start = time.perf_counter()
+    asyncio.run(run(make, fetch, urls))
+    elapsed = time.perf_counter() - start
+
+    # memory is measured on its own, since tracing slows everything down
+    tracemalloc.start()
+    asyncio.run(run(make, fetch, urls[:1]))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    mb = ARCHIVE_MB * NUM_ARCHIVES
+    print(f'{name:<34} {mb / elapsed:7.0f} MB/s, peak memory for one {ARCHIVE_MB} MB archive '
+          f'{peak / 1024 ** 2:6.0f} MiB')
+
+
+if __name__ == '__main__':
+    # the benchmark shouldn't add to the throughput history --plan uses
+    download.record_throughput = lambda *args: None
+
+    server = multiprocessing.Process(target=serve, daemon=True)
+    server.start()
+    time.sleep(1.5)
+
+    print(f'{NUM_ARCHIVES} archives of {ARCHIVE_MB} MB, {NUM_DOWNLOADERS} downloaders')
+    try:
+        tuned = lambda: make_session(NUM_DOWNLOADERS)  # noqa: E731
+        for _ in range(2):
+            measure('default session, read()', ClientSession, read_whole)
+            measure('make_session, read()', tuned, read_whole)
+            measure('default session, chunks', ClientSession, read_chunks)
+            measure('make_session, chunks', tuned, read_chunks)
+            # md5 is computed in the event loop, on one cpu for all the downloads
+            measure('make_session, fetch_archive', tuned, download.fetch_archive)
+    finally:
+        server.terminate()
@@ -0,0 +1,75 @@
+"""compare analyzing an archive read with gzip.open(..., 'rt') and with the read-ahead thread
+
+a synthetic archive of NUM_LINES pageviews lines is written to a temporary directory, then
+build_most_viewed_map analyzes it both ways. inflating and parsing only overlap when the
+file processor has a second core to run the read-ahead thread on
+
+run from the package root: python benchmarks/bench_readahead.py
+"""
+import os
+import sys
+import gzip
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from wiki_counts import utils  # noqa: E402
+from wiki_counts.analyze import build_most_viewed_map  # noqa: E402
+from wiki_counts.readahead import open_readahead, BLOCK_BYTES  # noqa: E402
+
+NUM_LINES = 3_000_000
+NUM_DOMAINS = 800
+BLOCK_SIZES = [256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2]
+ROUNDS = 3
+
+
+def write_archive(path: str, num_lines: int, num_domains: int):
+    """synthetic pageviews archive, domain sorted like the real dumps"""
+    random.seed(0)
+    per_domain = num_lines // num_domains
+
+    with gzip.open(path, 'wt', compresslevel=6) as f:
+        for d in range(num_domains):
+            domain = f'domain{d:04d}'
+            f.writelines(
+                f'{domain} Page_{random.getrandbits(48):x} {int(random.paretovariate(1.2))} 0\n'
+                for _ in range(per_domain))
+
+
+def best_of(func) -> float:
+    times = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def count_lines(open_func, path):
+    with open_func(path) as f:
+        return sum(1 for _ in f)
+
+
+if __name__ == '__main__':
+    print(f'{os.cpu_count()} cpus')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'pageviews-20200501-000000.gz')
+        write_archive(path, NUM_LINES, NUM_DOMAINS)
+        print(f'{NUM_LINES} lines, {os.path.getsize(path) / 1024 ** 2:.0f} MiB compressed')
+
+        gzip_text = lambda p: gzip.open(p, 'rt')  # noqa: E731
+        print(f'{"gzip.open rt, lines only":<34} {best_of(lambda: count_lines(gzip_text, path)):.2f}s')
+        for block_bytes in BLOCK_SIZES:
+            readahead = lambda p: open_readahead(p, block_bytes=block_bytes)  # noqa: E731
+            print(f'{f"read-ahead {block_bytes // 1024} KiB, lines only":<34} '
+                  f'{best_of(lambda: count_lines(readahead, path)):.2f}s')
+
+        # the whole analysis, as a file processor runs it
+        utils.READAHEAD_BLOCK_BYTES = None
+        print(f'{"gzip.open rt, analyze":<34} {best_of(lambda: build_most_viewed_map(path, set())):.2f}s')
+        utils.READAHEAD_BLOCK_BYTES = BLOCK_BYTES
+        print(f'{f"read-ahead {BLOCK_BYTES // 1024} KiB, analyze":<34} '
+              f'{best_of(lambda: build_most_viewed_map(path, set())):.2f}s')
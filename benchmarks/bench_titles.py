@@ -0,0 +1,67 @@
+"""compare memory held by several parsed hours, as strings and as title ids
+
+every hour is parsed into fresh str objects, like reading separate results files.
+run from the package root: python benchmarks/bench_titles.py
+"""
+import os
+import sys
+import time
+import random
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from wiki_counts.titles import TitleDictionary, encode_pages, merge_pages  # noqa: E402
+
+NUM_PAGES = 1_000_000
+NUM_DOMAINS = 500
+NUM_HOURS = 4
+
+
+def parse_hour(hour: int):
+    """one hour of (count_views, page_title) tuples per domain, with new str objects"""
+    random.seed(hour)
+    per_domain = NUM_PAGES // NUM_DOMAINS
+    return {
+        f'domain{d:03d}': [(random.randint(1, 1000), ''.join(['Page_Title_', str(p)]))
+                           for p in range(per_domain)]
+        for d in range(NUM_DOMAINS)}
+
+
+def hold_strings():
+    return [parse_hour(hour) for hour in range(NUM_HOURS)]
+
+
+def hold_ids():
+    titles = TitleDictionary()
+    hours = []
+    for hour in range(NUM_HOURS):
+        parsed = parse_hour(hour)
+        hours.append({domain: encode_pages(titles, domain, pages)
+                      for domain, pages in parsed.items()})
+    return titles, hours
+
+
+def measure(build):
+    tracemalloc.start()
+    held = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return held, current
+
+
+if __name__ == '__main__':
+    print(f'{NUM_PAGES} pages over {NUM_DOMAINS} domains, {NUM_HOURS} hours held')
+
+    strings, string_bytes = measure(hold_strings)
+    del strings
+    (titles, hours), id_bytes = measure(hold_ids)
+
+    per_million = NUM_PAGES / 1_000_000
+    print(f'strings: {string_bytes / 1024 ** 2 / per_million:.0f} MiB per million pages')
+    print(f'ids:     {id_bytes / 1024 ** 2 / per_million:.0f} MiB per million pages')
+
+    start = time.perf_counter()
+    for domain in hours[0]:
+        merge_pages([hour[domain] for hour in hours])
+    print(f'merging every domain over {NUM_HOURS} hours: {time.perf_counter() - start:.2f}s')
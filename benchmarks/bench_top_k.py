@@ -0,0 +1,58 @@
+"""compare the cost of keeping the top 25 and the top 1000 pages per domain
+
+run from the package root: python benchmarks/bench_top_k.py
+"""
+import os
+import sys
+import time
+import random
+import tracemalloc
+
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from wiki_counts.analyze import add_to_heap_map  # noqa: E402
+
+NUM_LINES = 2_000_000
+NUM_DOMAINS = 800
+
+
+def make_lines(num_lines: int, num_domains: int):
+    """synthetic (domain, title, views) lines, domain sorted like the real dumps"""
+    random.seed(0)
+    lines = []
+    per_domain = num_lines // num_domains
+
+    for d in range(num_domains):
+        domain = f'domain{d:04d}'
+        for p in range(per_domain):
+            # pageviews are heavy tailed, most pages get one or two views
+            views = int(random.paretovariate(1.2))
+            lines.append((domain, f'Page_{p}', views))
+
+    return lines
+
+
+def run(lines, top_n: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    most_viewed_map = defaultdict(list)
+    for domain, title, views in lines:
+        add_to_heap_map(most_viewed_map, domain, title, views, top_n)
+
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+if __name__ == '__main__':
+    lines = make_lines(NUM_LINES, NUM_DOMAINS)
+    print(f'{len(lines)} lines over {NUM_DOMAINS} domains')
+
+    for top_n in (25, 1000):
+        elapsed, peak = run(lines, top_n)
+        print(f'top {top_n:>4}: {elapsed:.2f}s, peak heap memory {peak / 1024 ** 2:.1f} MiB')
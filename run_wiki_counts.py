@@ -1,91 +1,527 @@
+import logging
 import os
 import glob
+import time
+import asyncio
+import argparse
 import multiprocessing
+import pandas as pd
 
 from wiki_counts.config import DEFAULT_NUM_FILE_PROCESSORS, EARLIEST_DATE, \
-    DEFAULT_NUM_DOWNLOADERS, TMP_DIR
-from wiki_counts.parse_dates import parse_dates
+    DEFAULT_NUM_DOWNLOADERS, DEFAULT_COORDINATOR_PORT, DEFAULT_COORDINATOR_BIND, \
+    DEFAULT_QUERY_PORT, TMP_DIR, RESULTS_DIR, MIN_FILE_PROCESSORS, MAX_FILE_PROCESSORS, \
+    AUTOSCALE_INTERVAL, ARCHIVE_GLOB, DATASETS, DEFAULT_DATASET, \
+    SCHEDULE_ORDERS, DEFAULT_SCHEDULE_ORDER, SHM_SEGMENTS, SHM_SEGMENT_BYTES, \
+    ARCHIVE_CACHE_DIR, JOBS_CLAIM_HOURS, JOBS_POLL_INTERVAL
+from wiki_counts.parse_dates import parse_dates, order_urls, str_to_timestamp
 from wiki_counts.download import async_download
-from wiki_counts.analyze import analyze_from_queue
+from wiki_counts.daemon import follow_hours
+from wiki_counts.analyze import analyze_from_queue, has_results, analyze_file, analyze_domain, \
+    load_blacklist_set
+from wiki_counts.shards import convert_results_tree
+from wiki_counts.autoscale import target_num_processors
+from wiki_counts.distributed import run_coordinator, run_worker
+from wiki_counts.query import run_query_service
+from wiki_counts.archive_cache import cached_archives, retire_archive
+from wiki_counts.shm import create_segments, destroy_segments
+from wiki_counts.gzip_index import index_archive, read_index
+from wiki_counts.plan import read_history, fetch_sizes, make_plan, plan_lines
+from wiki_counts import journal, jobs
+from wiki_counts.utils import filename_from_path, dataset_from_path
+from wiki_counts.log import setup_logging
+from wiki_counts.launcher import get_context
 
-from multiprocessing import Process, Manager
-from multiprocessing.sharedctypes import Value
-from typing import Union
+from multiprocessing import Process
+from typing import Union, List, Tuple
+
+logger = logging.getLogger(__name__)
 
 
 def run_multiprocess(
         start_date: Union[str, None] = None,
-        end_date: Union[str, None] = None):
+        end_date: Union[str, None] = None,
+        dataset: str = DEFAULT_DATASET,
+        order: str = DEFAULT_SCHEDULE_ORDER):
     """main function, orchestrate file downloader process and file analysis process
 
     Keyword Arguments:
         start_date {str, None} -- start date as a string, if None it is set to utcnow minus 24 hours (default: {None})
         end_date {str, None} -- end date as a string, if None function returns only one URL for the start date (default: {None})
+        dataset {str} -- which of config.DATASETS to download (default: {config.DEFAULT_DATASET})
+        order {str} -- which of config.SCHEDULE_ORDERS to download and analyze hours in (default: {config.DEFAULT_SCHEDULE_ORDER})
+    """
+
+    # get urls to download, in the order they should be processed
+    # each hour's results are written as soon as it is analyzed, so with
+    # 'newest' the freshest hour is available first however long the range is
+    urls = order_urls(parse_dates(start_date, end_date, dataset=dataset), order)
+
+    run_pipeline(async_download, (urls, DEFAULT_NUM_DOWNLOADERS), order)
+
+
+def run_daemon(
+        start_date: Union[str, None] = None,
+        dataset: str = DEFAULT_DATASET):
+    """keep the downloader and file analysis processes running, and process every hour as soon as it is published
+
+    Keyword Arguments:
+        start_date {str, None} -- first hour to process, to catch up from, if None it is the hour that just ended (default: {None})
+        dataset {str} -- which of config.DATASETS to download (default: {config.DEFAULT_DATASET})
+    """
+    first_hour = str_to_timestamp(start_date) if start_date else \
+        pd.Timestamp.utcnow().floor('H')
+
+    logger.info(f'following hourly dumps from {first_hour}')
+    run_pipeline(follow_hours, (first_hour, dataset), DEFAULT_SCHEDULE_ORDER)
+
+
+def run_jobs(
+        claim_hours: int = JOBS_CLAIM_HOURS,
+        order: str = DEFAULT_SCHEDULE_ORDER):
+    """download and analyze hours from the job queue until every submitted job is finished
+
+    several runners can work on the queue at once, each hour is only claimed by one of them
+
+    Keyword Arguments:
+        claim_hours {int} -- number of hours to claim and run through the pipeline at a time (default: {config.JOBS_CLAIM_HOURS})
+        order {str} -- which of config.SCHEDULE_ORDERS to download and analyze each claim's hours in (default: {config.DEFAULT_SCHEDULE_ORDER})
     """
+    while True:
+        urls = jobs.claim(claim_hours)
+
+        if not urls:
+            if not jobs.unfinished_hours():
+                break
+
+            # the remaining hours are claimed by other runners, which may still die
+            time.sleep(JOBS_POLL_INTERVAL)
+            continue
+
+        logger.info(f'claimed {len(urls)} hours from the job queue')
+        completed = run_pipeline(
+            async_download, (order_urls(urls, order), DEFAULT_NUM_DOWNLOADERS),
+            order)
+
+        # hours that weren't analyzed because of an interruption are handed out again
+        jobs.finish(urls, interrupted=not completed)
+
+        if not completed:
+            break
+
+    logger.info('job queue is empty')
+
+
+def run_pipeline(download_target, download_args: Tuple, order: str) -> bool:
+    """orchestrate a file downloader process and the file analysis processes, until the downloader is done
+
+    Arguments:
+        download_target {function} -- downloader, called with download_args and then
+                                      (queue, free_segments, downloads_done, launched_at, process_killswitch)
+        download_args {Tuple} -- leading arguments of the downloader
+        order {str} -- which of config.SCHEDULE_ORDERS to queue archives left in tmp in
 
-    # get urls to download
-    urls = parse_dates(start_date, end_date)
+    Returns:
+        bool -- True if the downloader finished, False if the processes were killed or interrupted
+    """
+    # processes are started warm, with the package imported and the blacklist built
+    ctx = get_context()
 
-    with Manager() as manager:
+    with ctx.Manager() as manager:
 
         # this queue will pass names of downloaded files from the download process
         # to the file analysis process
         queue = manager.Queue()
 
         # fill the queue with gzip files that have already been downloaded from tmp
-        fill_queue_from_tmp(queue)
+        fill_queue_from_tmp(queue, order)
 
         # the downloader sets this value to True so that the file analyzer
         # knows that there will be no more filenames added to the Queue
-        downloads_done = Value('b', False)
+        downloads_done = ctx.Value('b', False)
 
         # flag that kills all processes should one fail
-        process_killswitch = Value('b', False)
+        process_killswitch = ctx.Value('b', False)
+
+        # a pool of shared memory segments that downloaded archives are handed
+        # to the file analysis processes in, instead of going through tmp
+        segments = []
+        free_segments = None
+        if SHM_SEGMENTS and not ARCHIVE_CACHE_DIR:
+            segments = create_segments(SHM_SEGMENTS, SHM_SEGMENT_BYTES)
+            free_segments = manager.Queue()
+            for segment in segments:
+                free_segments.put(segment.name)
 
         # set up the file download process
-        download_process = Process(
-            target=async_download,
+        download_process = ctx.Process(
+            target=download_target,
             args=(
-                urls, queue, downloads_done,
-                DEFAULT_NUM_DOWNLOADERS, process_killswitch))
-
-        # set up the file analysis process
-        fileread_processes = [
-            Process(
-                target=analyze_from_queue,
-                args=(queue, downloads_done, process_killswitch))
+                *download_args, queue, free_segments, downloads_done,
+                time.time(), process_killswitch))
+
+        # set up and start the file analysis processes
+        file_processors = [
+            start_file_processor(
+                queue, free_segments, downloads_done, process_killswitch)
             for _ in range(DEFAULT_NUM_FILE_PROCESSORS)]
 
-        # start the processes
+        # start the downloader
         download_process.start()
-        for fp in fileread_processes:
-            fp.start()
+
+        # grow and shrink the pool of file analysis processes until downloads are done
+        try:
+            supervise_file_processors(
+                file_processors, queue, free_segments, downloads_done,
+                process_killswitch)
+        # a daemon is stopped with ctrl-c or SIGINT
+        except KeyboardInterrupt:
+            logger.info('interrupted, stopping')
+            process_killswitch.value = True
 
         # wait for the processes to finish
         download_process.join()
-        for fp in fileread_processes:
+        for fp, _ in file_processors:
             fp.join()
 
+        # nothing is attached to the segments anymore
+        destroy_segments(segments)
+
+        return not process_killswitch.value
+
+
+def start_file_processor(
+        queue: multiprocessing.Queue,
+        free_segments: Union[multiprocessing.Queue, None],
+        downloads_done: multiprocessing.Value,
+        process_killswitch: multiprocessing.Value) -> Tuple[Process, multiprocessing.Value]:
+    """start a file analysis process
+
+    Arguments:
+        queue {multiprocessing.Queue} -- queue of paths of gzip archives to process
+        free_segments {multiprocessing.Queue, None} -- queue shared memory segments are given back to, None if shared memory is off
+        downloads_done {multiprocessing.Value[bool]} -- flag that indicates when downloads are done
+        process_killswitch {multiprocessing.Value[bool]} -- flag that kills all processes should one fail
+
+    Returns:
+        Tuple[Process, multiprocessing.Value[bool]] -- the process, and the flag that retires it
+    """
+    ctx = get_context()
+    retire = ctx.Value('b', False)
+    fp = ctx.Process(
+        target=analyze_from_queue,
+        args=(
+            queue, free_segments, downloads_done, retire, time.time(),
+            process_killswitch))
+    fp.start()
+
+    return fp, retire
+
+
+def supervise_file_processors(
+        file_processors: List[Tuple[Process, multiprocessing.Value]],
+        queue: multiprocessing.Queue,
+        free_segments: Union[multiprocessing.Queue, None],
+        downloads_done: multiprocessing.Value,
+        process_killswitch: multiprocessing.Value):
+    """start or retire file analysis processes based on queue depth and cpu load, until downloads are done
+
+    Arguments:
+        file_processors {List[Tuple[Process, multiprocessing.Value[bool]]]} -- running processes and their retire flags, new ones are appended
+        queue {multiprocessing.Queue} -- queue of paths of gzip archives to process
+        free_segments {multiprocessing.Queue, None} -- queue shared memory segments are given back to, None if shared memory is off
+        downloads_done {multiprocessing.Value[bool]} -- flag that indicates when downloads are done
+        process_killswitch {multiprocessing.Value[bool]} -- flag that kills all processes should one fail
+    """
+    cpu_count = os.cpu_count()
+
+    # once downloads are done the remaining processes drain the queue and exit
+    while not downloads_done.value and not process_killswitch.value:
+        time.sleep(AUTOSCALE_INTERVAL)
+
+        active = [(fp, retire) for fp, retire in file_processors
+                  if fp.is_alive() and not retire.value]
+
+        target = target_num_processors(
+            queue.qsize(), len(active), cpu_count, os.getloadavg()[0],
+            MIN_FILE_PROCESSORS, MAX_FILE_PROCESSORS)
+
+        if target > len(active):
+            logger.info(f'starting a file processor, {target} running')
+            file_processors.append(
+                start_file_processor(
+                    queue, free_segments, downloads_done, process_killswitch))
+        elif target < len(active):
+            logger.info(f'retiring a file processor, {target} running')
+            _, retire = active[-1]
+            retire.value = True
+
+
+def run_plan(
+        start_date: Union[str, None] = None,
+        end_date: Union[str, None] = None,
+        dataset: str = DEFAULT_DATASET,
+        head: bool = False):
+    """estimate the size, duration, and disk space of a run, and the processes to use, without downloading anything
 
-def fill_queue_from_tmp(queue: multiprocessing.Queue):
+    Keyword Arguments:
+        start_date {str, None} -- start date as a string, if None it is set to utcnow minus 24 hours (default: {None})
+        end_date {str, None} -- end date as a string, if None only the start date is planned (default: {None})
+        dataset {str} -- which of config.DATASETS to plan for (default: {config.DEFAULT_DATASET})
+        head {bool} -- get each hour's size from the mirror with a HEAD request, instead of only from the throughput history (default: {False})
+    """
+    # hours that already have results are left out, as they would be by the run
+    urls = parse_dates(start_date, end_date, dataset=dataset)
+    head_sizes = asyncio.run(fetch_sizes(urls)) if head and urls else None
+
+    plan = make_plan(
+        urls, read_history(), head_sizes, DEFAULT_NUM_DOWNLOADERS, os.cpu_count())
+
+    for line in plan_lines(plan):
+        logger.info(line)
+
+
+def run_reanalyze(
+        start_date: Union[str, None] = None,
+        end_date: Union[str, None] = None,
+        num_processes: int = os.cpu_count(),
+        dataset: str = DEFAULT_DATASET,
+        order: str = DEFAULT_SCHEDULE_ORDER,
+        domain: Union[str, None] = None):
+    """re-run the file analyzers over archives in the archive cache, without downloading anything
+
+    archives indexed with --index-cache are analyzed one at a time, with their members scanned
+    in parallel, the rest are analyzed a whole archive per process
+
+    Keyword Arguments:
+        start_date {str, None} -- start date as a string, if None every cached archive is analyzed (default: {None})
+        end_date {str, None} -- end date as a string, if None only the start date is analyzed (default: {None})
+        num_processes {int} -- number of file analysis processes (default: {os.cpu_count()})
+        dataset {str} -- which of config.DATASETS the date range refers to (default: {config.DEFAULT_DATASET})
+        order {str} -- which of config.SCHEDULE_ORDERS to analyze hours in (default: {config.DEFAULT_SCHEDULE_ORDER})
+        domain {str, None} -- only find the top pages of this domain, and write them to config.DOMAIN_RESULTS_DIR
+                              instead of the results directory (default: {None})
+    """
+    archives = order_urls(cached_archives(), order)
+
+    # only keep archives within the range, if one was given
+    if start_date:
+        in_range = set(
+            filename_from_path(url)
+            for url in parse_dates(
+                start_date, end_date, exclude_processed=False, dataset=dataset))
+        archives = [a for a in archives if filename_from_path(a) in in_range]
+
+    logger.info(f'number of cached files to analyze: {len(archives)}')
+
+    ctx = get_context()
+
+    if domain is not None:
+        # projectviews files only hold each domain's total
+        with ctx.Pool(num_processes) as pool:
+            for abspath in archives:
+                if dataset_from_path(abspath) != 'pageviews':
+                    continue
+                result_path = analyze_domain(abspath, domain, pool)
+                logger.info(f'wrote {result_path}')
+        return
+
+    indexed = set(a for a in archives if read_index(a) is not None)
+    if indexed:
+        blacklist_set = load_blacklist_set()
+        with ctx.Pool(num_processes) as pool:
+            for abspath in archives:
+                if abspath in indexed:
+                    analyze_file(abspath, blacklist_set, pool=pool)
+
+        archives = [a for a in archives if a not in indexed]
+        if not archives:
+            return
+
+    with ctx.Manager() as manager:
+        queue = manager.Queue()
+        for abspath in archives:
+            queue.put(abspath)
+
+        # there is no downloader, so the analyzers can stop once the queue is empty
+        downloads_done = ctx.Value('b', True)
+        process_killswitch = ctx.Value('b', False)
+
+        file_processors = [
+            start_file_processor(queue, None, downloads_done, process_killswitch)
+            for _ in range(min(num_processes, len(archives)))]
+
+        for fp, _ in file_processors:
+            fp.join()
+
+
+def run_index_cache(num_processes: int = os.cpu_count()):
+    """index every gzip archive in the archive cache that isn't indexed yet, so it can be scanned in parallel or by domain
+
+    Keyword Arguments:
+        num_processes {int} -- number of archives to index at once (default: {os.cpu_count()})
+    """
+    archives = [a for a in cached_archives()
+                if a.endswith('.gz') and read_index(a) is None]
+
+    logger.info(f'number of cached files to index: {len(archives)}')
+
+    with get_context().Pool(num_processes) as pool:
+        for archive, num_members in zip(archives, pool.imap(index_archive, archives)):
+            logger.info(f'indexed {filename_from_path(archive)} into {num_members} members')
+
+
+def fill_queue_from_tmp(
+        queue: multiprocessing.Queue,
+        order: str = DEFAULT_SCHEDULE_ORDER):
     """fill queue with gzip files that have already been download to tmp
 
+    only hours that are unfinished are queued. an archive whose results were
+    written before a crash is cleaned up instead, and an archive that a live
+    analyzer from another run is working on is left alone
+
     Arguments:
         queue {multiprocessing.Queue} -- queue of paths of gzip archives to process
+
+    Keyword Arguments:
+        order {str} -- which of config.SCHEDULE_ORDERS to queue the archives in (default: {config.DEFAULT_SCHEDULE_ORDER})
     """
-    path = os.path.join(TMP_DIR, '*.gz')
-    [queue.put(abspath) for abspath in glob.glob(path)]
+    path = os.path.join(TMP_DIR, ARCHIVE_GLOB)
+    for abspath in order_urls(glob.glob(path), order):
+        result_filename = filename_from_path(abspath, remove_gz=True)
+
+        if journal.in_flight(result_filename):
+            continue
+
+        # results are written atomically, so if they exist the hour is done
+        if has_results(result_filename):
+            if journal.release_stale(result_filename):
+                retire_archive(abspath)
+            continue
+
+        queue.put(abspath)
+
+    # hours that died in the analyzer without an archive left in tmp
+    # (e.g. read from the archive cache) are not downloaded, so there is
+    # nothing to queue, parse_dates will pick them up again
+    for result_filename in journal.unfinished():
+        archive_paths = [os.path.join(TMP_DIR, result_filename),
+                         os.path.join(TMP_DIR, result_filename + '.gz')]
+        if not any(os.path.exists(p) for p in archive_paths):
+            journal.release_stale(result_filename)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """parse the command line arguments
+
+    Keyword Arguments:
+        argv {List[str], None} -- arguments to parse, if None sys.argv is used (default: {None})
+
+    Returns:
+        argparse.Namespace -- parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description='record the top most viewed wikipedia pages for each domain')
+
+    parser.add_argument(
+        'start_date', nargs='?', default=None,
+        help='start date, if omitted runs for 24 hours ago')
+    parser.add_argument(
+        'end_date', nargs='?', default=None,
+        help='end date, if omitted runs only for the start date')
+
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        '--coordinator', metavar='PORT', type=int, nargs='?',
+        const=DEFAULT_COORDINATOR_PORT,
+        help='hand out the hours in the range to workers on other hosts')
+    mode.add_argument(
+        '--worker', metavar='HOST:PORT',
+        help='process hours leased from a coordinator')
+    mode.add_argument(
+        '--daemon', action='store_true',
+        help='keep running, and process each hour as soon as it is published, from the start date if given')
+    mode.add_argument(
+        '--submit', action='store_true',
+        help='add the hours in the range to the job queue, hours already queued by other jobs are shared')
+    mode.add_argument(
+        '--run-jobs', action='store_true',
+        help='download and analyze hours from the job queue until every job is finished')
+    mode.add_argument(
+        '--plan', action='store_true',
+        help='estimate how long the range will take and the disk space it needs, without downloading anything')
+    mode.add_argument(
+        '--serve', metavar='PORT', type=int, nargs='?',
+        const=DEFAULT_QUERY_PORT,
+        help='serve top n queries over the results directory')
+    mode.add_argument(
+        '--reanalyze', action='store_true',
+        help='analyze archives in the archive cache again, optionally only those in the date range')
+    mode.add_argument(
+        '--index-cache', action='store_true',
+        help='rewrite the archive cache\'s archives so they can be scanned in parallel or from a given domain on')
+    mode.add_argument(
+        '--convert-results', action='store_true',
+        help='move the results directory\'s files into compressed containers in the shards directory')
+
+    parser.add_argument(
+        '--dataset', choices=list(DATASETS), default=DEFAULT_DATASET,
+        help='download the top pages of each domain (pageviews), or only each domain\'s total views (projectviews)')
+    parser.add_argument(
+        '--order', choices=SCHEDULE_ORDERS, default=DEFAULT_SCHEDULE_ORDER,
+        help='process the oldest hours in the range first, the newest first, or alternate between them')
+    parser.add_argument(
+        '--wait', action='store_true',
+        help='with --submit, wait until every hour of the job has been processed by --run-jobs')
+    parser.add_argument(
+        '--head', action='store_true',
+        help='with --plan, get the size of every hour from the mirror with HEAD requests, instead of from earlier runs')
+    parser.add_argument(
+        '--processes', type=int, default=os.cpu_count(),
+        help='number of file analysis processes used by --reanalyze and --index-cache')
+    parser.add_argument(
+        '--bind', default=DEFAULT_COORDINATOR_BIND,
+        help='with --coordinator, address to listen on for workers, "" for every interface')
+    parser.add_argument(
+        '--domain',
+        help='with --reanalyze, only find the top pages of this domain, e.g. "en", reading only its part of indexed archives')
+
+    return parser.parse_args(argv)
 
 
 if __name__ == '__main__':
-    import sys
-
-    # if no args, just run for last updated file
-    if len(sys.argv) <= 1:
-        run_multiprocess()
-    # download one hour's worth of dumps
-    elif len(sys.argv) == 2:
-        run_multiprocess(sys.argv[1])
-    # download for a range
+    args = parse_args()
+    setup_logging()
+
+    if args.coordinator:
+        run_coordinator(
+            order_urls(
+                parse_dates(args.start_date, args.end_date, dataset=args.dataset),
+                args.order),
+            args.coordinator, args.bind)
+    elif args.worker:
+        host, port = args.worker.rsplit(':', 1)
+        run_worker(host, int(port))
+    elif args.daemon:
+        run_daemon(args.start_date, args.dataset)
+    elif args.submit:
+        job_id = jobs.submit(args.start_date, args.end_date, args.dataset)
+        if args.wait:
+            jobs.wait(job_id)
+    elif args.run_jobs:
+        run_jobs(order=args.order)
+    elif args.plan:
+        run_plan(args.start_date, args.end_date, args.dataset, args.head)
+    elif args.serve:
+        run_query_service(args.serve)
+    elif args.reanalyze:
+        run_reanalyze(
+            args.start_date, args.end_date, args.processes, args.dataset,
+            args.order, args.domain)
+    elif args.index_cache:
+        run_index_cache(args.processes)
+    elif args.convert_results:
+        convert_results_tree(RESULTS_DIR)
+    # if no dates, this just runs for the last updated file
     else:
-        run_multiprocess(sys.argv[1], sys.argv[2])
+        run_multiprocess(
+            args.start_date, args.end_date, args.dataset, args.order)
@@ -2,11 +2,22 @@ from wiki_counts.analyze import (
     in_blacklist_set,
     add_to_blacklist,
     add_to_heap_map,
-    get_line_info
+    get_line_info,
+    results_to_lines,
+    build_most_viewed_map,
+    build_domain_totals,
+    totals_to_lines,
+    persist_top_k,
+    persist_trending,
+    analyze_file
 )
+from wiki_counts import analyze, journal
 
+import os
 import pytest
 import heapq
+import gzip
+import logging
 
 from collections import defaultdict
 
@@ -192,3 +203,118 @@ def test_get_line_info_raises_on_failed_int_cast():
     line = 'good good i_should_be_int unimportant'
     with pytest.raises(ValueError):
         get_line_info(line)
+
+
+def test_results_to_lines_increasing_order(heap_map_size_3):
+    assert results_to_lines(heap_map_size_3) == [
+        'domain_code page1 3\n',
+        'domain_code page2 4\n',
+        'domain_code page3 5\n']
+
+
+def test_results_to_lines_only_top_n(heap_map_size_3):
+    lines = results_to_lines(heap_map_size_3, top_n_pageviews=2)
+    assert lines == ['domain_code page2 4\n', 'domain_code page3 5\n']
+
+
+def test_results_to_lines_leaves_heap_intact(heap_map_size_3):
+    results_to_lines(heap_map_size_3)
+    assert len(heap_map_size_3['domain_code']) == 3
+
+
+def test_build_most_viewed_map_summarizes_malformed_lines(tmp_path, caplog):
+    path = str(tmp_path / 'pageviews-20200501-010000.gz')
+    with gzip.open(path, 'wt') as f:
+        f.write('en good 5 0\n')
+        for i in range(10):
+            f.write(f'bad line {i}\n')
+
+    with caplog.at_level(logging.WARNING):
+        most_viewed_map = build_most_viewed_map(path, set())
+
+    assert most_viewed_map['en'] == [(5, 'good')]
+    assert len(caplog.records) == 1
+    assert caplog.records[0].num_malformed == 10
+    assert len(caplog.records[0].malformed_sample) == 5
+
+
+def test_build_domain_totals_reads_plain_projectviews(tmp_path):
+    path = tmp_path / 'projectviews-20200501-000000'
+    path.write_text('de - 4 0\nen - 10 0\nen.m - 3 0\nbad line\n')
+
+    totals = build_domain_totals(str(path))
+
+    assert totals == {'de': 4, 'en': 10, 'en.m': 3}
+    assert totals_to_lines(totals) == ['de 4\n', 'en 10\n', 'en.m 3\n']
+
+
+@pytest.fixture
+def trending_dirs(tmp_path, monkeypatch):
+    top_k_dir = tmp_path / 'top_k'
+    trending_dir = tmp_path / 'trending'
+    top_k_dir.mkdir()
+    trending_dir.mkdir()
+
+    monkeypatch.setattr(analyze, 'TOP_K_DIR', str(top_k_dir))
+    monkeypatch.setattr(analyze, 'TRENDING_DIR', str(trending_dir))
+    monkeypatch.setattr(analyze, 'blacklist_digest', lambda: b'd' * 20)
+
+    return top_k_dir, trending_dir
+
+
+def analyze_hour(hour, most_viewed_map):
+    abspath = f'/tmp/pageviews-20200501-0{hour}0000.gz'
+    persist_top_k(abspath, most_viewed_map, 2)
+    persist_trending(abspath, most_viewed_map, 2)
+
+
+@pytest.mark.parametrize('hours', [(1, 2), (2, 1)])
+def test_persist_trending_hours_finish_in_any_order(trending_dirs, hours):
+    _, trending_dir = trending_dirs
+    maps = {1: {'en': [(10, 'A'), (20, 'B')]},
+            2: {'en': [(30, 'A'), (20, 'B')]}}
+
+    for hour in hours:
+        analyze_hour(hour, maps[hour])
+
+    assert sorted(p.name for p in trending_dir.iterdir()) == ['pageviews-20200501-020000']
+    assert (trending_dir / 'pageviews-20200501-020000').read_text() == \
+        'en A 30 1 1 20\nen B 20 2 -1 0\n'
+
+
+@pytest.fixture
+def analyze_dirs(tmp_path, monkeypatch):
+    journal_dir = tmp_path / 'journal'
+    results_dir = tmp_path / 'results'
+    journal_dir.mkdir()
+    results_dir.mkdir()
+
+    monkeypatch.setattr(analyze, 'RESULTS_DIR', str(results_dir))
+    monkeypatch.setattr(analyze, 'has_hour', lambda filename: False)
+    monkeypatch.setattr(journal.claim, '__defaults__', (str(journal_dir),))
+    monkeypatch.setattr(journal.release, '__defaults__', (str(journal_dir),))
+
+    return journal_dir, results_dir
+
+
+def test_analyze_file_skips_archive_another_run_removed(tmp_path, analyze_dirs):
+    journal_dir, _ = analyze_dirs
+
+    # queued by two runs, and already analyzed and removed by the other one
+    archive = str(tmp_path / 'pageviews-20200501-010000.gz')
+
+    assert analyze_file(archive, set()) is None
+    assert os.listdir(journal_dir) == []
+
+
+def test_analyze_file_skips_hour_another_run_finished(tmp_path, analyze_dirs):
+    journal_dir, results_dir = analyze_dirs
+
+    archive = tmp_path / 'pageviews-20200501-010000.gz'
+    with gzip.open(archive, 'wt') as f:
+        f.write('en A 5 0\n')
+    (results_dir / 'pageviews-20200501-010000').write_text('en A 5\n')
+
+    assert analyze_file(str(archive), set()) is None
+    assert os.listdir(journal_dir) == []
+    assert (results_dir / 'pageviews-20200501-010000').read_text() == 'en A 5\n'
@@ -0,0 +1,71 @@
+from wiki_counts.archive_cache import (
+    cached_archive, retire_archive, evict, cached_archives)
+
+import os
+import pytest
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    path = tmp_path / 'cache'
+    path.mkdir()
+    return str(path)
+
+
+@pytest.fixture
+def tmp_dir(tmp_path):
+    path = tmp_path / 'tmp'
+    path.mkdir()
+    return str(path)
+
+
+def make_archive(directory, name, size, mtime=None):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_cached_archive_off_returns_none():
+    assert cached_archive('pageviews-20200501-010000.gz', None) is None
+
+
+def test_cached_archive_miss(cache_dir):
+    assert cached_archive('pageviews-20200501-010000.gz', cache_dir) is None
+
+
+def test_cached_archive_hit_marks_recently_used(cache_dir):
+    path = make_archive(cache_dir, 'a.gz', 1, mtime=0)
+    assert cached_archive('a.gz', cache_dir) == path
+    assert os.stat(path).st_mtime > 0
+
+
+def test_retire_archive_without_cache_deletes(tmp_dir):
+    path = make_archive(tmp_dir, 'a.gz', 1)
+    retire_archive(path, None, 0)
+    assert not os.path.exists(path)
+
+
+def test_retire_archive_moves_into_cache(tmp_dir, cache_dir):
+    path = make_archive(tmp_dir, 'a.gz', 1)
+    retire_archive(path, cache_dir, 10)
+    assert not os.path.exists(path)
+    assert cached_archives(cache_dir) == [os.path.join(cache_dir, 'a.gz')]
+
+
+def test_retire_archive_already_in_cache_is_kept(cache_dir):
+    path = make_archive(cache_dir, 'a.gz', 1)
+    retire_archive(path, cache_dir, 10)
+    assert os.path.exists(path)
+
+
+def test_evict_removes_least_recently_used(cache_dir):
+    make_archive(cache_dir, 'old.gz', 4, mtime=100)
+    make_archive(cache_dir, 'mid.gz', 4, mtime=200)
+    make_archive(cache_dir, 'new.gz', 4, mtime=300)
+
+    evict(cache_dir, 8)
+
+    assert [os.path.basename(p) for p in cached_archives(cache_dir)] == ['mid.gz', 'new.gz']
@@ -0,0 +1,29 @@
+from wiki_counts.autoscale import target_num_processors
+
+
+def test_grows_when_files_are_waiting():
+    assert target_num_processors(5, 1, 8, 1.0, 1, None) == 2
+
+
+def test_does_not_grow_when_cpus_are_busy():
+    assert target_num_processors(5, 1, 8, 8.5, 1, None) == 1
+
+
+def test_shrinks_when_queue_is_empty():
+    assert target_num_processors(0, 3, 8, 1.0, 1, None) == 2
+
+
+def test_holds_steady_when_keeping_up():
+    assert target_num_processors(2, 3, 8, 1.0, 1, None) == 3
+
+
+def test_never_below_min():
+    assert target_num_processors(0, 1, 8, 1.0, 1, None) == 1
+
+
+def test_leaves_a_cpu_for_the_downloader():
+    assert target_num_processors(50, 3, 4, 0.0, 1, None) == 3
+
+
+def test_never_above_max():
+    assert target_num_processors(50, 2, 16, 0.0, 1, 2) == 2
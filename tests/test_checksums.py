@@ -0,0 +1,90 @@
+from wiki_counts import checksums
+from wiki_counts.checksums import ChecksumMismatchError, md5sums_url, parse_md5sums, \
+    expected_md5, verify_md5
+
+from aiohttp import web, ClientSession
+from aiohttp.test_utils import TestServer
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(checksums, '_md5sums', {})
+
+
+def make_app(lines):
+    """app that serves md5sums.txt from a list that can be added to, and counts its requests"""
+    requests = []
+
+    async def handle(request):
+        requests.append(request.path)
+        return web.Response(text='\n'.join(lines))
+
+    app = web.Application()
+    app.router.add_get('/2020/2020-05/md5sums.txt', handle)
+    return app, requests
+
+
+def test_md5sums_url():
+    url = 'https://dumps.wikimedia.org/other/pageviews/2020/2020-05/pageviews-20200501-010000.gz'
+
+    assert md5sums_url(url) == 'https://dumps.wikimedia.org/other/pageviews/2020/2020-05/md5sums.txt'
+
+
+def test_parse_md5sums():
+    text = ('D41D8CD98F00B204E9800998ECF8427E  pageviews-20200501-000000.gz\n'
+            '0cc175b9c0f1b6a831c399e269772661  projectviews-20200501-000000\n'
+            '\n')
+
+    assert parse_md5sums(text) == {
+        'pageviews-20200501-000000.gz': 'd41d8cd98f00b204e9800998ecf8427e',
+        'projectviews-20200501-000000': '0cc175b9c0f1b6a831c399e269772661',
+    }
+
+
+@pytest.mark.asyncio
+async def test_expected_md5_fetches_each_month_once():
+    app, requests = make_app(['aaa  pageviews-20200501-010000.gz',
+                              'bbb  pageviews-20200501-020000.gz'])
+
+    async with TestServer(app) as server, ClientSession() as session:
+        first = await expected_md5(session, str(server.make_url('/2020/2020-05/pageviews-20200501-010000.gz')))
+        second = await expected_md5(session, str(server.make_url('/2020/2020-05/pageviews-20200501-020000.gz')))
+
+    assert (first, second) == ('aaa', 'bbb')
+    assert len(requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_expected_md5_fetches_again_for_newly_published_hour():
+    lines = ['aaa  pageviews-20200501-010000.gz']
+    app, requests = make_app(lines)
+
+    async with TestServer(app) as server, ClientSession() as session:
+        url = str(server.make_url('/2020/2020-05/pageviews-20200501-020000.gz'))
+
+        assert await expected_md5(session, url, refresh_interval=0) is None
+
+        lines.append('bbb  pageviews-20200501-020000.gz')
+        assert await expected_md5(session, url, refresh_interval=0) == 'bbb'
+
+    assert len(requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_expected_md5_without_md5sums():
+    app = web.Application()
+
+    async with TestServer(app) as server, ClientSession() as session:
+        url = str(server.make_url('/2020/2020-05/pageviews-20200501-010000.gz'))
+
+        assert await expected_md5(session, url) is None
+
+
+def test_verify_md5():
+    verify_md5('pageviews-20200501-010000.gz', 'aaa', 'aaa')
+    verify_md5('pageviews-20200501-010000.gz', 'aaa', None)
+
+    with pytest.raises(ChecksumMismatchError):
+        verify_md5('pageviews-20200501-010000.gz', 'aaa', 'bbb')
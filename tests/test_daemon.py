@@ -0,0 +1,105 @@
+from wiki_counts.daemon import wait_until_published, sleep_unless_killed, run_follow_hours
+from wiki_counts.config import DOWNLOAD_MAX_ATTEMPTS
+from wiki_counts import daemon
+
+from aiohttp import web, ClientSession
+from aiohttp.test_utils import TestServer
+from multiprocessing import Value
+
+import time
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def killswitch():
+    return Value('b', False)
+
+
+def make_app(published_after):
+    """app whose dump 404s for the first published_after HEAD requests"""
+    requests = []
+
+    async def handle(request):
+        requests.append(request.method)
+        if len(requests) <= published_after:
+            raise web.HTTPNotFound()
+        return web.Response(body=b'')
+
+    app = web.Application()
+    app.router.add_route('HEAD', '/pageviews-20200501-010000.gz', handle)
+    return app, requests
+
+
+@pytest.mark.asyncio
+async def test_wait_until_published_polls_until_found(killswitch):
+    app, requests = make_app(published_after=2)
+
+    async with TestServer(app) as server, ClientSession() as session:
+        url = str(server.make_url('/pageviews-20200501-010000.gz'))
+        published = await wait_until_published(session, url, killswitch, 0.01, 0.02)
+
+    assert published
+    assert requests == ['HEAD'] * 3
+
+
+@pytest.mark.asyncio
+async def test_wait_until_published_gives_up(killswitch):
+    app, requests = make_app(published_after=100)
+
+    async with TestServer(app) as server, ClientSession() as session:
+        url = str(server.make_url('/pageviews-20200501-010000.gz'))
+        published = await wait_until_published(
+            session, url, killswitch, 0.01, 0.02, pd.Timestamp.utcnow())
+
+    # an hour that is already overdue is still checked once
+    assert not published
+    assert requests == ['HEAD']
+
+
+@pytest.mark.asyncio
+async def test_sleep_unless_killed_wakes_up_early(killswitch):
+    killswitch.value = True
+
+    started = time.monotonic()
+    await sleep_unless_killed(10, killswitch)
+
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.asyncio
+async def test_daemon_moves_on_from_hour_that_keeps_failing(killswitch, monkeypatch):
+    requests = []
+
+    async def handle(request):
+        filename = request.match_info['name']
+        requests.append((request.method, filename))
+
+        # the next hour is reached, so the daemon didn't get stuck
+        if filename.endswith('020000.gz'):
+            killswitch.value = True
+        if request.method == 'HEAD':
+            return web.Response()
+        return web.Response(status=403)
+
+    async def handle_md5sums(request):
+        return web.Response(text='')
+
+    app = web.Application()
+    app.router.add_get('/md5sums.txt', handle_md5sums)
+    app.router.add_route('*', '/{name}', handle)
+
+    async with TestServer(app) as server:
+        monkeypatch.setattr(
+            daemon, 'date_to_url',
+            lambda hour, exclusion_set, dataset: str(server.make_url(
+                hour.strftime('/pageviews-%Y%m%d-%H0000.gz'))))
+        monkeypatch.setattr(daemon, 'has_results', lambda filename: False)
+
+        await run_follow_hours(
+            pd.Timestamp('2020-05-01 01:00', tz='UTC'), 'pageviews', None, None, killswitch,
+            poll_min=0.01)
+
+    gets = [r for r in requests if r == ('GET', 'pageviews-20200501-010000.gz')]
+    assert len(gets) == DOWNLOAD_MAX_ATTEMPTS
+    assert ('HEAD', 'pageviews-20200501-020000.gz') in requests
@@ -0,0 +1,187 @@
+from wiki_counts.distributed import LeaseTable, run_worker_loop, get_authkey
+from wiki_counts.checksums import ChecksumMismatchError
+from wiki_counts.config import DOWNLOAD_MAX_ATTEMPTS
+from wiki_counts.utils import filename_from_path
+
+from wiki_counts import distributed as distributed_module
+
+import gzip
+import time
+import asyncio
+import pytest
+
+
+URL_1 = 'https://dumps.wikimedia.org/other/pageviews/2020/2020-05/pageviews-20200501-010000.gz'
+URL_2 = 'https://dumps.wikimedia.org/other/pageviews/2020/2020-05/pageviews-20200501-020000.gz'
+
+
+@pytest.fixture
+def written(monkeypatch):
+    written = {}
+
+    def mock_write_results(filename, lines):
+        written[filename] = lines
+
+    monkeypatch.setattr(distributed_module, 'write_results', mock_write_results)
+    return written
+
+
+@pytest.fixture
+def lease_table():
+    return LeaseTable([URL_1, URL_2], lease_timeout=60)
+
+
+def test_lease_hands_out_urls_in_order(lease_table):
+    assert lease_table.lease('a') == URL_1
+    assert lease_table.lease('b') == URL_2
+
+
+def test_lease_returns_none_when_everything_leased(lease_table):
+    lease_table.lease('a')
+    lease_table.lease('a')
+    assert lease_table.lease('b') is None
+    assert not lease_table.is_done()
+
+
+def test_expired_lease_is_handed_out_again(monkeypatch, lease_table):
+    lease_table.lease('a')
+    lease_table.lease('a')
+
+    later = time.time() + 61
+    monkeypatch.setattr(time, 'time', lambda: later)
+
+    assert lease_table.lease('b') == URL_1
+
+
+def test_renew_fails_after_reassignment(monkeypatch, lease_table):
+    lease_table.lease('a')
+
+    later = time.time() + 61
+    monkeypatch.setattr(time, 'time', lambda: later)
+    lease_table.lease('b')
+
+    assert not lease_table.renew(URL_1, 'a')
+    assert lease_table.renew(URL_1, 'b')
+
+
+def test_complete_writes_results(written, lease_table):
+    lease_table.lease('a')
+    assert lease_table.complete(URL_1, 'a', ['en page 5\n'])
+    assert written == {'pageviews-20200501-010000': ['en page 5\n']}
+
+
+def test_complete_twice_only_writes_once(written, lease_table):
+    lease_table.lease('a')
+    lease_table.complete(URL_1, 'a', ['first\n'])
+    assert not lease_table.complete(URL_1, 'b', ['second\n'])
+    assert written['pageviews-20200501-010000'] == ['first\n']
+
+
+def test_release_puts_url_back(lease_table):
+    lease_table.lease('a')
+    lease_table.release(URL_1, 'a')
+    assert lease_table.lease('b') == URL_2
+    assert lease_table.lease('b') == URL_1
+
+
+def test_is_done_after_complete_and_skip(written, lease_table):
+    lease_table.lease('a')
+    lease_table.lease('a')
+    lease_table.complete(URL_1, 'a', [])
+    lease_table.skip(URL_2, 'a')
+    assert lease_table.is_done()
+
+
+@pytest.mark.asyncio
+async def test_worker_skips_hour_after_repeated_md5_mismatches(monkeypatch, written):
+    lease_table = LeaseTable([URL_1], lease_timeout=60)
+    downloads = []
+
+    async def mock_download_to_tmp(session, url):
+        downloads.append(url)
+        raise ChecksumMismatchError(filename_from_path(url), 'a' * 32, 'b' * 32)
+
+    monkeypatch.setattr(distributed_module, 'download_to_tmp', mock_download_to_tmp)
+
+    await run_worker_loop(lease_table, 'a', set())
+
+    # the worker carries on instead of dying, and the hour isn't handed out forever
+    assert downloads == [URL_1] * DOWNLOAD_MAX_ATTEMPTS
+    assert lease_table.is_done()
+    assert written == {}
+
+
+def test_skip_by_worker_that_lost_the_lease_is_ignored(monkeypatch, lease_table):
+    lease_table.lease('a')
+
+    later = time.time() + 61
+    monkeypatch.setattr(time, 'time', lambda: later)
+    lease_table.lease('b')
+
+    assert not lease_table.skip(URL_1, 'a')
+    assert lease_table.renew(URL_1, 'b')
+    assert lease_table.skip(URL_1, 'b')
+
+
+@pytest.mark.asyncio
+async def test_worker_renews_lease_during_slow_download(monkeypatch, written, tmp_path):
+    monkeypatch.setattr(distributed_module, 'LEASE_RENEW_INTERVAL', 0.05)
+    lease_table = LeaseTable([URL_1], lease_timeout=0.2)
+    archive = tmp_path / 'pageviews-20200501-010000.gz'
+    archive.write_bytes(gzip.compress(b'en a 5 0\n'))
+
+    async def slow_download_to_tmp(session, url):
+        # takes longer than the lease timeout
+        await asyncio.sleep(0.5)
+        assert lease_table.lease('b') is None
+        return str(archive)
+
+    monkeypatch.setattr(distributed_module, 'download_to_tmp', slow_download_to_tmp)
+    monkeypatch.setattr(distributed_module, 'retire_archive', lambda path: None)
+
+    await run_worker_loop(lease_table, 'a', set())
+
+    assert written == {'pageviews-20200501-010000': ['en a 5\n']}
+
+
+@pytest.mark.asyncio
+async def test_worker_stops_when_coordinator_goes_away():
+    class GoneLeaseTable:
+        def is_done(self):
+            raise EOFError
+
+    # returns instead of raising
+    await run_worker_loop(GoneLeaseTable(), 'a', set())
+
+
+@pytest.mark.asyncio
+async def test_worker_retries_then_skips_truncated_archive(monkeypatch, written, tmp_path):
+    lease_table = LeaseTable([URL_1, URL_2], lease_timeout=60)
+    contents = gzip.compress(b'en a 5 0\n' * 100)
+
+    async def truncated_download_to_tmp(session, url):
+        archive = tmp_path / filename_from_path(url)
+        archive.write_bytes(contents[:len(contents) // 2] if url == URL_1 else contents)
+        return str(archive)
+
+    monkeypatch.setattr(distributed_module, 'download_to_tmp', truncated_download_to_tmp)
+    monkeypatch.setattr(distributed_module, 'retire_archive', lambda path: None)
+
+    await run_worker_loop(lease_table, 'a', set())
+
+    # the worker keeps going with the other hours, and doesn't hold on to the broken one
+    assert lease_table.is_done()
+    assert list(written) == ['pageviews-20200501-020000']
+
+
+def test_get_authkey_requires_a_secret(monkeypatch):
+    monkeypatch.delenv('WIKI_COUNTS_AUTHKEY', raising=False)
+    with pytest.raises(ValueError):
+        get_authkey()
+
+    monkeypatch.setenv('WIKI_COUNTS_AUTHKEY', '')
+    with pytest.raises(ValueError):
+        get_authkey()
+
+    monkeypatch.setenv('WIKI_COUNTS_AUTHKEY', 'secret')
+    assert get_authkey() == b'secret'
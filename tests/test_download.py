@@ -1,9 +1,17 @@
 # contents of test_app.py, a simple test for our API retrieval
 # import requests for the purposes of monkeypatching
-from wiki_counts.download import handle_error, kill_process
+from wiki_counts import checksums, download
+from wiki_counts.checksums import ChecksumMismatchError
+from wiki_counts.download import handle_error, handle_failed_download, kill_process, \
+    fetch_archive
+
+from aiohttp import web, ClientSession
+from aiohttp.test_utils import TestServer
+from collections import Counter
 
 import pytest
 import asyncio
+import hashlib
 
 
 class MockRequestInfo:
@@ -52,3 +60,40 @@ async def test_kill_process_empties_queue(queue):
     await kill_process(queue)
     
     assert queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_handle_failed_download_retries_until_max_attempts(queue):
+    e = ChecksumMismatchError('hi', 'aaa', 'bbb')
+    failed_attempts = Counter()
+
+    await handle_failed_download(e, queue, 'hi', failed_attempts, max_attempts=2)
+    assert await queue.get() == 'hi'
+
+    await handle_failed_download(e, queue, 'hi', failed_attempts, max_attempts=2)
+    assert queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_fetch_archive_verifies_md5(monkeypatch):
+    monkeypatch.setattr(checksums, '_md5sums', {})
+    monkeypatch.setattr(download, 'record_throughput', lambda *args: None)
+    contents = b'x' * 10000
+    md5sums = [hashlib.md5(contents).hexdigest() + '  good.gz', 'aaa  bad.gz']
+
+    # aiohttp only takes coroutines as request handlers
+    async def handle_md5sums(request):
+        return web.Response(text='\n'.join(md5sums))
+
+    async def handle_archive(request):
+        return web.Response(body=contents)
+
+    app = web.Application()
+    app.router.add_get('/2020/2020-05/md5sums.txt', handle_md5sums)
+    app.router.add_get('/2020/2020-05/{name}', handle_archive)
+
+    async with TestServer(app) as server, ClientSession() as session:
+        assert await fetch_archive(session, str(server.make_url('/2020/2020-05/good.gz'))) == contents
+
+        with pytest.raises(ChecksumMismatchError):
+            await fetch_archive(session, str(server.make_url('/2020/2020-05/bad.gz')))
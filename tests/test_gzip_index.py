@@ -0,0 +1,102 @@
+from wiki_counts.gzip_index import (
+    index_archive, read_index, members_for_domain, read_member, index_path)
+from wiki_counts.analyze import (
+    build_most_viewed_map, build_most_viewed_map_parallel, analyze_domain)
+from wiki_counts.launcher import get_context
+from wiki_counts import analyze
+
+import os
+import gzip
+import pytest
+
+
+LINES = [
+    'de a 1 0\n', 'de b 2 0\n',
+    'en a 5 0\n', 'en b 7 0\n', 'en c 3 0\n', 'en d 9 0\n',
+    'fr a 4 0\n', 'fr b 6 0\n',
+]
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = str(tmp_path / 'pageviews-20200501-000000.gz')
+    with gzip.open(path, 'wt') as f:
+        f.writelines(LINES)
+    return path
+
+
+@pytest.fixture
+def indexed(archive):
+    # two lines per member
+    index_archive(archive, member_bytes=len(LINES[0]) * 2)
+    return archive
+
+
+def test_index_archive_keeps_archive_readable(indexed):
+    with gzip.open(indexed, 'rt') as f:
+        assert f.readlines() == LINES
+
+
+def test_index_archive_writes_members_of_whole_lines(indexed):
+    domain_sorted, members = read_index(indexed)
+
+    assert domain_sorted
+    assert [domain for _, _, domain in members] == ['de', 'en', 'en', 'fr']
+    assert read_member(indexed, members[1]) == ['en a 5 0\n', 'en b 7 0\n']
+
+
+def test_read_index_of_unindexed_archive(archive):
+    assert read_index(archive) is None
+    assert os.path.basename(index_path(archive)).startswith('.')
+
+
+def test_index_archive_marks_unsorted(tmp_path):
+    path = str(tmp_path / 'pageviews-20200501-000000.gz')
+    with gzip.open(path, 'wt') as f:
+        f.writelines(['en a 1 0\n', 'de a 1 0\n'])
+
+    index_archive(path)
+    domain_sorted, members = read_index(path)
+
+    assert not domain_sorted
+    assert members_for_domain(members, 'de', domain_sorted) == members
+
+
+def test_members_for_domain_includes_member_domain_starts_in(indexed):
+    _, members = read_index(indexed)
+
+    # "de b" and "en a" are in different members, but "en" could start in the one before
+    assert members_for_domain(members, 'en') == members[:3]
+    assert members_for_domain(members, 'fr') == members[2:]
+    assert members_for_domain(members, 'aa') == []
+
+
+def test_parallel_scan_matches_serial_scan(indexed):
+    serial = build_most_viewed_map(indexed, set(), 2)
+    with get_context('fork').Pool(2) as pool:
+        parallel = build_most_viewed_map_parallel(indexed, pool, 2)
+
+    assert list(parallel) == list(serial)
+    assert {d: sorted(h) for d, h in parallel.items()} == \
+        {d: sorted(h) for d, h in serial.items()}
+
+
+def test_parallel_scan_of_one_domain(indexed):
+    with get_context('fork').Pool(2) as pool:
+        most_viewed_map = build_most_viewed_map_parallel(indexed, pool, 2, domain='en')
+    assert {d: sorted(h) for d, h in most_viewed_map.items()} == \
+        {'en': [(7, 'b'), (9, 'd')]}
+
+
+@pytest.mark.parametrize('index', [True, False])
+def test_analyze_domain_writes_only_that_domain(archive, tmp_path, monkeypatch, index):
+    monkeypatch.setattr(analyze, 'DOMAIN_RESULTS_DIR', str(tmp_path / 'domain_results'))
+    if index:
+        index_archive(archive, member_bytes=len(LINES[0]) * 2)
+
+    with get_context('fork').Pool(2) as pool:
+        result_path = analyze_domain(archive, 'en', pool, 2)
+
+    assert result_path == str(tmp_path / 'domain_results' / 'en' / 'pageviews-20200501-000000')
+    with open(result_path) as f:
+        assert f.readlines() == ['en b 7\n', 'en d 9\n']
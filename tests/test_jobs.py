@@ -0,0 +1,101 @@
+from wiki_counts import jobs
+from wiki_counts.jobs import submit, claim, finish, unfinished_hours, job_progress, wait
+
+import os
+import pytest
+
+# pids are at most 2 ** 22 on linux, so this one is never running
+DEAD_PID = 2 ** 22 + 1
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'jobs.sqlite')
+
+
+@pytest.fixture
+def results(monkeypatch):
+    """names of the hours that have results, which can be added to"""
+    results = set()
+    monkeypatch.setattr(jobs, 'has_results', lambda filename: filename in results)
+    return results
+
+
+def hour(url):
+    return url.split('/')[-1].replace('.gz', '')
+
+
+def test_submit_shares_hours_between_jobs(db_path, results):
+    submit('2020-05-01 1:00', '2020-05-01 3:00', db_path=db_path)
+    submit('2020-05-01 2:00', '2020-05-01 5:00', db_path=db_path)
+
+    urls = claim(100, db_path=db_path)
+
+    assert [hour(url) for url in urls] == [
+        f'pageviews-20200501-0{h}0000' for h in range(1, 6)]
+
+
+def test_claim_does_not_hand_out_claimed_hours(db_path, results):
+    submit('2020-05-01 1:00', '2020-05-01 4:00', db_path=db_path)
+
+    first = claim(2, db_path=db_path)
+    second = claim(2, pid=os.getppid(), db_path=db_path)
+
+    assert len(first) == len(second) == 2
+    assert not set(first) & set(second)
+    assert claim(2, db_path=db_path) == []
+
+
+def test_claim_takes_over_hours_of_dead_runner(db_path, results):
+    submit('2020-05-01 1:00', db_path=db_path)
+
+    urls = claim(1, pid=DEAD_PID, db_path=db_path)
+
+    assert claim(1, db_path=db_path) == urls
+
+
+def test_submit_marks_hours_with_results_done(db_path, results):
+    results.add('pageviews-20200501-010000')
+    job_id = submit('2020-05-01 1:00', '2020-05-01 2:00', db_path=db_path)
+
+    assert job_progress(job_id, db_path) == {
+        'pending': 1, 'claimed': 0, 'done': 1, 'skipped': 0}
+
+
+def test_finish_finishes_every_waiting_job(db_path, results):
+    first = submit('2020-05-01 1:00', '2020-05-01 2:00', db_path=db_path)
+    second = submit('2020-05-01 2:00', db_path=db_path)
+
+    urls = claim(10, db_path=db_path)
+    results.add('pageviews-20200501-010000')
+    finish(urls, db_path=db_path)
+
+    assert unfinished_hours(db_path) == 0
+    assert wait(first, 0, db_path) == {
+        'pending': 0, 'claimed': 0, 'done': 1, 'skipped': 1}
+    assert wait(second, 0, db_path) == {
+        'pending': 0, 'claimed': 0, 'done': 0, 'skipped': 1}
+
+
+def test_finish_interrupted_queues_hours_again(db_path, results):
+    job_id = submit('2020-05-01 1:00', db_path=db_path)
+
+    urls = claim(1, db_path=db_path)
+    finish(urls, interrupted=True, db_path=db_path)
+
+    assert job_progress(job_id, db_path)['pending'] == 1
+    assert claim(1, db_path=db_path) == urls
+
+
+def test_submit_queues_skipped_hours_again(db_path, results):
+    submit('2020-05-01 1:00', db_path=db_path)
+    finish(claim(1, db_path=db_path), db_path=db_path)
+
+    job_id = submit('2020-05-01 1:00', db_path=db_path)
+
+    assert job_progress(job_id, db_path)['pending'] == 1
+
+
+def test_job_progress_unknown_job(db_path):
+    with pytest.raises(ValueError):
+        job_progress(1, db_path)
@@ -0,0 +1,113 @@
+from wiki_counts.journal import claim, release, release_stale, in_flight, unfinished, owner
+from wiki_counts.launcher import get_context
+
+import os
+import time
+import pytest
+
+
+HOUR = 'pageviews-20200501-010000'
+
+# pids are at most 2 ** 22 on linux, so this one is never running
+DEAD_PID = 2 ** 22 + 1
+
+
+@pytest.fixture
+def journal_dir(tmp_path):
+    return str(tmp_path)
+
+
+def write_entry(journal_dir, filename, pid):
+    with open(os.path.join(journal_dir, filename), 'w') as f:
+        f.write(str(pid))
+
+
+def test_claim_records_pid(journal_dir):
+    assert claim(HOUR, journal_dir)
+    assert owner(HOUR, journal_dir) == os.getpid()
+    assert in_flight(HOUR, journal_dir)
+
+
+def test_claim_fails_if_live_process_owns_hour(journal_dir):
+    write_entry(journal_dir, HOUR, os.getppid())
+    assert not claim(HOUR, journal_dir)
+
+
+def test_claim_takes_over_from_dead_process(journal_dir):
+    write_entry(journal_dir, HOUR, DEAD_PID)
+    assert claim(HOUR, journal_dir)
+    assert owner(HOUR, journal_dir) == os.getpid()
+
+
+def test_release_removes_entry(journal_dir):
+    claim(HOUR, journal_dir)
+    release(HOUR, journal_dir)
+    assert owner(HOUR, journal_dir) is None
+    assert not in_flight(HOUR, journal_dir)
+
+
+def test_release_without_entry_is_fine(journal_dir):
+    release(HOUR, journal_dir)
+
+
+def test_unfinished_only_lists_dead_owners(journal_dir):
+    write_entry(journal_dir, HOUR, DEAD_PID)
+    write_entry(journal_dir, 'pageviews-20200501-020000', os.getpid())
+    assert unfinished(journal_dir) == [HOUR]
+
+
+def test_claim_leaves_only_the_entry(journal_dir):
+    assert claim(HOUR, journal_dir)
+    assert [e for e in os.listdir(journal_dir) if e != '.lock'] == [HOUR]
+
+
+def test_empty_entry_blocks_hour_until_it_expires(journal_dir):
+    write_entry(journal_dir, HOUR, '')
+    assert in_flight(HOUR, journal_dir)
+    assert not claim(HOUR, journal_dir)
+
+    # an empty entry older than JOURNAL_EMPTY_ENTRY_SECONDS was abandoned
+    long_ago = time.time() - 3600
+    os.utime(os.path.join(journal_dir, HOUR), (long_ago, long_ago))
+
+    assert not in_flight(HOUR, journal_dir)
+    assert unfinished(journal_dir) == [HOUR]
+    assert claim(HOUR, journal_dir)
+
+
+def test_release_stale_leaves_live_entry(journal_dir):
+    write_entry(journal_dir, HOUR, os.getppid())
+    assert not release_stale(HOUR, journal_dir)
+    assert owner(HOUR, journal_dir) == os.getppid()
+
+    write_entry(journal_dir, HOUR, DEAD_PID)
+    assert release_stale(HOUR, journal_dir)
+    assert owner(HOUR, journal_dir) is None
+
+
+def claim_and_hold(journal_dir, start, results):
+    start.wait()
+    won = claim(HOUR, journal_dir)
+    results.put(won)
+
+    # a winner that exited right away would leave a stale entry for the others
+    time.sleep(0.5)
+
+
+def test_only_one_process_takes_over_stale_entry(journal_dir):
+    write_entry(journal_dir, HOUR, DEAD_PID)
+
+    ctx = get_context('fork')
+    start = ctx.Event()
+    results = ctx.Queue()
+    processes = [ctx.Process(target=claim_and_hold, args=(journal_dir, start, results))
+                 for _ in range(8)]
+    for process in processes:
+        process.start()
+
+    start.set()
+    won = [results.get(timeout=10) for _ in processes]
+    for process in processes:
+        process.join()
+
+    assert won.count(True) == 1
@@ -0,0 +1,23 @@
+from wiki_counts.launcher import get_context
+from wiki_counts.analyze import load_blacklist_set
+
+import pytest
+
+
+def blacklist_cache_info():
+    return tuple(load_blacklist_set.cache_info())
+
+
+@pytest.mark.parametrize('start_method', ['forkserver', 'fork'])
+def test_processes_start_with_blacklist_built(start_method):
+    ctx = get_context(start_method)
+
+    with ctx.Pool(1) as pool:
+        _, misses, _, currsize = pool.apply(blacklist_cache_info)
+
+    # the blacklist was built once before the process was forked
+    assert (misses, currsize) == (1, 1)
+
+
+def test_get_context_start_method():
+    assert get_context('spawn').get_start_method() == 'spawn'
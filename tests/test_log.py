@@ -0,0 +1,31 @@
+from wiki_counts.log import setup_logging
+from wiki_counts.utils import killswitch_on_exception
+from wiki_counts.launcher import get_context
+
+import pytest
+
+
+@killswitch_on_exception
+def fail_in_child(log_file, process_killswitch):
+    setup_logging(log_file=log_file)
+    raise RuntimeError('analyzer blew up')
+
+
+@pytest.mark.parametrize('start_method', ['fork', 'forkserver'])
+def test_traceback_of_failed_child_is_written(tmp_path, start_method):
+    log_file = str(tmp_path / 'log')
+    context = get_context(start_method)
+    killswitch = context.Value('b', False)
+
+    process = context.Process(target=fail_in_child, args=(log_file, killswitch))
+    process.start()
+    process.join()
+
+    assert killswitch.value
+
+    # the child exits through os._exit, so this is only written if it flushed its own queue
+    with open(log_file) as f:
+        written = f.read()
+
+    assert 'killing all processes' in written
+    assert "RuntimeError: analyzer blew up" in written
@@ -1,5 +1,5 @@
 from wiki_counts.parse_dates import (
-    str_to_timestamp, date_to_url, parse_start_and_end)
+    str_to_timestamp, date_to_url, parse_start_and_end, order_urls)
 
 from wiki_counts import parse_dates as parse_dates_module
 
@@ -68,6 +68,20 @@ def test_date_to_url_returns_none_if_already_downloaded(timestamp):
     assert date_to_url(timestamp, already_downloaded_set) == None
 
 
+def test_date_to_url_projectviews(timestamp):
+    expected = 'https://dumps.wikimedia.org/other/pageviews/2020/2020-05/projectviews-20200519-000000'
+    assert date_to_url(timestamp, set(), 'projectviews') == expected
+
+
+def test_date_to_url_projectviews_already_downloaded(timestamp):
+    assert date_to_url(timestamp, {'projectviews-20200519-000000'}, 'projectviews') is None
+
+
+def test_date_to_url_raises_on_unknown_dataset(timestamp):
+    with pytest.raises(ValueError):
+        date_to_url(timestamp, set(), 'mediacounts')
+
+
 # the following have to mock the function "str_to_timestamp"
 
 def test_parse_start_and_end_no_arguments(monkeypatch, timestamp, mock_str_to_timestamp):
@@ -131,3 +145,26 @@ def test_parse_start_and_end_raises_when_start_after_end(timestamp, mock_str_to_
 
     with pytest.raises(ValueError):
         parse_start_and_end(start_str, end_str)
+
+
+@pytest.fixture
+def hourly_urls():
+    # out of order, like archives globbed from tmp
+    return [f'https://host/pageviews-20200501-0{hour}0000.gz' for hour in (3, 1, 5, 2, 4)]
+
+
+def test_order_urls_oldest(hourly_urls):
+    assert [url[-8] for url in order_urls(hourly_urls, 'oldest')] == ['1', '2', '3', '4', '5']
+
+
+def test_order_urls_newest(hourly_urls):
+    assert [url[-8] for url in order_urls(hourly_urls, 'newest')] == ['5', '4', '3', '2', '1']
+
+
+def test_order_urls_interleaved(hourly_urls):
+    assert [url[-8] for url in order_urls(hourly_urls, 'interleaved')] == ['5', '1', '4', '2', '3']
+
+
+def test_order_urls_raises_on_unknown_order(hourly_urls):
+    with pytest.raises(ValueError):
+        order_urls(hourly_urls, 'random')
@@ -0,0 +1,147 @@
+from wiki_counts.plan import record_throughput, read_history, estimate_rate, \
+    estimate_sizes, make_plan, plan_lines, fetch_sizes
+from wiki_counts import plan
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import os
+import pytest
+
+MIB = 1024 ** 2
+ROOT = 'https://dumps.wikimedia.org/other/pageviews/2020/2020-05/'
+
+
+def url(hour):
+    return f'{ROOT}pageviews-20200501-{hour:02}0000.gz'
+
+
+def record(kind, hour, num_bytes, seconds):
+    return {'kind': kind, 'filename': f'pageviews-20200501-{hour:02}0000.gz',
+            'bytes': num_bytes, 'seconds': seconds, 'time': 0}
+
+
+@pytest.fixture
+def history():
+    # 1 MiB/s per download connection, 2 MiB/s per file processor
+    return [record('download', 1, 10 * MIB, 10),
+            record('analyze', 1, 10 * MIB, 5),
+            record('download', 2, 20 * MIB, 20),
+            record('analyze', 2, 20 * MIB, 10)]
+
+
+def test_record_and_read_history(tmp_path):
+    history_file = str(tmp_path / 'throughput.jsonl')
+    record_throughput('download', 'pageviews-20200501-010000.gz', 100, 2, history_file)
+    record_throughput('analyze', 'pageviews-20200501-010000.gz', 100, 1, history_file)
+
+    # a line cut short by a crash is ignored
+    with open(history_file, 'a') as f:
+        f.write('{"kind": "down')
+
+    records = read_history(history_file)
+    assert [(r['kind'], r['bytes'], r['seconds']) for r in records] == [
+        ('download', 100, 2), ('analyze', 100, 1)]
+
+
+def test_read_history_only_most_recent(tmp_path):
+    history_file = str(tmp_path / 'throughput.jsonl')
+    for hour in range(5):
+        record_throughput('download', f'pageviews-20200501-{hour:02}0000.gz', hour, 1, history_file)
+
+    records = read_history(history_file, num_records=2)
+    assert [r['bytes'] for r in records] == [3, 4]
+
+
+def test_record_throughput_trims_history(tmp_path, monkeypatch):
+    history_file = str(tmp_path / 'throughput.jsonl')
+    monkeypatch.setattr(plan, 'THROUGHPUT_HISTORY_BYTES', 1000)
+    monkeypatch.setattr(plan.trim_history, '__defaults__', (3,))
+
+    for hour in range(24):
+        record_throughput('download', f'pageviews-20200501-{hour:02}0000.gz', hour, 1, history_file)
+
+        assert os.path.getsize(history_file) <= 1000
+
+    records = read_history(history_file)
+    assert 3 <= len(records) < 24
+    assert records[-1]['bytes'] == 23
+    assert [r['bytes'] for r in records] == list(range(24 - len(records), 24))
+
+    # only the trimmed file is left behind
+    assert os.listdir(tmp_path) == ['throughput.jsonl']
+
+
+def test_read_history_missing_file(tmp_path):
+    assert read_history(str(tmp_path / 'throughput.jsonl')) == []
+    assert read_history(None) == []
+
+
+def test_estimate_rate(history):
+    assert estimate_rate(history, 'download', 'pageviews') == MIB
+    assert estimate_rate(history, 'analyze', 'pageviews') == 2 * MIB
+    assert estimate_rate(history, 'download', 'projectviews') is None
+
+
+def test_estimate_sizes_prefers_head_then_recorded_then_median(history):
+    sizes = estimate_sizes([url(1), url(2), url(3)], history, {url(2): 7})
+
+    assert sizes == [10 * MIB, 7, 15 * MIB]
+
+
+def test_estimate_sizes_without_history():
+    assert estimate_sizes([url(1)], []) == [None]
+
+
+def test_make_plan(history):
+    urls = [url(hour) for hour in range(3, 9)]
+    plan = make_plan(urls, history, num_downloaders=3, cpu_count=8)
+
+    # 6 hours of 15 MiB, downloaded at 3 MiB/s, analyzed at 2 MiB/s per processor
+    assert plan['total_bytes'] == 90 * MIB
+    assert plan['downloaders'] == 3
+    assert plan['file_processors'] == 2
+    assert plan['download_seconds'] == 30
+    assert plan['analyze_seconds'] == 22.5
+    assert plan['duration_seconds'] == 30 + 7.5
+    assert plan['tmp_bytes'] == 5 * 15 * MIB
+
+
+def test_make_plan_tmp_backlog_when_cpus_run_out(history):
+    urls = [url(hour) for hour in range(3, 9)]
+    plan = make_plan(urls, history, num_downloaders=3, cpu_count=2)
+
+    # one processor falls behind the downloads by 1 MiB/s for 30s
+    assert plan['file_processors'] == 1
+    assert plan['duration_seconds'] == 45 + 7.5
+    assert plan['tmp_bytes'] == 4 * 15 * MIB + 30 * MIB
+
+
+def test_make_plan_offline_without_history():
+    plan = make_plan([url(1)], [])
+
+    assert plan['total_bytes'] is None
+    assert plan['duration_seconds'] is None
+    assert 'use --head' in plan_lines(plan)[-1]
+
+
+def test_plan_lines_nothing_to_do():
+    assert plan_lines(make_plan([], [])) == [
+        'every hour in the range already has results, nothing to do']
+
+
+@pytest.mark.asyncio
+async def test_fetch_sizes():
+    async def handle(request):
+        return web.Response(body=b'x' * 123)
+
+    app = web.Application()
+    app.router.add_route('HEAD', '/pageviews-20200501-010000.gz', handle)
+
+    async with TestServer(app) as server:
+        found = str(server.make_url('/pageviews-20200501-010000.gz'))
+        missing = str(server.make_url('/pageviews-20200501-020000.gz'))
+
+        sizes = await fetch_sizes([found, missing])
+
+    assert sizes == {found: 123, missing: None}
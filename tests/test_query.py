@@ -0,0 +1,187 @@
+from wiki_counts.query import (
+    ResultsCache, parse_results_file, hour_to_filename, top_over_hours, make_app)
+
+from wiki_counts.shards import append_hour
+from wiki_counts.config import SHARD_PERIOD, QUERY_MAX_RANGE_HOURS
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import os
+import pytest
+import pandas as pd
+
+
+HOUR_1 = 'pageviews-20200501-010000'
+HOUR_2 = 'pageviews-20200501-020000'
+
+
+@pytest.fixture
+def results_dir(tmp_path):
+    (tmp_path / HOUR_1).write_text('de c 1\nen b 2\nen a 5\n')
+    (tmp_path / HOUR_2).write_text('en a 1\nen b 7\n')
+    return tmp_path
+
+
+@pytest.fixture
+def cache(results_dir):
+    return ResultsCache(str(results_dir), max_hours=1, titles_path=None)
+
+
+def test_parse_results_file_most_viewed_first(results_dir):
+    parsed = parse_results_file(str(results_dir / HOUR_1))
+    assert parsed == {'de': [(1, 'c')], 'en': [(5, 'a'), (2, 'b')]}
+
+
+def test_hour_to_filename():
+    assert hour_to_filename('2020-05-01 1:00') == HOUR_1
+
+
+def test_top_over_hours_sums_views(results_dir, cache):
+    hours = [cache.load(h)[1] for h in (HOUR_1, HOUR_2)]
+    ids, counts = top_over_hours(hours, 'en', 1)
+    assert [cache.titles.lookup(i) for i in ids] == [('en', 'b')]
+    assert list(counts) == [9]
+
+
+@pytest.mark.asyncio
+async def test_cache_returns_none_for_missing_hour(cache):
+    assert await cache.get('pageviews-20200501-030000') is None
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recently_used(cache):
+    await cache.get(HOUR_1)
+    await cache.get(HOUR_2)
+    assert list(cache.hours) == [HOUR_2]
+
+
+@pytest.mark.asyncio
+async def test_cache_picks_up_rewritten_file(results_dir, cache):
+    await cache.get(HOUR_1)
+
+    path = results_dir / HOUR_1
+    path.write_text('en z 100\n')
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 1))
+
+    ids, counts = (await cache.get(HOUR_1))['en']
+    assert cache.titles.lookup(ids[0]) == ('en', 'z')
+    assert list(counts) == [100]
+
+
+@pytest.mark.asyncio
+async def test_service_top_for_hour(cache):
+    async with TestClient(TestServer(make_app(cache))) as client:
+        response = await client.get('/top/en', params={'hour': '2020-05-01 1:00', 'n': 1})
+        body = await response.json()
+
+    assert body['pages'] == [{'page_title': 'a', 'count_views': 5}]
+
+
+@pytest.mark.asyncio
+async def test_service_top_over_range(cache):
+    async with TestClient(TestServer(make_app(cache))) as client:
+        response = await client.get(
+            '/top/en', params={'start': '2020-05-01 1:00', 'end': '2020-05-01 3:00'})
+        body = await response.json()
+
+    assert body['hours_found'] == 2
+    assert body['pages'][0] == {'page_title': 'b', 'count_views': 9}
+
+
+@pytest.mark.asyncio
+async def test_service_missing_hour_is_404(cache):
+    async with TestClient(TestServer(make_app(cache))) as client:
+        response = await client.get('/top/en', params={'hour': '2020-05-01 5:00'})
+
+    assert response.status == 404
+
+
+@pytest.mark.asyncio
+async def test_service_bad_query_is_400(cache):
+    async with TestClient(TestServer(make_app(cache))) as client:
+        response = await client.get('/top/en', params={'hour': 'not a date'})
+
+    assert response.status == 400
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('n', ['0', '-5'])
+async def test_service_n_below_one_is_400(cache, n):
+    async with TestClient(TestServer(make_app(cache))) as client:
+        response = await client.get('/top/en', params={'hour': '2020-05-01 1:00', 'n': n})
+
+    assert response.status == 400
+
+
+@pytest.mark.asyncio
+async def test_service_range_too_long_is_400(cache):
+    end = pd.Timestamp('2020-05-01 1:00') + pd.Timedelta(hours=QUERY_MAX_RANGE_HOURS)
+
+    async with TestClient(TestServer(make_app(cache))) as client:
+        response = await client.get(
+            '/top/en', params={'start': '2020-05-01 1:00', 'end': end.isoformat()})
+
+    assert response.status == 400
+
+
+@pytest.mark.asyncio
+async def test_service_huge_range_is_400_without_listing_hours(cache, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('hours listed before the range was checked')
+
+    monkeypatch.setattr(pd, 'date_range', fail)
+
+    async with TestClient(TestServer(make_app(cache))) as client:
+        response = await client.get(
+            '/top/en', params={'start': '1700-01-01', 'end': '2200-01-01'})
+
+    assert response.status == 400
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('start,end', [('2020-05-01 1:00', ''), ('', '2020-05-01 1:00')])
+async def test_service_empty_range_date_is_400(cache, start, end):
+    async with TestClient(TestServer(make_app(cache))) as client:
+        response = await client.get('/top/en', params={'start': start, 'end': end})
+
+    assert response.status == 400
+
+
+def test_cache_saves_title_dictionary(results_dir, tmp_path):
+    titles_path = str(tmp_path / 'titles')
+    cache = ResultsCache(str(results_dir), titles_path=titles_path)
+    cache.load(HOUR_1)
+
+    # loading an hour doesn't write anything, titles are saved in batches
+    assert not os.path.exists(titles_path)
+    cache.save_titles()
+
+    reloaded = ResultsCache(str(results_dir), titles_path=titles_path)
+    assert len(reloaded.titles) == 3
+
+
+@pytest.mark.asyncio
+async def test_service_saves_title_dictionary_when_stopped(results_dir, tmp_path):
+    titles_path = str(tmp_path / 'titles')
+    cache = ResultsCache(str(results_dir), titles_path=titles_path)
+
+    async with TestClient(TestServer(make_app(cache))) as client:
+        await client.get('/top/en', params={'hour': '2020-05-01 1:00'})
+
+    reloaded = ResultsCache(str(results_dir), titles_path=titles_path)
+    assert len(reloaded.titles) == 3
+
+
+@pytest.mark.asyncio
+async def test_cache_reads_hour_from_container(tmp_path):
+    shards_dir = tmp_path / 'shards'
+    shards_dir.mkdir()
+    append_hour(HOUR_1, ['en b 2\n', 'en a 5\n'], str(shards_dir), SHARD_PERIOD)
+
+    cache = ResultsCache(
+        str(tmp_path), titles_path=None, shards_dir=str(shards_dir))
+    ids, counts = (await cache.get(HOUR_1))['en']
+
+    assert cache.titles.lookup(ids[0]) == ('en', 'a')
+    assert list(counts) == [5, 2]
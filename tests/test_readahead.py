@@ -0,0 +1,98 @@
+from wiki_counts.readahead import ReadAheadReader, open_readahead
+from wiki_counts import utils
+
+import io
+import gzip
+import pytest
+
+
+@pytest.fixture
+def lines():
+    return [f'en Page_{i} {i} 0\n' for i in range(1000)] + ['de Straße_é 3 0\n']
+
+
+@pytest.fixture
+def archive(tmp_path, lines):
+    path = str(tmp_path / 'pageviews-20200501-000000.gz')
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.writelines(lines)
+    return path
+
+
+def read(contents: bytes, block_bytes: int, num_buffers: int = 2):
+    with ReadAheadReader(io.BytesIO(contents), block_bytes, num_buffers) as reader:
+        return list(reader)
+
+
+def test_readahead_matches_gzip(archive, lines):
+    with open_readahead(archive) as reader:
+        assert list(reader) == lines
+
+    with gzip.open(archive, 'rt') as f:
+        assert f.readlines() == lines
+
+
+@pytest.mark.parametrize('block_bytes', [1, 7, 16, 17, 100, 4096])
+def test_readahead_lines_split_across_blocks(lines, block_bytes):
+    # small blocks cut lines, and the two-byte characters, at every possible place
+    contents = gzip.compress(''.join(lines).encode('utf-8'))
+    assert read(contents, block_bytes) == lines
+
+
+def test_readahead_single_buffer(lines):
+    contents = gzip.compress(''.join(lines).encode('utf-8'))
+    assert read(contents, 64, num_buffers=1) == lines
+
+
+def test_readahead_reads_every_member(lines):
+    # like the archives gzip_index.index_archive writes, padded with zeroes at the end
+    contents = b''.join(
+        gzip.compress(''.join(lines[i:i + 100]).encode('utf-8'))
+        for i in range(0, len(lines), 100)) + b'\x00' * 8
+
+    assert read(contents, 50) == lines
+
+
+def test_readahead_last_line_without_newline():
+    contents = gzip.compress(b'en a 5 0\nen b 7 0')
+    assert read(contents, 4) == ['en a 5 0\n', 'en b 7 0']
+
+
+def test_readahead_empty_archive():
+    assert read(gzip.compress(b''), 16) == []
+    assert read(b'', 16) == []
+
+
+def test_readahead_truncated_archive_raises(lines):
+    contents = gzip.compress(''.join(lines).encode('utf-8'))
+
+    with pytest.raises(EOFError):
+        read(contents[:len(contents) // 2], 64)
+
+
+def test_readahead_close_before_the_end_stops_thread(lines):
+    contents = gzip.compress(''.join(lines).encode('utf-8'))
+    reader = ReadAheadReader(io.BytesIO(contents), 16, 2)
+
+    assert next(iter(reader)) == lines[0]
+    reader.close()
+
+    assert not reader.thread.is_alive()
+    assert reader.fileobj.closed
+
+
+def test_open_archive_with_readahead(archive, lines, monkeypatch):
+    monkeypatch.setattr(utils, 'READAHEAD_BLOCK_BYTES', 64)
+
+    with utils.open_archive(archive) as f:
+        assert isinstance(f, ReadAheadReader)
+        assert f.block_bytes == 64
+        assert f.readlines() == lines
+
+
+def test_open_archive_without_readahead(archive, lines, monkeypatch):
+    monkeypatch.setattr(utils, 'READAHEAD_BLOCK_BYTES', None)
+
+    with utils.open_archive(archive) as f:
+        assert not isinstance(f, ReadAheadReader)
+        assert f.readlines() == lines
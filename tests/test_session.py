@@ -0,0 +1,57 @@
+from wiki_counts import session as session_module
+from wiki_counts.session import make_session
+from wiki_counts.download import fetch_archive
+from wiki_counts.config import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+
+from aiohttp import web, ServerTimeoutError
+from aiohttp.test_utils import TestServer
+
+import asyncio
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_make_session_limits_connections_to_workers():
+    async with make_session(3) as session:
+        assert session.connector.limit == 3
+        assert session.connector.limit_per_host == 3
+
+
+@pytest.mark.asyncio
+async def test_make_session_only_times_out_stalled_transfers():
+    async with make_session(1) as session:
+        assert session.timeout.total is None
+        assert session.timeout.connect == HTTP_CONNECT_TIMEOUT
+        assert session.timeout.sock_read == HTTP_READ_TIMEOUT
+
+
+@pytest.mark.asyncio
+async def test_make_session_without_read_bufsize(monkeypatch):
+    # aiohttp before 3.7, as pinned in env.yaml, has no read_bufsize
+    monkeypatch.setattr(session_module, 'READ_BUFSIZE_KWARGS', {})
+
+    async with make_session(1) as session:
+        assert session.connector.limit == 1
+
+
+@pytest.mark.asyncio
+async def test_stalled_download_times_out(monkeypatch):
+    monkeypatch.setattr(session_module, 'HTTP_READ_TIMEOUT', 0.1)
+
+    async def handle(request):
+        response = web.StreamResponse(headers={'Content-Length': '1000'})
+        await response.prepare(request)
+        await response.write(b'x' * 10)
+
+        # the rest of the archive never arrives
+        await asyncio.sleep(10)
+        return response
+
+    app = web.Application()
+    app.router.add_get('/2020/2020-05/pageviews-20200501-010000.gz', handle)
+
+    async with TestServer(app) as server, make_session(1) as session:
+        url = str(server.make_url('/2020/2020-05/pageviews-20200501-010000.gz'))
+
+        with pytest.raises(ServerTimeoutError):
+            await fetch_archive(session, url)
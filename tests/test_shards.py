@@ -0,0 +1,80 @@
+from wiki_counts.shards import (
+    shard_name, append_hour, read_hour, has_hour, read_index, sharded_hours,
+    convert_results_tree)
+
+import os
+import pytest
+
+
+HOUR_1 = 'pageviews-20200501-010000'
+HOUR_2 = 'pageviews-20200501-020000'
+
+
+@pytest.fixture
+def shards_dir(tmp_path):
+    path = tmp_path / 'shards'
+    path.mkdir()
+    return str(path)
+
+
+def test_shard_name_day():
+    assert shard_name(HOUR_1, 'day') == 'pageviews-20200501'
+
+
+def test_shard_name_month():
+    assert shard_name(HOUR_1, 'month') == 'pageviews-202005'
+
+
+def test_append_and_read_hour(shards_dir):
+    append_hour(HOUR_1, ['en a 1\n', 'en b 2\n'], shards_dir, 'day')
+    append_hour(HOUR_2, ['de c 3\n'], shards_dir, 'day')
+
+    assert read_hour(HOUR_1, shards_dir, 'day') == ['en a 1\n', 'en b 2\n']
+    assert read_hour(HOUR_2, shards_dir, 'day') == ['de c 3\n']
+    assert os.listdir(shards_dir).count('pageviews-20200501.data') == 1
+
+
+def test_read_missing_hour(shards_dir):
+    append_hour(HOUR_1, ['en a 1\n'], shards_dir, 'day')
+    assert read_hour(HOUR_2, shards_dir, 'day') is None
+    assert read_hour('pageviews-20200601-010000', shards_dir, 'day') is None
+
+
+def test_has_hour(shards_dir):
+    append_hour(HOUR_1, ['en a 1\n'], shards_dir, 'day')
+
+    assert has_hour(HOUR_1, shards_dir, 'day')
+    assert not has_hour(HOUR_2, shards_dir, 'day')
+    assert not has_hour('pageviews-20200601-010000', shards_dir, 'day')
+
+
+def test_last_append_wins(shards_dir):
+    append_hour(HOUR_1, ['en a 1\n'], shards_dir, 'day')
+    append_hour(HOUR_1, ['en a 2\n'], shards_dir, 'day')
+    assert read_hour(HOUR_1, shards_dir, 'day') == ['en a 2\n']
+
+
+def test_read_index_ignores_truncated_line(shards_dir):
+    append_hour(HOUR_1, ['en a 1\n'], shards_dir, 'day')
+    shard_path = os.path.join(shards_dir, 'pageviews-20200501')
+    with open(shard_path + '.idx', 'a') as f:
+        f.write(f'{HOUR_2} 12')
+
+    assert list(read_index(shard_path)) == [HOUR_1]
+
+
+def test_sharded_hours(shards_dir):
+    append_hour(HOUR_1, ['en a 1\n'], shards_dir, 'month')
+    append_hour('pageviews-20200601-010000', ['en a 1\n'], shards_dir, 'month')
+    assert sharded_hours(shards_dir) == {HOUR_1, 'pageviews-20200601-010000'}
+
+
+def test_convert_results_tree(tmp_path, shards_dir):
+    results_dir = tmp_path / 'results'
+    results_dir.mkdir()
+    (results_dir / HOUR_1).write_text('en a 1\n')
+    (results_dir / HOUR_2).write_text('en b 2\n')
+
+    assert convert_results_tree(str(results_dir), shards_dir, 'day') == 2
+    assert os.listdir(results_dir) == []
+    assert read_hour(HOUR_2, shards_dir, 'day') == ['en b 2\n']
@@ -0,0 +1,50 @@
+from wiki_counts.shm import create_segments, destroy_segments, write_segment, open_segment
+from wiki_counts.analyze import build_most_viewed_map
+from wiki_counts.utils import open_archive
+
+import gzip
+import pytest
+
+
+@pytest.fixture
+def segment():
+    segments = create_segments(1, 1024)
+    yield segments[0]
+    destroy_segments(segments)
+
+
+@pytest.fixture
+def archive():
+    return gzip.compress(b'en a 5 0\nen b 7 0\nde c 1 0\n')
+
+
+def test_write_segment_rejects_archive_too_big(segment):
+    assert not write_segment(segment.name, b'x' * (segment.size + 1))
+
+
+def test_open_segment_reads_only_the_archive(segment):
+    write_segment(segment.name, b'x' * 100)
+    write_segment(segment.name, b'abc')
+
+    with open_segment(segment.name, 3) as reader:
+        assert reader.read() == b'abc'
+
+
+def test_open_archive_over_segment_decompresses(segment, archive):
+    write_segment(segment.name, archive)
+
+    with open_segment(segment.name, len(archive)) as reader:
+        with open_archive('pageviews-20200501-000000.gz', reader) as f:
+            lines = f.readlines()
+
+    assert lines == ['en a 5 0\n', 'en b 7 0\n', 'de c 1 0\n']
+
+
+def test_build_most_viewed_map_from_segment(segment, archive):
+    write_segment(segment.name, archive)
+
+    with open_segment(segment.name, len(archive)) as reader:
+        most_viewed_map = build_most_viewed_map(
+            'pageviews-20200501-000000.gz', set(), 1, reader)
+
+    assert dict(most_viewed_map) == {'en': [(7, 'b')], 'de': [(1, 'c')]}
@@ -0,0 +1,60 @@
+from wiki_counts.titles import TitleDictionary, encode_pages, merge_pages
+
+import pytest
+
+
+@pytest.fixture
+def titles():
+    return TitleDictionary()
+
+
+def test_id_for_is_stable(titles):
+    first = titles.id_for('en', 'page')
+    assert titles.id_for('en', 'other') != first
+    assert titles.id_for('en', 'page') == first
+
+
+def test_same_title_different_domain_gets_new_id(titles):
+    assert titles.id_for('en', 'page') != titles.id_for('de', 'page')
+
+
+def test_lookup(titles):
+    title_id = titles.id_for('en', 'page')
+    assert titles.lookup(title_id) == ('en', 'page')
+
+
+def test_save_and_load_keep_ids(titles, tmp_path):
+    path = str(tmp_path / 'titles')
+    titles.id_for('en', 'a')
+    titles.save(path)
+    titles.id_for('en', 'b')
+    titles.save(path)
+
+    loaded = TitleDictionary.load(path)
+    assert loaded.id_for('en', 'b') == titles.id_for('en', 'b')
+    assert len(loaded) == 2
+
+
+def test_load_missing_file(tmp_path):
+    assert len(TitleDictionary.load(str(tmp_path / 'missing'))) == 0
+
+
+def test_encode_pages(titles):
+    ids, counts = encode_pages(titles, 'en', [(5, 'a'), (3, 'b')])
+    assert [titles.lookup(i) for i in ids] == [('en', 'a'), ('en', 'b')]
+    assert list(counts) == [5, 3]
+
+
+def test_merge_pages_sums_and_sorts(titles):
+    hour_1 = encode_pages(titles, 'en', [(5, 'a'), (3, 'b')])
+    hour_2 = encode_pages(titles, 'en', [(4, 'b'), (1, 'c')])
+
+    ids, counts = merge_pages([hour_1, hour_2])
+
+    assert [titles.lookup(i)[1] for i in ids] == ['b', 'a', 'c']
+    assert list(counts) == [7, 5, 1]
+
+
+def test_merge_pages_empty():
+    ids, counts = merge_pages([])
+    assert len(ids) == 0 and len(counts) == 0
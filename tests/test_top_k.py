@@ -0,0 +1,46 @@
+from wiki_counts.top_k import write_top_k, read_top_k
+
+import heapq
+import pytest
+
+
+DIGEST = b'd' * 20
+
+
+@pytest.fixture
+def top_k_path(tmp_path):
+    most_viewed_map = {'de': [], 'en': []}
+    for views in range(10):
+        heapq.heappush(most_viewed_map['en'], (views, f'page{views}'))
+    heapq.heappush(most_viewed_map['de'], (3, 'Seite'))
+
+    path = str(tmp_path / 'pageviews-20200501-010000')
+    write_top_k(path, most_viewed_map, 5, DIGEST)
+    return path
+
+
+def test_read_top_k_returns_most_viewed_first(top_k_path):
+    top_n_map = read_top_k(top_k_path, 3)
+    assert top_n_map['en'] == [(9, 'page9'), (8, 'page8'), (7, 'page7')]
+    assert top_n_map['de'] == [(3, 'Seite')]
+
+
+def test_read_top_k_only_keeps_k(top_k_path):
+    assert len(read_top_k(top_k_path, 5)['en']) == 5
+
+
+def test_read_top_k_raises_if_n_larger_than_k(top_k_path):
+    with pytest.raises(ValueError):
+        read_top_k(top_k_path, 6)
+
+
+def test_read_top_k_checks_blacklist(top_k_path):
+    assert read_top_k(top_k_path, 1, DIGEST)
+    with pytest.raises(ValueError):
+        read_top_k(top_k_path, 1, b'x' * 20)
+
+
+def test_read_top_k_unicode_titles(tmp_path):
+    path = str(tmp_path / 'unicode')
+    write_top_k(path, {'ru': [(1, 'Москва')]}, 1, DIGEST)
+    assert read_top_k(path, 1) == {'ru': [(1, 'Москва')]}
@@ -0,0 +1,67 @@
+from wiki_counts.trending import adjacent_hour, load_state, compare_hours
+from wiki_counts.top_k import write_top_k
+
+import heapq
+import pytest
+
+
+DIGEST = b'd' * 20
+
+
+def test_adjacent_hour():
+    assert adjacent_hour('pageviews-20200501-100000', -1) == 'pageviews-20200501-090000'
+    assert adjacent_hour('pageviews-20200501-100000', 1) == 'pageviews-20200501-110000'
+
+
+def test_adjacent_hour_crosses_days():
+    assert adjacent_hour('pageviews-20200501-000000', -1) == 'pageviews-20200430-230000'
+    assert adjacent_hour('projectviews-20201231-230000', 1) == 'projectviews-20210101-000000'
+
+
+def test_compare_hours_rank_and_view_changes():
+    previous_map = {'en': [(30, 'A'), (20, 'B'), (10, 'C')]}
+    current_map = {'en': [(5, 'A'), (50, 'B'), (40, 'D')]}
+    heapq.heapify(current_map['en'])
+
+    assert compare_hours(previous_map, current_map, 3) == [
+        'en B 50 1 1 30\n',
+        'en D 40 2 new new\n',
+        'en A 5 3 -2 -25\n',
+    ]
+
+
+def test_compare_hours_only_compares_top_k():
+    # C was in the previous hour's heap, but not its top 2
+    previous_map = {'en': [(30, 'A'), (20, 'B'), (10, 'C')]}
+    current_map = {'en': [(30, 'A'), (25, 'C'), (1, 'B')]}
+
+    assert compare_hours(previous_map, current_map, 2) == [
+        'en A 30 1 0 0\n',
+        'en C 25 2 new new\n',
+    ]
+
+
+def test_compare_hours_new_domain():
+    assert compare_hours({}, {'de': [(3, 'Seite')]}, 5) == ['de Seite 3 1 new new\n']
+
+
+@pytest.fixture
+def top_k_dir(tmp_path):
+    write_top_k(
+        str(tmp_path / 'pageviews-20200501-010000'),
+        {'en': [(9, 'A'), (8, 'B')]}, 2, DIGEST)
+    return str(tmp_path)
+
+
+def test_load_state(top_k_dir):
+    assert load_state('pageviews-20200501-010000', 2, DIGEST, top_k_dir) == {
+        'en': [(9, 'A'), (8, 'B')]}
+
+
+def test_load_state_missing_hour(top_k_dir):
+    assert load_state('pageviews-20200501-020000', 2, DIGEST, top_k_dir) is None
+
+
+def test_load_state_cannot_compare(top_k_dir):
+    assert load_state('pageviews-20200501-010000', 3, DIGEST, top_k_dir) is None
+    assert load_state('pageviews-20200501-010000', 2, b'x' * 20, top_k_dir) is None
@@ -1,4 +1,7 @@
-from wiki_counts.utils import filename_from_path
+from wiki_counts.utils import filename_from_path, atomic_open, partial_path
+
+import os
+import pytest
 
 def test_filename_from_path():
     path = '/i/am/a/path/file.gz'
@@ -10,4 +13,27 @@ def test_filename_from_path_on_url():
 
 def test_filename_from_path_removes_gz():
     path = '/another/nice/path/to/file.gz'
-    assert filename_from_path(path, remove_gz=True) == 'file'
\ No newline at end of file
+    assert filename_from_path(path, remove_gz=True) == 'file'
+
+def test_atomic_open_writes_file(tmp_path):
+    path = str(tmp_path / 'results')
+    with atomic_open(path) as f:
+        f.write('hi')
+    assert open(path).read() == 'hi'
+    assert not os.path.exists(partial_path(path))
+
+def test_atomic_open_leaves_old_file_on_failure(tmp_path):
+    path = str(tmp_path / 'results')
+    with open(path, 'w') as f:
+        f.write('old')
+
+    with pytest.raises(RuntimeError):
+        with atomic_open(path) as f:
+            f.write('half written')
+            raise RuntimeError()
+
+    assert open(path).read() == 'old'
+    assert not os.path.exists(partial_path(path))
+
+def test_partial_path_is_hidden():
+    assert partial_path('/results/file.gz') == '/results/.file.gz.partial'
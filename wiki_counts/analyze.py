@@ -1,79 +1,247 @@
 
-import gzip
 import heapq
 import os
 import glob
 import time
+import hashlib
+import logging
 import multiprocessing
 
 from collections import defaultdict
-from typing import Set, Tuple, Dict, List
-
-from .config import TMP_DIR, RESULTS_DIR, TOP_N_PAGEVIEWS, ROOT_DIR
-from .utils import killswitch_on_exception, filename_from_path
+from queue import Empty
+from functools import lru_cache
+from multiprocessing.pool import Pool
+from typing import Set, FrozenSet, Tuple, Dict, List, Union, Iterable
+
+from .config import TMP_DIR, RESULTS_DIR, TOP_N_PAGEVIEWS, TOP_K_SUPERSET, \
+    TOP_K_DIR, BLACKLIST_FILE, MALFORMED_SAMPLE_SIZE, RESULTS_FORMAT, \
+    TRENDING_TOP_K, TRENDING_DIR, DOMAIN_RESULTS_DIR
+from .utils import killswitch_on_exception, ignore_interrupts, filename_from_path, atomic_open, \
+    open_archive, dataset_from_path
+from .archive_cache import retire_archive
+from .top_k import write_top_k
+from .trending import adjacent_hour, trending_path, load_state, compare_hours, \
+    write_trending
+from .shards import append_hour, has_hour
+from .shm import SegmentItem, open_segment
+from .gzip_index import Member, read_index, members_for_domain, read_member
+from .log import setup_logging, report_startup
+from .plan import record_throughput
+from . import journal
+
+logger = logging.getLogger(__name__)
 
 
 @killswitch_on_exception
 def analyze_from_queue(
         queue: multiprocessing.Queue,
+        free_segments: Union[multiprocessing.Queue, None],
         downloads_done: multiprocessing.Value,
+        retire: multiprocessing.Value,
+        launched_at: float,
         process_killswitch):
     """driver function that calls analyze_file on filenames read from queue
 
     Arguments:
-        queue {multiprocessing.Queue} -- queue that provides names of downloaded files
+        queue {multiprocessing.Queue} -- queue that provides names of downloaded files, or archives in shared memory segments
+        free_segments {multiprocessing.Queue, None} -- queue that segments are given back to once analyzed, None if shared memory is off
         downloads_done {multiprocessing.Value[bool]} -- flag that indicates when downloads are done
+        retire {multiprocessing.Value[bool]} -- flag that tells this process to stop once its current file is done
+        launched_at {float} -- time.time() when the process was launched, to report how long it took to start
         process_killswitch {multiprocessing.Value[bool]} -- flag that indicates to kill this process
                                                             because of an error in another process
     """
 
+    setup_logging()
+    ignore_interrupts()
+
     # get the list of domains and pages to not include in the analysis
-    blacklist_set = make_blacklist_set()
+    # if the fork server or the parent process loaded it before forking this one, it is already built
+    blacklist_set = load_blacklist_set()
+    report_startup(launched_at, 'file processor')
 
     # as long as downloads are not done or the queue is not empty,
     # this process runs
     while not downloads_done.value or not queue.empty():
         if process_killswitch.value:
-            print('process killed')
+            logger.warning('process killed')
+            return
+
+        # the pool is being scaled down
+        if retire.value:
+            logger.info('file processor retired')
             return
 
-        if queue.empty():
-            print('no files yet!')
+        # pulls the name of a downloaded gzip archive
+        # another analyzer may take the last item between a check for
+        # queue.empty() and queue.get(), so don't block on the queue
+        try:
+            item = queue.get_nowait()
+        except Empty:
+            logger.debug('no files yet!')
             # sleep so resources aren't hogged
             time.sleep(5)
+            continue
+
+        # analyzes the gzip archive
+        started = time.time()
+        if isinstance(item, tuple):
+            filename = item[2]
+            archive_bytes = analyze_segment(item, free_segments, blacklist_set)
         else:
-            # pulls the name of a downloaded gzip archive
-            file_abspath = queue.get()
+            filename = filename_from_path(item)
+            archive_bytes = analyze_file(item, blacklist_set)
 
-            # analyzes the gzip archive
-            analyze_file(file_abspath, blacklist_set)
+        # --plan estimates backfills from the throughput of earlier analyses
+        if archive_bytes is not None:
+            record_throughput('analyze', filename, archive_bytes, time.time() - started)
 
 
-def analyze_file(file_abspath: str, blacklist_set: Set[Tuple[str, str]]):
+def analyze_file(
+        file_abspath: str,
+        blacklist_set: Set[Tuple[str, str]],
+        fileobj=None,
+        pool: Union[Pool, None] = None,
+        archive_bytes: Union[int, None] = None) -> Union[int, None]:
     """performs analysis of top n pageviews
 
     Arguments:
         file_abspath {string} -- path to gzip file to analyze
         blacklist_set {Set[Tuple[str, str]]} -- set of blacklisted (domain_code, page_names) tuples
+
+    Keyword Arguments:
+        fileobj {file object, None} -- binary file object to read the archive from instead of file_abspath,
+                                       which is then left alone (default: {None})
+        pool {Pool, None} -- pool to scan the archive's members in, if it was indexed by gzip_index.index_archive (default: {None})
+        archive_bytes {int, None} -- size of the archive in fileobj, None to take it from file_abspath (default: {None})
+
+    Returns:
+        int, None -- size of the archive if it was analyzed, None if another process analyzed it or is analyzing it
     """
     filename = filename_from_path(file_abspath)
+    result_filename = filename_from_path(file_abspath, remove_gz=True)
+
+    # another run recovering from a crash may already be working on this hour
+    if not journal.claim(result_filename):
+        logger.info(f'{filename} is already being processed, skipping')
+        return None
+
+    # another run may have queued the same archive from tmp, and analyzed and removed it
+    # while this one waited in the queue
+    if has_results(result_filename) or (fileobj is None and not os.path.exists(file_abspath)):
+        journal.release(result_filename)
+        logger.info(f'{filename} was already processed, skipping')
+        return None
+
+    # an archive in tmp is gone once analyzed, so its size is taken first
+    if fileobj is None:
+        archive_bytes = os.path.getsize(file_abspath)
+
+    logger.info(f'processing {filename}')
+
+    # projectviews only has one line per domain, so there is nothing to rank
+    if dataset_from_path(file_abspath) == 'projectviews':
+        write_results(
+            result_filename,
+            totals_to_lines(build_domain_totals(file_abspath, fileobj)))
+    else:
+        # if a wider top k is kept, the published top n is taken from its heaps
+        # trending needs each hour's top k kept for the next hour to compare to
+        top_k = max(TOP_K_SUPERSET or 0, TRENDING_TOP_K or 0)
+        heap_size = max(TOP_N_PAGEVIEWS, top_k)
+        if pool is not None and fileobj is None and read_index(file_abspath) is not None:
+            most_viewed_map = build_most_viewed_map_parallel(
+                file_abspath, pool, heap_size)
+        else:
+            most_viewed_map = build_most_viewed_map(
+                file_abspath, blacklist_set, heap_size, fileobj)
+
+        # the blacklist is only hashed once per process
+        digest = blacklist_digest() if top_k else None
+
+        if top_k:
+            persist_top_k(file_abspath, most_viewed_map, top_k, digest)
+
+        # the top k must be persisted first, see persist_trending
+        if TRENDING_TOP_K:
+            persist_trending(file_abspath, most_viewed_map, TRENDING_TOP_K, digest)
+
+        persist_results(file_abspath, most_viewed_map)
+
+    # an archive read from shared memory was never written to tmp
+    if fileobj is None:
+        retire_archive(file_abspath)
+
+    # only once the results are written and the archive is gone is the hour finished
+    journal.release(result_filename)
+    logger.info(f'finished processing {filename}')
+
+    return archive_bytes
+
+
+def analyze_segment(
+        item: SegmentItem,
+        free_segments: multiprocessing.Queue,
+        blacklist_set: Set[Tuple[str, str]]) -> Union[int, None]:
+    """performs analysis of top n pageviews on an archive handed over in a shared memory segment
+
+    Arguments:
+        item {SegmentItem} -- (segment name, size of the archive, filename of the archive)
+        free_segments {multiprocessing.Queue} -- queue the segment is given back to
+        blacklist_set {Set[Tuple[str, str]]} -- set of blacklisted (domain_code, page_names) tuples
+
+    Returns:
+        int, None -- size of the archive if it was analyzed, None if another process analyzed it or is analyzing it
+    """
+    name, size, filename = item
 
-    print(f'processing {filename}')
-    most_viewed_map = build_most_viewed_map(file_abspath, blacklist_set)
-    persist_results(file_abspath, most_viewed_map)
-    os.remove(file_abspath)
-    print(f'finished processing {filename}')
+    try:
+        # the path is only used for naming the results, nothing is read from tmp
+        with open_segment(name, size) as reader:
+            return analyze_file(
+                os.path.join(TMP_DIR, filename), blacklist_set, reader, archive_bytes=size)
+    finally:
+        # the downloader can reuse the segment for the next archive
+        free_segments.put(name)
 
 
 def build_most_viewed_map(
         file_abspath: str,
-        blacklist_set: Set[Tuple[str, str]]) -> Dict[str, List[Tuple[int, str]]]:
+        blacklist_set: Set[Tuple[str, str]],
+        top_n_pageviews: int = TOP_N_PAGEVIEWS,
+        fileobj=None) -> Dict[str, List[Tuple[int, str]]]:
     """get a dictionary of top n most viewed pages for each domain
 
     Arguments:
         file_abspath {string} -- path to gzip file to analyze
         blacklist_set {Set[Tuple[str, str]]} -- set of blacklisted (domain_code, page_names) tuples
 
+    Keyword Arguments:
+        top_n_pageviews {int} -- number of pages to keep for each domain (default: {config.TOP_N_PAGEVIEWS})
+        fileobj {file object, None} -- binary file object to read the archive from instead of file_abspath (default: {None})
+
+    Returns:
+        Dict[str, List[Tuple[int, str]]] -- keys are domains, values are lists of top n most viewed pages
+    """
+
+    # read the gzip file
+    with open_archive(file_abspath, fileobj) as f:
+        return heap_map_from_lines(f, blacklist_set, top_n_pageviews, file_abspath)
+
+
+def heap_map_from_lines(
+        lines: Iterable[str],
+        blacklist_set: Set[Tuple[str, str]],
+        top_n_pageviews: int,
+        source: str) -> Dict[str, List[Tuple[int, str]]]:
+    """get a dictionary of top n most viewed pages for each domain from lines of an archive
+
+    Arguments:
+        lines {Iterable[str]} -- lines of an archive, or part of one
+        blacklist_set {Set[Tuple[str, str]]} -- set of blacklisted (domain_code, page_names) tuples
+        top_n_pageviews {int} -- number of pages to keep for each domain
+        source {str} -- where the lines came from, for the malformed lines summary
+
     Returns:
         Dict[str, List[Tuple[int, str]]] -- keys are domains, values are lists of top n most viewed pages
     """
@@ -81,34 +249,196 @@ def build_most_viewed_map(
     # initialize our dictionary
     most_viewed_map = defaultdict(list)
 
-    # read the gzip file
-    with gzip.open(file_abspath, mode='rt') as f:
-        for line in f:
+    # malformed lines are counted, and only the first few are kept as examples
+    num_malformed = 0
+    malformed_sample = []
+
+    for line in lines:
+
+        # sometimes lines can be malformed
+        # e.g. too many elements after the split, or
+        # third value in split not an int
+        # this is especially common in earlier data dumps
+        # probably not worth crashing the process bc of unexpected data,
+        # so we just count them and move on
+        try:
+            domain_code, page_title, count_views = get_line_info(line)
+
+        # problematic lines are not added to most_viewed_map
+        # a sample of them is kept so that there's some record of them
+        except (AssertionError, ValueError):
+            num_malformed += 1
+            if len(malformed_sample) < MALFORMED_SAMPLE_SIZE:
+                malformed_sample.append(line.strip())
+            continue
+
+        # make sure that the domain and page are not blacklisted
+        if in_blacklist_set(domain_code, page_title, blacklist_set):
+            continue
+
+        # attempt to add item to heap
+        add_to_heap_map(most_viewed_map, domain_code,
+                        page_title, count_views, top_n_pageviews)
+
+    # one record per file, instead of one per malformed line
+    if num_malformed:
+        logger.warning(
+            f'{num_malformed} malformed lines in {source}, '
+            f'e.g. {malformed_sample}',
+            extra={'file': source,
+                   'num_malformed': num_malformed,
+                   'malformed_sample': malformed_sample})
 
-            # sometimes lines can be malformed
-            # e.g. too many elements after the split, or
-            # third value in split not an int
-            # this is especially common in earlier data dumps
-            # probably not worth crashing the process bc of unexpected data,
-            # so we just print and move on
-            try:
-                domain_code, page_title, count_views = get_line_info(line)
+    return most_viewed_map
+
+
+def build_most_viewed_map_parallel(
+        file_abspath: str,
+        pool: Pool,
+        top_n_pageviews: int = TOP_N_PAGEVIEWS,
+        domain: Union[str, None] = None) -> Dict[str, List[Tuple[int, str]]]:
+    """get a dictionary of top n most viewed pages for each domain, scanning the members of an indexed archive in parallel
+
+    Arguments:
+        file_abspath {str} -- path to an archive indexed by gzip_index.index_archive
+        pool {Pool} -- pool to scan members in, made with launcher.get_context().Pool
+
+    Keyword Arguments:
+        top_n_pageviews {int} -- number of pages to keep for each domain (default: {config.TOP_N_PAGEVIEWS})
+        domain {str, None} -- only scan the members that hold this domain, and only keep its pages (default: {None})
+
+    Raises:
+        ValueError: the archive isn't indexed
+
+    Returns:
+        Dict[str, List[Tuple[int, str]]] -- keys are domains, values are lists of top n most viewed pages
+    """
+    index = read_index(file_abspath)
+    if index is None:
+        raise ValueError(f'{file_abspath} is not indexed')
+
+    domain_sorted, members = index
+    if domain is not None:
+        members = members_for_domain(members, domain, domain_sorted)
+
+    # the scanning processes build the blacklist themselves, or start with it
+    # already built, rather than having it pickled per member
+    member_maps = pool.starmap(
+        scan_member,
+        [(file_abspath, member, top_n_pageviews, domain) for member in members])
+
+    # members are merged in order, so domains stay in the order of the archive
+    most_viewed_map = defaultdict(list)
+    for member_map in member_maps:
+        for domain_code, heap in member_map.items():
+            for count_views, page_title in heap:
+                add_to_heap_map(most_viewed_map, domain_code,
+                                page_title, count_views, top_n_pageviews)
+
+    return most_viewed_map
+
+
+def scan_member(
+        file_abspath: str,
+        member: Member,
+        top_n_pageviews: int,
+        domain: Union[str, None]) -> Dict[str, List[Tuple[int, str]]]:
+    """get a dictionary of top n most viewed pages for each domain in one member of an indexed archive
+
+    Arguments:
+        file_abspath {str} -- path to the indexed archive
+        member {Member} -- member to scan
+        top_n_pageviews {int} -- number of pages to keep for each domain
+        domain {str, None} -- only keep this domain's pages, None for every domain
+
+    Returns:
+        Dict[str, List[Tuple[int, str]]] -- keys are domains, values are lists of top n most viewed pages
+    """
+    lines = read_member(file_abspath, member)
+
+    if domain is not None:
+        lines = [line for line in lines if line.startswith(domain + ' ')]
+
+    return dict(heap_map_from_lines(
+        lines, load_blacklist_set(), top_n_pageviews,
+        f'{file_abspath} at offset {member[0]}'))
+
+
+def analyze_domain(
+        file_abspath: str,
+        domain: str,
+        pool: Pool,
+        top_n_pageviews: int = TOP_N_PAGEVIEWS) -> str:
+    """get the top n most viewed pages of one domain in an archive, and write them to the domain's results directory
+
+    an indexed archive only has the members that can hold the domain decompressed, in parallel,
+    any other archive is read whole, but only the domain's lines are parsed
+
+    Arguments:
+        file_abspath {str} -- path to a pageviews archive
+        domain {str} -- domain code, e.g. "en"
+        pool {Pool} -- pool to scan an indexed archive's members in, made with launcher.get_context().Pool
+
+    Keyword Arguments:
+        top_n_pageviews {int} -- number of pages to keep (default: {config.TOP_N_PAGEVIEWS})
+
+    Returns:
+        str -- path to the domain's results file for the hour
+    """
+    if read_index(file_abspath) is not None:
+        most_viewed_map = build_most_viewed_map_parallel(
+            file_abspath, pool, top_n_pageviews, domain)
+    else:
+        prefix = domain + ' '
+        with open_archive(file_abspath) as f:
+            most_viewed_map = heap_map_from_lines(
+                (line for line in f if line.startswith(prefix)),
+                load_blacklist_set(), top_n_pageviews, file_abspath)
+
+    # the hour's full results file is left alone
+    domain_dir = os.path.join(DOMAIN_RESULTS_DIR, domain)
+    os.makedirs(domain_dir, exist_ok=True)
 
-            # problematic lines are not added to most_viewed_map
-            # we print them so that there's some record of them
+    result_path = os.path.join(
+        domain_dir, filename_from_path(file_abspath, remove_gz=True))
+    with atomic_open(result_path) as f:
+        f.writelines(results_to_lines(most_viewed_map, top_n_pageviews))
+
+    return result_path
+
+
+def build_domain_totals(file_abspath: str, fileobj=None) -> Dict[str, int]:
+    """get the total views of each domain from a projectviews file
+
+    Arguments:
+        file_abspath {string} -- path to projectviews file to analyze
+
+    Keyword Arguments:
+        fileobj {file object, None} -- binary file object to read the file from instead of file_abspath (default: {None})
+
+    Returns:
+        Dict[str, int] -- keys are domains, values are total count_views
+    """
+    totals = defaultdict(int)
+    num_malformed = 0
+
+    with open_archive(file_abspath, fileobj) as f:
+        for line in f:
+            # projectviews lines look like pageviews lines, with "-" as the page title
+            try:
+                domain_code, _, count_views = get_line_info(line)
             except (AssertionError, ValueError):
-                print(f'malformed line in {file_abspath}: {line.strip()}')
+                num_malformed += 1
                 continue
 
-            # make sure that the domain and page are not blacklisted
-            if in_blacklist_set(domain_code, page_title, blacklist_set):
-                continue
+            totals[domain_code] += count_views
 
-            # attempt to add item to heap
-            add_to_heap_map(most_viewed_map, domain_code,
-                            page_title, count_views)
+    if num_malformed:
+        logger.warning(
+            f'{num_malformed} malformed lines in {file_abspath}',
+            extra={'file': file_abspath, 'num_malformed': num_malformed})
 
-    return most_viewed_map
+    return totals
 
 
 def get_line_info(line: str) -> Tuple[str, str, int]:
@@ -198,21 +528,160 @@ def persist_results(
     """
 
     filename = filename_from_path(abspath, remove_gz=True)
+    write_results(filename, results_to_lines(most_viewed_map))
+
+
+def results_to_lines(
+        most_viewed_map: Dict[str, List[Tuple[int, str]]],
+        top_n_pageviews: int = TOP_N_PAGEVIEWS) -> List[str]:
+    """format the top n pages of each domain in most_viewed_map as lines of a results file
+
+    Arguments:
+        most_viewed_map {Dict[str, List[Tuple[int, str]]]} -- keys are domains, values are heaps of at least the top n most viewed pages per domain
+
+    Keyword Arguments:
+        top_n_pageviews {int} -- number of pages to write for each domain (default: {config.TOP_N_PAGEVIEWS})
+
+    Returns:
+        List[str] -- lines of the form "domain page_title count_views\n"
+    """
+    lines = []
+
+    # iterate through most_viewed_map
+    # python dicts remember the order of insertion,
+    # so as long as the archives are alphabetized by domain,
+    # the output will be alphabetized by domain as well
+    for domain, heap in most_viewed_map.items():
+        # the heaps may hold more than n pages if a wider top k is kept,
+        # and are left intact so they can be written out more than once
+        # this saves our records in increasing order
+        for page_view_tuple in reversed(heapq.nlargest(top_n_pageviews, heap)):
+            lines.append(
+                f'{domain} {page_view_tuple[1]} {page_view_tuple[0]}\n')
+
+    return lines
+
+
+def totals_to_lines(totals: Dict[str, int]) -> List[str]:
+    """format the total views of each domain as lines of a results file
+
+    Arguments:
+        totals {Dict[str, int]} -- keys are domains, values are total count_views
+
+    Returns:
+        List[str] -- lines of the form "domain count_views\n"
+    """
+    return [f'{domain} {count_views}\n' for domain, count_views in totals.items()]
+
+
+def persist_top_k(
+        abspath: str,
+        most_viewed_map: Dict[str, List[Tuple[int, str]]],
+        top_k: int = TOP_K_SUPERSET,
+        digest: Union[bytes, None] = None):
+    """save the wider top k pages of each domain to a binary file in the top k directory
+
+    Arguments:
+        abspath {str} -- name of the file to persist
+        most_viewed_map {Dict[str, List[Tuple[int, str]]]} -- keys are domains, values are heaps of the top k most viewed pages per domain
+
+    Keyword Arguments:
+        top_k {int} -- number of pages to keep for each domain (default: {config.TOP_K_SUPERSET})
+        digest {bytes, None} -- blacklist_digest() of the blacklist the map was built with, None to get it here (default: {None})
+    """
+    filename = filename_from_path(abspath, remove_gz=True)
+    write_top_k(
+        os.path.join(TOP_K_DIR, filename), most_viewed_map,
+        top_k, digest or blacklist_digest())
+
+
+def persist_trending(
+        abspath: str,
+        most_viewed_map: Dict[str, List[Tuple[int, str]]],
+        k: int = TRENDING_TOP_K,
+        digest: Union[bytes, None] = None):
+    """write the trending files that can be computed now that an hour is analyzed
+
+    hours can finish out of order, so this compares the hour to the previous one,
+    and the next one to this one if the next one finished first. the hour's top k
+    must already be persisted, so of two neighbouring hours finishing at once, at
+    least one sees the other's
+
+    Arguments:
+        abspath {str} -- path to the analyzed archive
+        most_viewed_map {Dict[str, List[Tuple[int, str]]]} -- keys are domains, values are heaps of at least the top k most viewed pages per domain
+
+    Keyword Arguments:
+        k {int} -- number of pages to compare for each domain (default: {config.TRENDING_TOP_K})
+        digest {bytes, None} -- blacklist_digest() of the blacklist the map was built with, None to get it here (default: {None})
+    """
+    filename = filename_from_path(abspath, remove_gz=True)
+    digest = digest or blacklist_digest()
+
+    previous_hour = adjacent_hour(filename, -1)
+    previous_map = load_state(previous_hour, k, digest, TOP_K_DIR)
+    if previous_map is not None:
+        write_trending(
+            filename, compare_hours(previous_map, most_viewed_map, k),
+            TRENDING_DIR)
+
+    next_hour = adjacent_hour(filename, 1)
+    if os.path.exists(trending_path(next_hour, TRENDING_DIR)):
+        return
+
+    next_map = load_state(next_hour, k, digest, TOP_K_DIR)
+    if next_map is not None:
+        write_trending(
+            next_hour, compare_hours(most_viewed_map, next_map, k),
+            TRENDING_DIR)
+
+
+def write_results(filename: str, lines: List[str]):
+    """write the lines of a results file to the results directory, or append them to their container
+
+    Arguments:
+        filename {str} -- name of the results file, e.g. "pageviews-20200501-100000"
+        lines {List[str]} -- lines produced by results_to_lines
+    """
+    if RESULTS_FORMAT == 'sharded':
+        append_hour(filename, lines)
+        return
 
     # path to save file to
     result_path = os.path.join(RESULTS_DIR, filename)
 
-    with open(result_path, 'w+') as f:
-        # iterate through most_viewed_map
-        # python dicts remember the order of insertion,
-        # so as long as the archives are alphabetized by domain,
-        # the output will be alphabetized by domain as well
-        for domain, heap in most_viewed_map.items():
-            while len(heap) > 0:
-                # this saves our records in increasing order
-                page_view_tuple = heapq.heappop(heap)
-                result = f'{domain} {page_view_tuple[1]} {page_view_tuple[0]}\n'
-                f.write(result)
+    # a crash mid-write must not leave a truncated file that looks finished
+    with atomic_open(result_path) as f:
+        f.writelines(lines)
+
+
+def has_results(filename: str) -> bool:
+    """check if the results for an hour have been written
+
+    Arguments:
+        filename {str} -- name of the results file, e.g. "pageviews-20200501-100000"
+
+    Returns:
+        bool -- True if the results file, or the hour in its container, exists
+    """
+    if os.path.exists(os.path.join(RESULTS_DIR, filename)):
+        return True
+
+    # only the container's index is read, none of its hours are decompressed
+    return has_hour(filename)
+
+
+@lru_cache(maxsize=None)
+def load_blacklist_set() -> FrozenSet[Tuple[str, str]]:
+    """get the blacklist set, building it only the first time this is called in a process
+
+    forked processes inherit the built set, so file processors started while
+    a run is scaling up don't have to parse the blacklist file again
+
+    Returns:
+       FrozenSet[Tuple[str, str]] -- set of blacklisted (domain_code, page_names) tuples
+    """
+    return frozenset(make_blacklist_set())
 
 
 def make_blacklist_set() -> Set[Tuple[str, str]]:
@@ -221,20 +690,32 @@ def make_blacklist_set() -> Set[Tuple[str, str]]:
     Returns:
        Set[Tuple[str, str]] -- set of blacklisted (domain_code, page_names) tuples
     """
-    blacklist_file = os.path.join(ROOT_DIR, 'blacklist_domains_and_pages')
     blacklist_set = set()
 
-    with open(blacklist_file, 'r') as f:
+    with open(BLACKLIST_FILE, 'r') as f:
         for line in f:
             try:
                 add_to_blacklist(line, blacklist_set)
             except AssertionError:
                 # there's one line that I'm not sure how to handle, so I skip it
-                print(f'malformed blacklist line: {line.strip()}')
+                logger.warning(f'malformed blacklist line: {line.strip()}')
 
     return blacklist_set
 
 
+@lru_cache(maxsize=None)
+def blacklist_digest() -> bytes:
+    """get a fingerprint of the blacklist file, so outputs can record which blacklist they used
+
+    like load_blacklist_set, the file is only read and hashed the first time this is called in a process
+
+    Returns:
+        bytes -- sha1 digest of the blacklist file
+    """
+    with open(BLACKLIST_FILE, 'rb') as f:
+        return hashlib.sha1(f.read()).digest()
+
+
 def add_to_blacklist(line: str, blacklist_set: Set[Tuple[str, str]]):
     """add data from a line of the blacklist file to the blacklist_set
 
@@ -0,0 +1,120 @@
+import logging
+import os
+import glob
+import shutil
+
+from typing import List, Union
+
+from .config import ARCHIVE_CACHE_DIR, ARCHIVE_CACHE_BYTES
+from .gzip_index import index_path
+
+logger = logging.getLogger(__name__)
+
+
+def cached_archive(
+        filename: str,
+        cache_dir: Union[str, None] = ARCHIVE_CACHE_DIR) -> Union[str, None]:
+    """look for an archive in the cache, marking it as recently used if found
+
+    Arguments:
+        filename {str} -- name of the gzip archive, e.g. "pageviews-20200501-100000.gz"
+
+    Keyword Arguments:
+        cache_dir {str, None} -- directory of the archive cache, None if caching is off (default: {config.ARCHIVE_CACHE_DIR})
+
+    Returns:
+        str, None -- path to the cached archive, or None if it is not cached
+    """
+    if not cache_dir:
+        return None
+
+    path = os.path.join(cache_dir, filename)
+    if not os.path.exists(path):
+        return None
+
+    # mtime is used as the "last used" time for eviction
+    os.utime(path)
+    return path
+
+
+def retire_archive(
+        file_abspath: str,
+        cache_dir: Union[str, None] = ARCHIVE_CACHE_DIR,
+        cache_bytes: int = ARCHIVE_CACHE_BYTES):
+    """get rid of an archive once it has been analyzed, keeping it in the cache if caching is on
+
+    Arguments:
+        file_abspath {str} -- path to the analyzed gzip archive
+
+    Keyword Arguments:
+        cache_dir {str, None} -- directory of the archive cache, None if caching is off (default: {config.ARCHIVE_CACHE_DIR})
+        cache_bytes {int} -- size the cache is trimmed down to (default: {config.ARCHIVE_CACHE_BYTES})
+    """
+    if not cache_dir:
+        os.remove(file_abspath)
+        return
+
+    dest = os.path.join(cache_dir, os.path.basename(file_abspath))
+
+    # archives read straight out of the cache stay where they are
+    if os.path.abspath(file_abspath) != os.path.abspath(dest):
+        shutil.move(file_abspath, dest)
+
+    os.utime(dest)
+    evict(cache_dir, cache_bytes)
+
+
+def evict(cache_dir: str, cache_bytes: int):
+    """delete the least recently used archives until the cache fits in its budget
+
+    Arguments:
+        cache_dir {str} -- directory of the archive cache
+        cache_bytes {int} -- size the cache is trimmed down to
+    """
+    stats = []
+    for path in cached_archives(cache_dir):
+        try:
+            stats.append((os.stat(path), path))
+        # another process may have evicted it already
+        except FileNotFoundError:
+            continue
+
+    total = sum(stat.st_size for stat, _ in stats)
+
+    # oldest mtime first
+    stats.sort(key=lambda x: x[0].st_mtime)
+
+    for stat, path in stats:
+        if total <= cache_bytes:
+            break
+
+        try:
+            os.remove(path)
+            logger.info(f'evicted {os.path.basename(path)} from archive cache')
+        except FileNotFoundError:
+            pass
+
+        # archives indexed with --index-cache have an index next to them
+        try:
+            os.remove(index_path(path))
+        except FileNotFoundError:
+            pass
+
+        total -= stat.st_size
+
+
+def cached_archives(cache_dir: Union[str, None] = ARCHIVE_CACHE_DIR) -> List[str]:
+    """list the archives in the cache
+
+    Keyword Arguments:
+        cache_dir {str, None} -- directory of the archive cache, None if caching is off (default: {config.ARCHIVE_CACHE_DIR})
+
+    Returns:
+        List[str] -- paths to cached archives, sorted by name
+    """
+    if not cache_dir:
+        return []
+
+    # the cache only holds archives, of any dataset, and a partially written
+    # archive starts with a dot so it isn't matched
+    return sorted(glob.glob(os.path.join(cache_dir, '*')))
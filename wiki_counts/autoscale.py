@@ -0,0 +1,41 @@
+from typing import Union
+
+
+def target_num_processors(
+        queue_depth: int,
+        num_running: int,
+        cpu_count: int,
+        load_average: float,
+        min_processors: int,
+        max_processors: Union[int, None]) -> int:
+    """decide how many file processors should be running
+
+    the pool grows by one while files are waiting and there are idle cpus,
+    and shrinks by one while nothing is waiting, so it follows the downloader
+    without thrashing
+
+    Arguments:
+        queue_depth {int} -- number of downloaded gzips waiting to be analyzed
+        num_running {int} -- number of file processors currently running
+        cpu_count {int} -- number of cpus on this machine
+        load_average {float} -- one minute load average of this machine
+        min_processors {int} -- never go below this many file processors
+        max_processors {int, None} -- never go above this many file processors, None for one less than cpu_count
+
+    Returns:
+        int -- number of file processors that should be running
+    """
+    # leave a cpu for the downloader
+    upper = max(1, cpu_count - 1)
+    if max_processors is not None:
+        upper = min(upper, max_processors)
+
+    target = num_running
+
+    # only add a processor if the machine has a cpu to give it
+    if queue_depth > num_running and load_average < cpu_count:
+        target += 1
+    elif queue_depth == 0:
+        target -= 1
+
+    return max(min_processors, min(upper, target))
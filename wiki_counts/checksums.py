@@ -0,0 +1,129 @@
+import logging
+import time
+
+from aiohttp import ClientSession, ClientError, ClientResponseError
+from typing import Dict, Tuple, Union
+
+from .config import MD5SUMS_FILENAME, MD5SUMS_REFRESH_INTERVAL
+from .utils import filename_from_path
+
+logger = logging.getLogger(__name__)
+
+# md5 sums fetched by this process, by the url of their month's md5sums.txt
+# each is (time.time() when fetched, {archive filename: md5})
+_md5sums: Dict[str, Tuple[float, Dict[str, str]]] = {}
+
+
+class ChecksumMismatchError(Exception):
+    """a downloaded archive doesn't match the md5 published for it"""
+
+    def __init__(self, filename: str, expected: str, actual: str):
+        super().__init__(f'{filename} has md5 {actual}, expected {expected}')
+        self.filename = filename
+        self.expected = expected
+        self.actual = actual
+
+
+def md5sums_url(url: str) -> str:
+    """get the url of the md5 sums published alongside a dump
+
+    Arguments:
+        url {str} -- url of an hour's dump
+
+    Returns:
+        str -- url of the md5sums.txt in the dump's month directory
+    """
+    return f'{url.rsplit("/", 1)[0]}/{MD5SUMS_FILENAME}'
+
+
+def parse_md5sums(text: str) -> Dict[str, str]:
+    """parse an md5sums.txt, which has one "<md5>  <filename>" line per file
+
+    Arguments:
+        text {str} -- contents of md5sums.txt
+
+    Returns:
+        Dict[str, str] -- md5 of each filename
+    """
+    md5sums = {}
+
+    for line in text.splitlines():
+        split = line.split()
+        if len(split) == 2:
+            md5, filename = split
+            md5sums[filename] = md5.lower()
+
+    return md5sums
+
+
+async def fetch_md5sums(session: ClientSession, url: str) -> Dict[str, str]:
+    """download and parse a month's md5 sums
+
+    Arguments:
+        session {ClientSession} -- handles async http
+        url {str} -- url of the md5sums.txt
+
+    Returns:
+        Dict[str, str] -- md5 of each filename, empty if they couldn't be downloaded
+    """
+    try:
+        async with session.get(url) as response:
+            response.raise_for_status()
+            text = await response.text()
+    except ClientResponseError as e:
+        # archives just go unverified, rather than not being downloaded at all
+        logger.warning(f'code {e.status}: could not get md5 sums from {url}')
+        return {}
+    except ClientError as e:
+        logger.warning(f'could not get md5 sums from {url}: {e!r}')
+        return {}
+
+    return parse_md5sums(text)
+
+
+async def expected_md5(
+        session: ClientSession,
+        url: str,
+        refresh_interval: float = MD5SUMS_REFRESH_INTERVAL) -> Union[str, None]:
+    """get the published md5 of a dump, fetching its month's md5 sums if they aren't cached
+
+    Arguments:
+        session {ClientSession} -- handles async http
+        url {str} -- url of an hour's dump
+
+    Keyword Arguments:
+        refresh_interval {float} -- seconds before a month's md5 sums are fetched again for a missing archive (default: {config.MD5SUMS_REFRESH_INTERVAL})
+
+    Returns:
+        str, None -- md5 of the dump, or None if none is published for it
+    """
+    filename = filename_from_path(url)
+    sums_url = md5sums_url(url)
+    fetched_at, md5sums = _md5sums.get(sums_url, (None, {}))
+
+    # an archive published since the md5 sums were fetched won't be in them yet
+    stale = fetched_at is None or time.time() - fetched_at >= refresh_interval
+    if filename not in md5sums and stale:
+        md5sums = await fetch_md5sums(session, sums_url)
+        _md5sums[sums_url] = (time.time(), md5sums)
+
+    md5 = md5sums.get(filename)
+    if md5 is None:
+        logger.debug(f'no md5 published for {filename}')
+
+    return md5
+
+
+def verify_md5(filename: str, actual: str, expected: Union[str, None]):
+    """check the md5 of a downloaded archive against the published one
+
+    Arguments:
+        filename {str} -- name of the archive
+        actual {str} -- hex md5 of the downloaded archive
+        expected {str, None} -- published hex md5, None if none is published
+
+    Raises:
+        ChecksumMismatchError: the md5s don't match
+    """
+    if expected is not None and actual != expected:
+        raise ChecksumMismatchError(filename, expected, actual)
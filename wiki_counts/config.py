@@ -10,26 +10,251 @@ TMP_DIR = os.path.join(ROOT_DIR, 'tmp')
 # directory that contains the final results
 RESULTS_DIR = os.path.join(ROOT_DIR, 'results')
 
+# how results are stored: 'text' writes one file per hour to RESULTS_DIR,
+# 'sharded' appends each hour, compressed, to one container per SHARD_PERIOD in SHARDS_DIR
+RESULTS_FORMAT = 'text'
+
+# 'day' or 'month', the period of results kept together in one container
+SHARD_PERIOD = 'day'
+
+# directory that contains the result containers
+SHARDS_DIR = os.path.join(ROOT_DIR, 'shards')
+
+# directory that records which hours are being analyzed, and by which process
+JOURNAL_DIR = os.path.join(ROOT_DIR, 'journal')
+
+# seconds before an empty journal entry, which has no pid to check, is treated as abandoned
+JOURNAL_EMPTY_ENTRY_SECONDS = 60
+
+# sqlite database of the jobs submitted with --submit, and the hours they cover
+JOBS_DB = os.path.join(ROOT_DIR, 'jobs.sqlite')
+
+# number of hours --run-jobs claims from the job queue at a time
+JOBS_CLAIM_HOURS = 24
+
+# seconds between checks of the job queue, by --run-jobs when every hour is claimed
+# and by --wait while its job is unfinished
+JOBS_POLL_INTERVAL = 10
+
 # earliest date the wikipedia has pageview data for
 EARLIEST_DATE = '2015-05-01T01:00:00+00:00'
 
 # wiki pageview dump root url
 ROOT_URL = 'https://dumps.wikimedia.org/other/pageviews/'
 
+# hourly datasets published under ROOT_URL, and the name of each one's file for an hour
+# pageviews has views per page, projectviews only has total views per domain
+# but is a few KB instead of hundreds of MB
+DATASETS = {
+    'pageviews': 'pageviews-%Y%m%d-%H0000.gz',
+    'projectviews': 'projectviews-%Y%m%d-%H0000',
+}
+
+# dataset downloaded when none is given
+DEFAULT_DATASET = 'pageviews'
+
+# glob that matches the downloaded files of every dataset
+ARCHIVE_GLOB = '*views-*-*'
+
+# order hours are downloaded and analyzed in when catching up on a range
+# 'oldest' goes start to end, 'newest' goes end to start, and 'interleaved'
+# alternates between the newest and the oldest hours left
+SCHEDULE_ORDERS = ('oldest', 'newest', 'interleaved')
+DEFAULT_SCHEDULE_ORDER = 'oldest'
+
 # number of async threads that will be downloading from wikipedia
 # too many workers will produce 503 errors and increase overhead
 # based on testing, 3 is the max safe number
 DEFAULT_NUM_DOWNLOADERS = 3
 
+# bytes read from a response at a time while a download is streamed and checksummed
+DOWNLOAD_CHUNK_BYTES = 1024 ** 2
+
+# connections to the mirror are kept open for this many seconds between downloads
+HTTP_KEEPALIVE_SECONDS = 60
+
+# seconds the mirror's resolved address is reused before it is looked up again
+HTTP_DNS_CACHE_SECONDS = 5 * 60
+
+# seconds to wait for a connection, and for any data on an open one, before a download
+# is abandoned and retried. there is no limit on a whole download, which can take a
+# long time for a big archive on a slow link as long as data keeps arriving
+HTTP_CONNECT_TIMEOUT = 30
+HTTP_READ_TIMEOUT = 60
+
+# bytes a connection buffers from its socket, sized for archives of hundreds of MB
+# (aiohttp 3.7 or later, older versions keep their own default)
+HTTP_READ_BUFSIZE = 4 * 1024 ** 2
+
+# times an archive is downloaded before it is skipped, when its download is corrupt
+# or doesn't match the md5 published for it
+DOWNLOAD_MAX_ATTEMPTS = 3
+
+# file of md5 sums wikimedia publishes in each month's directory of dumps
+MD5SUMS_FILENAME = 'md5sums.txt'
+
+# seconds before a month's md5 sums are fetched again for an archive missing from them,
+# since the current month's are only added to as hours are published
+MD5SUMS_REFRESH_INTERVAL = 10 * 60
+
 # number of file processors that will process the downloaded gzips
 DEFAULT_NUM_FILE_PROCESSORS = 1
 
+# bounds on the number of file processors while the pool is scaled up and down
+# with the queue of downloaded gzips, None for one less than the number of cpus
+MIN_FILE_PROCESSORS = 1
+MAX_FILE_PROCESSORS = None
+
+# seconds between decisions to start or retire a file processor
+AUTOSCALE_INTERVAL = 10
+
+# how the downloader and file processors are started
+# 'forkserver' forks them from a server process that has already imported wiki_counts
+# and built the blacklist, so they start warm without copying this process's threads,
+# 'fork' copies this process, and 'spawn' starts each one from scratch
+START_METHOD = 'forkserver'
+
+# number of shared memory segments downloaded archives are handed to the file processors in,
+# instead of being written to tmp, None always goes through tmp
+# memory used is capped at SHM_SEGMENTS * SHM_SEGMENT_BYTES, and this is only used
+# when ARCHIVE_CACHE_DIR is None, since cached archives have to be on disk anyway
+SHM_SEGMENTS = None
+
+# size of each shared memory segment, archives bigger than this go through tmp
+SHM_SEGMENT_BYTES = 512 * 1024 ** 2
+
+# uncompressed bytes of a gzip archive each file processor inflates at a time in a read-ahead
+# thread, while it parses the block before, None reads archives with gzip on one thread
+# off until a benchmark on a host with a spare core per file processor shows it helps,
+# 1024 ** 2 is a good size to start from
+READAHEAD_BLOCK_BYTES = None
+
+# number of blocks each file processor's read-ahead thread inflates into and reuses,
+# 2 parses one block while the next is inflated
+READAHEAD_BUFFERS = 2
+
 # capture the top {TOP_N_PAGEVIEWS} most viewed pages for each domain
 TOP_N_PAGEVIEWS = 25
 
+# also keep the top {TOP_K_SUPERSET} pages for each domain in a compact binary file per hour,
+# so any top n up to this size can be read back without reprocessing, None turns this off
+TOP_K_SUPERSET = None
+
+# directory that contains the binary top k files
+TOP_K_DIR = os.path.join(ROOT_DIR, 'top_k')
+
+# compare the top {TRENDING_TOP_K} pages of each domain to the previous hour's as every hour
+# is analyzed, and write their rank and view changes and the new entrants to TRENDING_DIR,
+# None turns this off. each hour's top k is kept in TOP_K_DIR for the next hour to compare to
+TRENDING_TOP_K = None
+
+# directory that contains the hour over hour trending files
+TRENDING_DIR = os.path.join(ROOT_DIR, 'trending')
+
+# file of domains and page titles that are left out of the analysis
+BLACKLIST_FILE = os.path.join(ROOT_DIR, 'blacklist_domains_and_pages')
+
+# directory that analyzed gzip archives are kept in so they can be re-analyzed without
+# downloading them again, None deletes archives once they are analyzed
+# e.g. os.path.join(ROOT_DIR, 'archive_cache')
+ARCHIVE_CACHE_DIR = None
+
+# once the archive cache grows past this many bytes, the least recently used archives are deleted
+ARCHIVE_CACHE_BYTES = 50 * 1024 ** 3
+
+# uncompressed bytes of lines in each gzip member when a cached archive is indexed
+# with --index-cache, so it can be scanned in parallel or from a given domain on
+ARCHIVE_INDEX_MEMBER_BYTES = 4 * 1024 ** 2
+
+# directory that --reanalyze --domain writes one domain's top pages to, in a directory per domain
+DOMAIN_RESULTS_DIR = os.path.join(ROOT_DIR, 'domain_results')
+
+# file that the size and duration of every download and analysis are appended to,
+# which --plan estimates backfills from, None stops recording them
+THROUGHPUT_HISTORY_FILE = os.path.join(ROOT_DIR, 'throughput.jsonl')
+
+# number of the most recent downloads and analyses of a dataset that --plan estimates from
+PLAN_HISTORY_RECORDS = 1000
+
+# number of the most recent records the throughput history keeps, enough for
+# PLAN_HISTORY_RECORDS downloads and analyses of every dataset
+THROUGHPUT_HISTORY_RECORDS = 2 * len(DATASETS) * PLAN_HISTORY_RECORDS
+
+# size the throughput history can grow to before it's trimmed to THROUGHPUT_HISTORY_RECORDS
+THROUGHPUT_HISTORY_BYTES = 4 * 1024 ** 2
+
+# minimum level of log records that are written
+LOG_LEVEL = 'INFO'
+
+# file that log records are also written to, None for only stderr
+LOG_FILE = None
+
+# number of malformed lines from each archive that are included in its log summary
+MALFORMED_SAMPLE_SIZE = 5
+
+# port the coordinator listens on when hours are distributed across hosts
+DEFAULT_COORDINATOR_PORT = 50000
+
+# environment variable that holds the shared secret workers authenticate with the coordinator by
+# the coordinator runs what authenticated workers send it, so there is no default secret
+# and neither the coordinator nor the workers start without one
+COORDINATOR_AUTHKEY_ENV = 'WIKI_COUNTS_AUTHKEY'
+
+# address the coordinator listens on, '' for every interface
+DEFAULT_COORDINATOR_BIND = 'localhost'
+
+# seconds a worker may hold an hour before the coordinator hands it to another worker
+LEASE_TIMEOUT = 30 * 60
+
+# seconds between a worker's renewals of the lease on the hour it is downloading and analyzing
+LEASE_RENEW_INTERVAL = 60
+
+# seconds a worker waits before asking again when every remaining hour is leased
+LEASE_POLL_INTERVAL = 5
+
+# seconds --daemon waits between checks for an hour's dump that isn't published yet,
+# doubling after every check from DAEMON_POLL_MIN up to DAEMON_POLL_MAX
+DAEMON_POLL_MIN = 60
+DAEMON_POLL_MAX = 10 * 60
+
+# seconds after the end of an hour that --daemon stops waiting for its dump and moves on
+DAEMON_GIVE_UP_AFTER = 6 * 60 * 60
+
+# port the results query service listens on
+DEFAULT_QUERY_PORT = 8080
+
+# number of parsed results files the query service keeps in memory
+QUERY_CACHE_HOURS = 512
+
+# most hours a range query may cover, kept well under QUERY_CACHE_HOURS so that one
+# range query can't push every frequently asked hour out of the cache
+QUERY_MAX_RANGE_HOURS = 7 * 24
+
+# file that maps page titles to the integer ids the query service holds them as
+TITLE_DICT_FILE = os.path.join(ROOT_DIR, 'titles')
+
+# seconds between saves of the titles given ids since the last save, which is also
+# saved when the query service stops
+TITLE_SAVE_INTERVAL = 60
+
 # make the dirs, if they don't exist already
 if not os.path.exists(TMP_DIR):
     os.makedirs(TMP_DIR)
 
 if not os.path.exists('results'):
     os.makedirs(RESULTS_DIR)
+
+if not os.path.exists(JOURNAL_DIR):
+    os.makedirs(JOURNAL_DIR)
+
+if RESULTS_FORMAT == 'sharded' and not os.path.exists(SHARDS_DIR):
+    os.makedirs(SHARDS_DIR)
+
+if (TOP_K_SUPERSET or TRENDING_TOP_K) and not os.path.exists(TOP_K_DIR):
+    os.makedirs(TOP_K_DIR)
+
+if TRENDING_TOP_K and not os.path.exists(TRENDING_DIR):
+    os.makedirs(TRENDING_DIR)
+
+if ARCHIVE_CACHE_DIR and not os.path.exists(ARCHIVE_CACHE_DIR):
+    os.makedirs(ARCHIVE_CACHE_DIR)
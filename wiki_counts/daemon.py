@@ -0,0 +1,200 @@
+import logging
+import os
+import asyncio
+import multiprocessing
+import pandas as pd
+
+from aiohttp import ClientSession, ClientError
+from typing import Union
+
+from .config import DAEMON_POLL_MIN, DAEMON_POLL_MAX, DAEMON_GIVE_UP_AFTER, \
+    DOWNLOAD_MAX_ATTEMPTS, TMP_DIR
+from .parse_dates import date_to_url
+from .download import download_file_from_url
+from .session import make_session
+from .checksums import ChecksumMismatchError
+from .analyze import has_results
+from .utils import killswitch_on_exception, ignore_interrupts, filename_from_path
+from .log import setup_logging, report_startup
+
+logger = logging.getLogger(__name__)
+
+
+@killswitch_on_exception
+def follow_hours(
+        first_hour: pd.Timestamp,
+        dataset: str,
+        pageviews_queue: multiprocessing.Queue,
+        free_segments: Union[multiprocessing.Queue, None],
+        downloads_done: multiprocessing.Value,
+        launched_at: float,
+        process_killswitch: multiprocessing.Value):
+    """driver function for the daemon's downloader, which downloads every hour from first_hour on as it is published
+
+    Arguments:
+        first_hour {Timestamp} -- first hour to download
+        dataset {str} -- which of config.DATASETS to download
+        pageviews_queue {multiproccesing.Queue} -- queue that passes paths to downloaded gzips to the file analyzing process
+        free_segments {multiprocessing.Queue, None} -- queue of free shared memory segments to hand archives over in, None to always write them to tmp
+        downloads_done {multiproccesing.Value[bool]} -- set once the daemon stops, so the file analyzers drain the queue and exit
+        launched_at {float} -- time.time() when the process was launched, to report how long it took to start
+        process_killswitch {multiprocessing.Value[bool]} -- flag that stops the daemon
+    """
+    setup_logging()
+    ignore_interrupts()
+    report_startup(launched_at, 'daemon downloader')
+
+    asyncio.run(
+        run_follow_hours(
+            first_hour, dataset, pageviews_queue, free_segments,
+            process_killswitch))
+
+    downloads_done.value = True
+
+
+async def run_follow_hours(
+        first_hour: pd.Timestamp,
+        dataset: str,
+        pageviews_queue: multiprocessing.Queue,
+        free_segments: Union[multiprocessing.Queue, None],
+        process_killswitch: multiprocessing.Value,
+        poll_min: float = DAEMON_POLL_MIN,
+        poll_max: float = DAEMON_POLL_MAX,
+        give_up_after: float = DAEMON_GIVE_UP_AFTER):
+    """download each hour as soon as it is published, one after another, until the killswitch is thrown
+
+    Arguments:
+        first_hour {Timestamp} -- first hour to download
+        dataset {str} -- which of config.DATASETS to download
+        pageviews_queue {multiproccesing.Queue} -- queue that passes paths to downloaded gzips to the file analyzing process
+        free_segments {multiprocessing.Queue, None} -- queue of free shared memory segments, None to always write archives to tmp
+        process_killswitch {multiprocessing.Value[bool]} -- flag that stops the daemon
+
+    Keyword Arguments:
+        poll_min {float} -- seconds between the first checks for an unpublished hour (default: {config.DAEMON_POLL_MIN})
+        poll_max {float} -- most seconds between checks, once backed off (default: {config.DAEMON_POLL_MAX})
+        give_up_after {float} -- seconds after the end of an hour to stop waiting for it (default: {config.DAEMON_GIVE_UP_AFTER})
+    """
+    hour = first_hour
+    failed_attempts = 0
+
+    # one session for the life of the daemon, so connections are reused
+    # hours are downloaded one at a time, so it only needs one connection
+    async with make_session(1) as session:
+        while not process_killswitch.value:
+            url = date_to_url(hour, set(), dataset)
+            filename = filename_from_path(url, remove_gz=True)
+
+            # catching up after a restart, archives left in tmp were already queued
+            if has_results(filename) or \
+                    os.path.exists(os.path.join(TMP_DIR, filename_from_path(url))):
+                hour += pd.Timedelta(hours=1)
+                continue
+
+            # a file's timestamp is the end of the hour it covers, so it can't exist before then
+            not_before = (hour - pd.Timestamp.utcnow()).total_seconds()
+            if not_before > 0:
+                logger.info(f'waiting {not_before:.0f}s for the end of the hour of {filename}')
+                await sleep_unless_killed(not_before, process_killswitch)
+                continue
+
+            give_up_at = hour + pd.Timedelta(seconds=give_up_after)
+            published = await wait_until_published(
+                session, url, process_killswitch, poll_min, poll_max, give_up_at)
+
+            if process_killswitch.value:
+                break
+
+            # hours are occasionally never published, don't wait on one forever
+            if not published:
+                logger.warning(f'{filename} still not published, skipping it')
+                hour += pd.Timedelta(hours=1)
+                continue
+
+            try:
+                await download_file_from_url(
+                    session, url, pageviews_queue, free_segments)
+            # a corrupt or stalled download, or an error after the HEAD found the hour
+            # (e.g. a 403 or a proxy error), is retried a few times before moving on,
+            # so one bad hour doesn't hold up every hour after it
+            except (ChecksumMismatchError, ClientError) as e:
+                failed_attempts += 1
+                if failed_attempts < DOWNLOAD_MAX_ATTEMPTS:
+                    logger.warning(f'download of {filename} failed ({e!r}), trying again in {poll_min:g}s')
+                    await sleep_unless_killed(poll_min, process_killswitch)
+                    continue
+
+                # falls through to the next hour
+                logger.error(f'download of {filename} failed ({e!r}), skipping it after {failed_attempts} attempts')
+
+            failed_attempts = 0
+            hour += pd.Timedelta(hours=1)
+
+    logger.info('daemon stopped')
+
+
+async def wait_until_published(
+        session: ClientSession,
+        url: str,
+        process_killswitch: multiprocessing.Value,
+        poll_min: float = DAEMON_POLL_MIN,
+        poll_max: float = DAEMON_POLL_MAX,
+        give_up_at: Union[pd.Timestamp, None] = None) -> bool:
+    """poll a url with HEAD requests, backing off exponentially, until it exists
+
+    Arguments:
+        session {ClientSession} -- handles async http
+        url {str} -- url of an hour's dump
+        process_killswitch {multiprocessing.Value[bool]} -- flag that stops the daemon
+
+    Keyword Arguments:
+        poll_min {float} -- seconds before the second check (default: {config.DAEMON_POLL_MIN})
+        poll_max {float} -- most seconds between checks (default: {config.DAEMON_POLL_MAX})
+        give_up_at {Timestamp, None} -- time to stop polling at, None to poll until the url exists (default: {None})
+
+    Returns:
+        bool -- True once the url exists, False if the killswitch was thrown or it was given up on first
+    """
+    filename = filename_from_path(url)
+    delay = poll_min
+
+    while not process_killswitch.value:
+        try:
+            async with session.head(url) as response:
+                if response.status == 200:
+                    return True
+
+                # 404 until the dump is published, anything else is worth knowing about
+                if response.status != 404:
+                    logger.warning(f'code {response.status} checking for {filename}')
+        except ClientError as e:
+            logger.warning(f'could not check for {filename}: {e!r}')
+
+        if give_up_at is not None and pd.Timestamp.utcnow() >= give_up_at:
+            return False
+
+        logger.info(f'{filename} not published yet, checking again in {delay:g}s')
+        await sleep_unless_killed(delay, process_killswitch)
+        delay = min(delay * 2, poll_max)
+
+    return False
+
+
+async def sleep_unless_killed(
+        seconds: float,
+        process_killswitch: multiprocessing.Value,
+        interval: float = 1):
+    """sleep, waking up early if the killswitch is thrown
+
+    Arguments:
+        seconds {float} -- seconds to sleep
+        process_killswitch {multiprocessing.Value[bool]} -- flag that stops the daemon
+
+    Keyword Arguments:
+        interval {float} -- seconds between checks of the killswitch (default: {1})
+    """
+    loop = asyncio.get_running_loop()
+    wake_at = loop.time() + seconds
+
+    while not process_killswitch.value and loop.time() < wake_at:
+        await asyncio.sleep(min(interval, wake_at - loop.time()))
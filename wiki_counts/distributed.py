@@ -0,0 +1,429 @@
+import logging
+import os
+import time
+import zlib
+import socket
+import asyncio
+import threading
+
+from aiohttp import ClientResponseError, ClientPayloadError, ServerTimeoutError
+from collections import Counter, OrderedDict
+from multiprocessing.managers import BaseManager
+from typing import List, Dict, Tuple, Union
+
+from .config import (
+    COORDINATOR_AUTHKEY_ENV, DEFAULT_COORDINATOR_BIND, LEASE_TIMEOUT, LEASE_RENEW_INTERVAL, LEASE_POLL_INTERVAL,
+    DOWNLOAD_MAX_ATTEMPTS)
+from .analyze import (
+    load_blacklist_set, build_most_viewed_map, results_to_lines, write_results,
+    build_domain_totals, totals_to_lines)
+from .download import download_to_tmp
+from .session import make_session
+from .checksums import ChecksumMismatchError
+from .utils import filename_from_path, dataset_from_path
+from .archive_cache import retire_archive
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseTable:
+    """keeps track of which hours are waiting, leased out to a worker, or done
+
+    every method is called from the coordinator's manager server threads,
+    so all state is guarded by a lock
+    """
+
+    def __init__(self, urls: List[str], lease_timeout: float = LEASE_TIMEOUT):
+        """
+        Arguments:
+            urls {List[str]} -- urls of the hours to hand out, in the order they should be handed out
+
+        Keyword Arguments:
+            lease_timeout {float} -- seconds before a lease expires and the hour is handed out again (default: {config.LEASE_TIMEOUT})
+        """
+        self.lease_timeout = lease_timeout
+        self.lock = threading.Lock()
+
+        # an OrderedDict is used as an ordered set of urls that still need a worker
+        self.pending = OrderedDict((url, None) for url in urls)
+
+        # url -> (worker_id, time at which the lease expires)
+        self.leased: Dict[str, Tuple[str, float]] = {}
+
+        self.done = set()
+
+    def lease(self, worker_id: str) -> Union[str, None]:
+        """hand the next waiting hour to a worker
+
+        Arguments:
+            worker_id {str} -- identifies the worker asking for work
+
+        Returns:
+            str, None -- url for the worker to process, or None if nothing is waiting right now
+        """
+        with self.lock:
+            self._reclaim_expired()
+
+            if not self.pending:
+                return None
+
+            url, _ = self.pending.popitem(last=False)
+            self.leased[url] = (worker_id, time.time() + self.lease_timeout)
+
+            return url
+
+    def renew(self, url: str, worker_id: str) -> bool:
+        """extend a worker's lease on an hour
+
+        Arguments:
+            url {str} -- url leased to the worker
+            worker_id {str} -- identifies the worker holding the lease
+
+        Returns:
+            bool -- True if the worker still holds the lease, False if it was reassigned
+        """
+        with self.lock:
+            if not self._holds_lease(url, worker_id):
+                return False
+
+            self.leased[url] = (worker_id, time.time() + self.lease_timeout)
+            return True
+
+    def complete(self, url: str, worker_id: str, lines: List[str]) -> bool:
+        """accept a worker's results for an hour and write them to the results directory
+
+        a worker whose lease expired can still report, as long as nobody else
+        has finished the hour in the meantime
+
+        Arguments:
+            url {str} -- url the results are for
+            worker_id {str} -- identifies the reporting worker
+            lines {List[str]} -- lines of the results file, as produced by results_to_lines
+
+        Returns:
+            bool -- True if the results were accepted, False if the hour was already done
+        """
+        with self.lock:
+            if url in self.done:
+                return False
+
+            write_results(filename_from_path(url, remove_gz=True), lines)
+            self._mark_done(url)
+
+            logger.info(f'{worker_id} completed {filename_from_path(url)}')
+            return True
+
+    def skip(self, url: str, worker_id: str) -> bool:
+        """mark an hour that can't be downloaded (e.g. a 404) as done without results
+
+        Arguments:
+            url {str} -- url that was skipped
+            worker_id {str} -- identifies the worker that skipped the url
+
+        Returns:
+            bool -- True if the hour was skipped, False if the worker's lease was reassigned
+        """
+        with self.lock:
+            # a worker whose lease expired can't skip an hour another worker is processing
+            if not self._holds_lease(url, worker_id):
+                return False
+
+            self._mark_done(url)
+            logger.info(f'{worker_id} skipped {filename_from_path(url)}')
+            return True
+
+    def release(self, url: str, worker_id: str):
+        """give an hour back so it can be handed out again, e.g. after a 503
+
+        Arguments:
+            url {str} -- url to give back
+            worker_id {str} -- identifies the worker holding the lease
+        """
+        with self.lock:
+            if self._holds_lease(url, worker_id):
+                del self.leased[url]
+                self.pending[url] = None
+
+    def is_done(self) -> bool:
+        """check whether every hour has been completed or skipped
+
+        Returns:
+            bool -- True if no hours are waiting or leased
+        """
+        with self.lock:
+            return not self.pending and not self.leased
+
+    def _holds_lease(self, url: str, worker_id: str) -> bool:
+        return url in self.leased and self.leased[url][0] == worker_id
+
+    def _mark_done(self, url: str):
+        self.leased.pop(url, None)
+        self.pending.pop(url, None)
+        self.done.add(url)
+
+    def _reclaim_expired(self):
+        # hours held by workers that stopped renewing go back to the front of the line
+        now = time.time()
+        expired = [url for url, (_, deadline) in self.leased.items()
+                   if deadline < now]
+
+        # reversed so that the expired hours keep their original order
+        for url in reversed(expired):
+            worker_id, _ = self.leased.pop(url)
+            logger.warning(f'lease on {filename_from_path(url)} held by {worker_id} expired')
+            self.pending[url] = None
+            self.pending.move_to_end(url, last=False)
+
+
+class CoordinatorLostError(Exception):
+    """the connection to the coordinator was lost, usually because it finished and stopped its server"""
+    pass
+
+
+def call_coordinator(method, *args):
+    """call a method of the coordinator's LeaseTable through its proxy
+
+    Arguments:
+        method {Callable} -- method of the proxy
+        *args -- passed to the method
+
+    Raises:
+        CoordinatorLostError: if the connection to the coordinator is gone
+
+    Returns:
+        whatever the method returns
+    """
+    try:
+        return method(*args)
+    # the proxy's connection errors, as opposed to the ones an analysis can raise
+    except (EOFError, ConnectionError) as e:
+        raise CoordinatorLostError(repr(e)) from e
+
+
+class CoordinatorManager(BaseManager):
+    """serves the LeaseTable to workers over TCP"""
+    pass
+
+
+def get_authkey(env: str = COORDINATOR_AUTHKEY_ENV) -> bytes:
+    """get the shared secret that the coordinator and its workers authenticate each other with
+
+    Keyword Arguments:
+        env {str} -- environment variable that holds the secret (default: {config.COORDINATOR_AUTHKEY_ENV})
+
+    Raises:
+        ValueError: if the environment variable isn't set, or is empty
+
+    Returns:
+        bytes -- the secret
+    """
+    authkey = os.environ.get(env)
+
+    # anyone who knows the secret can run code on the coordinator, so a well known default won't do
+    if not authkey:
+        raise ValueError(f'set {env} to a secret shared by the coordinator and its workers')
+
+    return authkey.encode('utf-8')
+
+
+def run_coordinator(
+        urls: List[str],
+        port: int,
+        bind: str = DEFAULT_COORDINATOR_BIND):
+    """hand out urls to workers until every hour is completed or skipped
+
+    Arguments:
+        urls {List[str]} -- list of urls to distribute
+        port {int} -- port to listen on
+
+    Keyword Arguments:
+        bind {str} -- address to listen on, '' for every interface (default: {config.DEFAULT_COORDINATOR_BIND})
+    """
+    authkey = get_authkey()
+
+    lease_table = LeaseTable(urls)
+    CoordinatorManager.register('get_lease_table', callable=lambda: lease_table)
+
+    manager = CoordinatorManager(address=(bind, port), authkey=authkey)
+    server = manager.get_server()
+
+    # the server accepts worker connections on its own threads
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    logger.info(f'coordinator listening on {bind or "every interface"} port {port} with {len(urls)} hours')
+
+    while not lease_table.is_done():
+        time.sleep(LEASE_POLL_INTERVAL)
+
+    server.stop_event.set()
+    logger.info('all hours completed')
+
+
+def run_worker(host: str, port: int):
+    """lease hours from a coordinator, download and analyze them, and report the results
+
+    Arguments:
+        host {str} -- hostname of the coordinator
+        port {int} -- port the coordinator listens on
+    """
+    CoordinatorManager.register('get_lease_table')
+    manager = CoordinatorManager(address=(host, port), authkey=get_authkey())
+    manager.connect()
+
+    lease_table = manager.get_lease_table()
+    worker_id = f'{socket.gethostname()}-{os.getpid()}'
+
+    # the blacklist is built once per worker, not once per hour
+    blacklist_set = load_blacklist_set()
+
+    asyncio.run(run_worker_loop(lease_table, worker_id, blacklist_set))
+
+    logger.info(f'{worker_id} finished')
+
+
+async def run_worker_loop(lease_table, worker_id: str, blacklist_set):
+    """lease and process hours until the coordinator has none left, or goes away
+
+    Arguments:
+        lease_table {LeaseTable} -- proxy to the coordinator's LeaseTable
+        worker_id {str} -- identifies this worker
+        blacklist_set {Set[Tuple[str, str]]} -- set of blacklisted (domain_code, page_names) tuples
+    """
+    # number of times each url's download or analysis has failed on this worker
+    failed_attempts = Counter()
+
+    # a worker downloads one hour at a time
+    async with make_session(1) as session:
+        try:
+            while not call_coordinator(lease_table.is_done):
+                url = call_coordinator(lease_table.lease, worker_id)
+
+                # every remaining hour is leased to some worker, but one of them may die
+                if url is None:
+                    await asyncio.sleep(LEASE_POLL_INTERVAL)
+                    continue
+
+                # the lease is renewed for as long as the hour is downloaded and analyzed
+                renewer = asyncio.create_task(
+                    keep_lease(lease_table, url, worker_id, LEASE_RENEW_INTERVAL))
+                try:
+                    await process_hour(
+                        session, lease_table, url, worker_id, blacklist_set,
+                        failed_attempts, renewer)
+                finally:
+                    renewer.cancel()
+
+        # the coordinator stops its server once every hour is done
+        except CoordinatorLostError as e:
+            logger.info(f'lost the connection to the coordinator ({e}), stopping')
+
+
+async def keep_lease(lease_table, url: str, worker_id: str, interval: float):
+    """renew a worker's lease on an hour every interval seconds, until cancelled or the lease is lost
+
+    Arguments:
+        lease_table {LeaseTable} -- proxy to the coordinator's LeaseTable
+        url {str} -- url leased to the worker
+        worker_id {str} -- identifies the worker holding the lease
+        interval {float} -- seconds between renewals, well under the lease timeout
+    """
+    while True:
+        await asyncio.sleep(interval)
+
+        try:
+            renewed = call_coordinator(lease_table.renew, url, worker_id)
+        except CoordinatorLostError:
+            renewed = False
+
+        if not renewed:
+            logger.warning(f'lease on {filename_from_path(url)} lost')
+            return
+
+
+async def process_hour(
+        session,
+        lease_table,
+        url: str,
+        worker_id: str,
+        blacklist_set,
+        failed_attempts: Counter,
+        renewer: asyncio.Task):
+    """download and analyze a leased hour, and report its results to the coordinator
+
+    an hour whose download or analysis keeps failing is given up on, so it doesn't stop the worker
+
+    Arguments:
+        session {ClientSession} -- handles async http
+        lease_table {LeaseTable} -- proxy to the coordinator's LeaseTable
+        url {str} -- url leased to the worker
+        worker_id {str} -- identifies this worker
+        blacklist_set {Set[Tuple[str, str]]} -- set of blacklisted (domain_code, page_names) tuples
+        failed_attempts {Counter} -- number of times each url's download or analysis has failed on this worker
+        renewer {asyncio.Task} -- keep_lease task for the hour, which finishes if the lease is lost
+    """
+    try:
+        file_abspath = await download_to_tmp(session, url)
+    except ClientResponseError as e:
+        if e.status == 503:
+            logger.warning('attempting too many downloads at once - sleeping for a while')
+            call_coordinator(lease_table.release, url, worker_id)
+            await asyncio.sleep(10)
+        else:
+            logger.warning(f'code {e.status}: skipping {e.request_info.url}')
+            call_coordinator(lease_table.skip, url, worker_id)
+        return
+    except (ChecksumMismatchError, ClientPayloadError, ServerTimeoutError) as e:
+        # a corrupt or stalled download is retried, but only this hour is given up on
+        give_up_or_retry(lease_table, url, worker_id, failed_attempts, f'download failed ({e})')
+        return
+
+    # another worker has the hour now, so don't spend cpu on it
+    if renewer.done():
+        logger.warning(f'dropping {filename_from_path(url)}')
+        retire_archive(file_abspath)
+        return
+
+    # analyzed in a thread, so the event loop keeps renewing the lease meanwhile
+    loop = asyncio.get_running_loop()
+    try:
+        if dataset_from_path(file_abspath) == 'projectviews':
+            lines = totals_to_lines(
+                await loop.run_in_executor(None, build_domain_totals, file_abspath))
+        else:
+            lines = results_to_lines(
+                await loop.run_in_executor(None, build_most_viewed_map, file_abspath, blacklist_set))
+    # a truncated or corrupt archive, which is downloaded again
+    except (EOFError, OSError, zlib.error) as e:
+        os.remove(file_abspath)
+        give_up_or_retry(lease_table, url, worker_id, failed_attempts, f'analysis failed ({e!r})')
+        return
+
+    call_coordinator(lease_table.complete, url, worker_id, lines)
+    retire_archive(file_abspath)
+
+
+def give_up_or_retry(
+        lease_table,
+        url: str,
+        worker_id: str,
+        failed_attempts: Counter,
+        reason: str):
+    """hand a failed hour back to the coordinator to try again, or skip it once it has failed too often
+
+    Arguments:
+        lease_table {LeaseTable} -- proxy to the coordinator's LeaseTable
+        url {str} -- url leased to the worker
+        worker_id {str} -- identifies this worker
+        failed_attempts {Counter} -- number of times each url has failed on this worker
+        reason {str} -- what went wrong, for the log
+    """
+    failed_attempts[url] += 1
+
+    if failed_attempts[url] < DOWNLOAD_MAX_ATTEMPTS:
+        logger.warning(f'{filename_from_path(url)}: {reason}, handing it out again')
+        call_coordinator(lease_table.release, url, worker_id)
+    else:
+        logger.error(f'{filename_from_path(url)}: {reason}, '
+                     f'skipping it after {failed_attempts[url]} attempts')
+        call_coordinator(lease_table.skip, url, worker_id)
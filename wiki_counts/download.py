@@ -1,36 +1,59 @@
+import logging
 import os
+import time
 import asyncio
+import hashlib
 import multiprocessing
 
-from aiohttp import ClientSession, ClientResponseError
-from typing import List
+from aiohttp import ClientSession, ClientResponseError, ClientPayloadError, \
+    ServerTimeoutError
+from collections import Counter
+from queue import Empty
+from typing import List, Union
 
-from .config import TMP_DIR
-from .utils import killswitch_on_exception, filename_from_path
+from .config import TMP_DIR, DOWNLOAD_CHUNK_BYTES, DOWNLOAD_MAX_ATTEMPTS
+from .utils import killswitch_on_exception, ignore_interrupts, filename_from_path, atomic_open
+from .archive_cache import cached_archive
+from .shm import SegmentItem, write_segment
+from .checksums import ChecksumMismatchError, expected_md5, verify_md5
+from .plan import record_throughput
+from .session import make_session
+from .log import setup_logging, report_startup
+
+logger = logging.getLogger(__name__)
 
 
 @killswitch_on_exception
 def async_download(
         urls: List[str],
+        num_workers: int,
         pageviews_queue: multiprocessing.Queue,
+        free_segments: Union[multiprocessing.Queue, None],
         downloads_done: multiprocessing.Value,
-        num_workers: int,
+        launched_at: float,
         process_killswitch: multiprocessing.Value):
     """driver function for file download
 
     Arguments:
         urls {List[str]} -- list of urls to download files from
+        num_workers {int} -- number of async threads to download the urls
         pageviews_queue {multiproccesing.Queue} -- queue that passes paths to downloaded gzips to the file analyzing process
+        free_segments {multiprocessing.Queue, None} -- queue of free shared memory segments to hand archives over in, None to always write them to tmp
         downloads_done {multiproccesing.Value[bool]} -- shared memory flag that communicates this process is done to pageview analyzing process
-        num_workers {int} -- number of async threads to download the urls
+        launched_at {float} -- time.time() when the process was launched, to report how long it took to start
         process_killswitch {multiprocessing.Value[bool]} -- flag that indicates to kill this process because of an error in another process
     """
-    print(f'number of files to download: {len(urls)}')
+    setup_logging()
+    ignore_interrupts()
+    report_startup(launched_at, 'downloader')
+
+    logger.info(f'number of files to download: {len(urls)}')
     asyncio.run(
         run_async_download(
-            urls, pageviews_queue, num_workers, process_killswitch))
+            urls, pageviews_queue, free_segments, num_workers,
+            process_killswitch))
 
-    print('downloads completed')
+    logger.info('downloads completed')
 
     # set the shared boolean flag to True
     # when the pageviews_queue is empty, this causes the file analyzer to halt
@@ -40,6 +63,7 @@ def async_download(
 async def run_async_download(
         urls: List[str],
         pageviews_queue: multiprocessing.Queue,
+        free_segments: Union[multiprocessing.Queue, None],
         num_workers: int,
         process_killswitch: multiprocessing.Value):
     """use python async to download files
@@ -47,6 +71,7 @@ async def run_async_download(
     Arguments:
         urls {List[str]} -- list of urls to download files from
         pageviews_queue {multiproccesing.Queue} -- queue that passes paths to downloaded gzips to the file analyzing process
+        free_segments {multiprocessing.Queue, None} -- queue of free shared memory segments to hand archives over in, None to always write them to tmp
         num_workers {int} -- number of async threads to download the urls
         process_killswitch {multiprocessing.Value[bool]} -- flag that indicates to kill this process because of an error in another process
     """
@@ -60,12 +85,16 @@ async def run_async_download(
     # don't use unnecessary resources
     num_workers = min(len(urls), num_workers)
 
-    # ClientSession provides async http
-    async with ClientSession() as session:
+    # number of times each url's download has failed part way
+    failed_attempts = Counter()
+
+    # ClientSession provides async http, with a connection for each worker
+    async with make_session(num_workers) as session:
         # create downloading tasks, that will read from url_queue
         tasks = [asyncio.create_task(
             file_download_worker(
-                url_queue, pageviews_queue, session, process_killswitch))
+                url_queue, pageviews_queue, free_segments, session,
+                failed_attempts, process_killswitch))
             for _ in range(num_workers)]
 
         # wait for queue to be emptied out
@@ -82,14 +111,18 @@ async def run_async_download(
 async def file_download_worker(
         url_queue: asyncio.Queue,
         pageviews_queue: multiprocessing.Queue,
+        free_segments: Union[multiprocessing.Queue, None],
         session: ClientSession,
+        failed_attempts: Counter,
         process_killswitch: multiprocessing.Value):
     """download urls pulled from the url queue, and pass their filename to the pageview analyzer
 
     Arguments:
         url_queue {asyncio.Queue} -- queue of urls to download gzips from
         pageviews_queue {multiproccesing.Queue} -- queue that passes paths to downloaded gzips to the file analyzing process
+        free_segments {multiprocessing.Queue, None} -- queue of free shared memory segments to hand archives over in, None to always write them to tmp
         session {ClientSession} -- handles async http
+        failed_attempts {Counter} -- number of times each url's download has failed part way, shared by the workers
         process_killswitch {multiprocessing.Value[bool]} -- flag that indicates to kill this process because of an error in another process
     """
     # runs until url_queue is marked as "task_done" for every item in it
@@ -104,10 +137,13 @@ async def file_download_worker(
 
         # try to download the file contents
         try:
-            await download_file_from_url(session, url, pageviews_queue)
+            await download_file_from_url(
+                session, url, pageviews_queue, free_segments)
         # handle exceptions
         except ClientResponseError as e:
             await handle_error(e, url_queue, url)
+        except (ChecksumMismatchError, ClientPayloadError, ServerTimeoutError) as e:
+            await handle_failed_download(e, url_queue, url, failed_attempts)
         # mark the task as done in the queue
         finally:
             url_queue.task_done()
@@ -119,7 +155,7 @@ async def kill_process(queue: asyncio.Queue):
     Arguments:
         queue {asyncio.Queue} -- queue of urls to download gzips from
     """
-    print('thread killed')
+    logger.warning('thread killed')
     # asyncio will hang on "url_queue.join()" in run_async_download
     # until every task in the queue is marked as done
     # so if we need to kill this process, mark the queue as
@@ -132,31 +168,141 @@ async def kill_process(queue: asyncio.Queue):
 async def download_file_from_url(
         session: ClientSession,
         url: str,
-        pageviews_queue: multiprocessing.Queue):
+        pageviews_queue: multiprocessing.Queue,
+        free_segments: Union[multiprocessing.Queue, None] = None):
     """download a page view gzip file from the url
 
     Arguments:
         session {ClientSession} -- handles async http
         url {str} -- url to download gzip file from
         pageviews_queue {multiproccesing.Queue} -- queue that passes paths to downloaded gzips to the file analyzing process
+
+    Keyword Arguments:
+        free_segments {multiprocessing.Queue, None} -- queue of free shared memory segments to hand archives over in, None to always write them to tmp (default: {None})
+    """
+    if free_segments is None:
+        dest = await download_to_tmp(session, url)
+    else:
+        dest = await download_to_segment(session, url, free_segments)
+
+    # pass the name of the downloaded gzip to the file analyzing queue
+    pageviews_queue.put(dest)
+
+
+async def download_to_tmp(session: ClientSession, url: str) -> str:
+    """download a page view gzip file from the url into the tmp directory, unless it is in the archive cache
+
+    Arguments:
+        session {ClientSession} -- handles async http
+        url {str} -- url to download gzip file from
+
+    Returns:
+        str -- path to the downloaded or cached gzip
     """
     # get the name of the file from the url
     filename = filename_from_path(url.split('/')[-1])
-    print(f'downloading {filename}')
+
+    # archives kept from an earlier run don't need to be downloaded again
+    cached = cached_archive(filename)
+    if cached:
+        logger.info(f'using cached {filename}')
+        return cached
+
+    contents = await fetch_archive(session, url)
+    return write_to_tmp(filename, contents)
+
+
+async def download_to_segment(
+        session: ClientSession,
+        url: str,
+        free_segments: multiprocessing.Queue) -> Union[SegmentItem, str]:
+    """download a page view gzip file from the url into a free shared memory segment
+
+    if no segment is free, or the archive doesn't fit in one, it is written to tmp instead
+
+    Arguments:
+        session {ClientSession} -- handles async http
+        url {str} -- url to download gzip file from
+        free_segments {multiprocessing.Queue} -- queue of free shared memory segments
+
+    Returns:
+        SegmentItem, str -- (segment name, size, filename) of the archive in shared memory, or path to the downloaded gzip
+    """
+    filename = filename_from_path(url.split('/')[-1])
+    contents = await fetch_archive(session, url)
+
+    # waiting for a segment would hold up the other downloads, and the
+    # analyzers are the bottleneck if none are free, so disk costs nothing extra
+    try:
+        name = free_segments.get_nowait()
+    except Empty:
+        logger.debug(f'no free segment for {filename}')
+        return write_to_tmp(filename, contents)
+
+    if not write_segment(name, contents):
+        logger.info(f'{filename} is too big for a segment')
+        free_segments.put(name)
+        return write_to_tmp(filename, contents)
+
+    return name, len(contents), filename
+
+
+async def fetch_archive(session: ClientSession, url: str) -> bytearray:
+    """download a page view gzip file from the url into memory
+
+    Arguments:
+        session {ClientSession} -- handles async http
+        url {str} -- url to download gzip file from
+
+    Raises:
+        ChecksumMismatchError: the gzip doesn't match the md5 published for it
+
+    Returns:
+        bytearray -- contents of the gzip
+    """
+    filename = filename_from_path(url)
+    logger.info(f'downloading {filename}')
+
+    # the md5 is computed as the chunks arrive, so the archive isn't read a second time
+    md5 = hashlib.md5()
+    started = time.time()
+
+    # chunks are appended as they arrive instead of being joined at the end,
+    # so a big archive isn't briefly held in memory twice
+    contents = bytearray()
 
     async with session.get(url) as response:
         response.raise_for_status()
-        contents = await response.read()
+        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_BYTES):
+            md5.update(chunk)
+            contents += chunk
+
+    verify_md5(filename, md5.hexdigest(), await expected_md5(session, url))
+
+    # --plan estimates backfills from the throughput of earlier downloads
+    record_throughput('download', filename, len(contents), time.time() - started)
+    logger.info(f'finished downloading {filename}')
+
+    return contents
+
+
+def write_to_tmp(filename: str, contents: Union[bytes, bytearray]) -> str:
+    """write a downloaded archive to the tmp directory
+
+    Arguments:
+        filename {str} -- name of the archive
+        contents {bytes, bytearray} -- contents of the archive
 
-    # write the contents to disk
+    Returns:
+        str -- path to the archive in tmp
+    """
+    # the archive only shows up in tmp once it is complete, so an interrupted
+    # download isn't picked up as a truncated archive by the next run
     dest = os.path.join(TMP_DIR, filename)
-    with open(dest, 'wb+') as f:
+    with atomic_open(dest, 'wb') as f:
         f.write(contents)
 
-    print(f'finished downloading {filename}')
-
-    # pass the name of the downloaded gzip to the file analyzing queue
-    pageviews_queue.put(dest)
+    return dest
 
 
 async def handle_error(
@@ -173,11 +319,39 @@ async def handle_error(
     # if we have a 503 error, we are attempting too many downloads
     # put the url back in the queue, sleep for a bit, try again later
     if e.status == 503:
-        print('attempting too many downloads at once - sleeping for a while')
+        logger.warning('attempting too many downloads at once - sleeping for a while')
         await url_queue.put(url)
         await asyncio.sleep(10)
     # otherwise, print the error code for the url
     # this includes 404 errors, i.e. if the request is for data that
     # hasn't been dumped yet
     else:
-        print(f'code {e.status}: skipping {e.request_info.url}')
+        logger.warning(f'code {e.status}: skipping {e.request_info.url}')
+
+
+async def handle_failed_download(
+        e: Exception,
+        url_queue: asyncio.Queue,
+        url: str,
+        failed_attempts: Counter,
+        max_attempts: int = DOWNLOAD_MAX_ATTEMPTS):
+    """put a url whose download was corrupt or stalled back in the queue, unless it has failed too many times
+
+    Arguments:
+        e {Exception} -- ChecksumMismatchError, ClientPayloadError, or ServerTimeoutError raised by the download
+        url_queue {asyncio.Queue} -- queue of urls to download gzips from
+        url {str} -- url of failed download
+        failed_attempts {Counter} -- number of times each url's download has failed part way
+
+    Keyword Arguments:
+        max_attempts {int} -- times a url is downloaded before it is skipped (default: {config.DOWNLOAD_MAX_ATTEMPTS})
+    """
+    failed_attempts[url] += 1
+    filename = filename_from_path(url)
+
+    # only this archive is retried, the rest of the run carries on
+    if failed_attempts[url] < max_attempts:
+        logger.warning(f'download of {filename} failed ({e}), downloading it again')
+        await url_queue.put(url)
+    else:
+        logger.error(f'download of {filename} failed ({e}), skipping it after {failed_attempts[url]} attempts')
@@ -0,0 +1,189 @@
+import os
+import gzip
+import bisect
+import logging
+
+from typing import List, Tuple, Union
+
+from .config import ARCHIVE_INDEX_MEMBER_BYTES
+from .utils import atomic_open
+
+logger = logging.getLogger(__name__)
+
+# a gzip stream can only be decompressed from its start, so an indexed archive is
+# rewritten as a series of gzip members, each holding whole lines. that is still a
+# valid gzip file, so everything else reads it as before, but any member can be
+# decompressed on its own. the index, ".<archive name>.idx" next to the archive, has
+#   "sorted" or "unsorted" -- whether the archive's lines are in order of domain
+# on its first line, then one line per member
+#   "offset length first_domain"
+
+# a member of an indexed archive: (offset, compressed length, domain of its first line)
+Member = Tuple[int, int, str]
+
+
+def index_path(archive_path: str) -> str:
+    """get the path of an archive's index
+
+    Arguments:
+        archive_path {str} -- path to the archive
+
+    Returns:
+        str -- path to the index, which starts with a dot so globs of archives don't pick it up
+    """
+    directory, filename = os.path.split(archive_path)
+    return os.path.join(directory, f'.{filename}.idx')
+
+
+def index_archive(
+        archive_path: str,
+        member_bytes: int = ARCHIVE_INDEX_MEMBER_BYTES) -> int:
+    """rewrite an archive as gzip members of whole lines, and write its index
+
+    the archive is replaced atomically before the index is written, so an
+    interrupted run leaves a valid archive that can just be indexed again
+
+    Arguments:
+        archive_path {str} -- path to the gzip archive
+
+    Keyword Arguments:
+        member_bytes {int} -- uncompressed bytes of lines in each member (default: {config.ARCHIVE_INDEX_MEMBER_BYTES})
+
+    Returns:
+        int -- number of members
+    """
+    members = []
+    domain_sorted = True
+    previous_domain = ''
+
+    with gzip.open(archive_path, 'rb') as src, \
+            atomic_open(archive_path, 'wb') as dest:
+        chunk = []
+        chunk_bytes = 0
+        offset = 0
+
+        for line in src:
+            # a blank or malformed line is kept with the domain before it
+            split = line.split(None, 1)
+            domain = split[0].decode('utf-8', 'replace') if split else previous_domain
+
+            if domain < previous_domain:
+                domain_sorted = False
+            previous_domain = domain
+
+            if not chunk:
+                first_domain = domain
+
+            chunk.append(line)
+            chunk_bytes += len(line)
+
+            # lines are never split across members
+            if chunk_bytes >= member_bytes:
+                offset += write_member(dest, chunk, offset, first_domain, members)
+                chunk = []
+                chunk_bytes = 0
+
+        if chunk:
+            write_member(dest, chunk, offset, first_domain, members)
+
+    if not domain_sorted:
+        logger.warning(f'{archive_path} is not sorted by domain, domain lookups will read every member')
+
+    with atomic_open(index_path(archive_path)) as f:
+        f.write('sorted\n' if domain_sorted else 'unsorted\n')
+        f.writelines(f'{offset} {length} {domain}\n'
+                     for offset, length, domain in members)
+
+    return len(members)
+
+
+def write_member(
+        dest, chunk: List[bytes], offset: int, first_domain: str,
+        members: List[Member]) -> int:
+    """compress lines into a gzip member, append it to the archive, and record it
+
+    Arguments:
+        dest {file object} -- archive being written
+        chunk {List[bytes]} -- lines of the member
+        offset {int} -- offset the member starts at in the archive
+        first_domain {str} -- domain of the member's first line
+        members {List[Member]} -- members written so far, this one is appended
+
+    Returns:
+        int -- compressed length of the member
+    """
+    # level 6 is zlib's default, and is much faster than gzip.compress's default of 9
+    compressed = gzip.compress(b''.join(chunk), compresslevel=6)
+    dest.write(compressed)
+    members.append((offset, len(compressed), first_domain))
+
+    return len(compressed)
+
+
+def read_index(archive_path: str) -> Union[Tuple[bool, List[Member]], None]:
+    """read an archive's index
+
+    Arguments:
+        archive_path {str} -- path to the archive
+
+    Returns:
+        Tuple[bool, List[Member]], None -- whether the archive is sorted by domain, and its members, or None if it isn't indexed
+    """
+    try:
+        with open(index_path(archive_path), 'r') as f:
+            domain_sorted = f.readline().strip() == 'sorted'
+
+            members = []
+            for line in f:
+                offset, length, domain = line.split()
+                members.append((int(offset), int(length), domain))
+    except FileNotFoundError:
+        return None
+
+    return domain_sorted, members
+
+
+def members_for_domain(
+        members: List[Member], domain: str,
+        domain_sorted: bool = True) -> List[Member]:
+    """get the members that can hold a domain's lines
+
+    Arguments:
+        members {List[Member]} -- members of an indexed archive
+        domain {str} -- domain code
+
+    Keyword Arguments:
+        domain_sorted {bool} -- whether the archive is sorted by domain, if not every member is returned (default: {True})
+
+    Returns:
+        List[Member] -- members to read, in order
+    """
+    if not domain_sorted:
+        return members
+
+    first_domains = [first_domain for _, _, first_domain in members]
+
+    # the domain's lines may start part way through the member before the first member that starts with it
+    start = max(0, bisect.bisect_left(first_domains, domain) - 1)
+    end = bisect.bisect_right(first_domains, domain)
+
+    return members[start:end]
+
+
+def read_member(archive_path: str, member: Member) -> List[str]:
+    """decompress one member of an indexed archive
+
+    Arguments:
+        archive_path {str} -- path to the archive
+        member {Member} -- member to read
+
+    Returns:
+        List[str] -- lines of the member
+    """
+    offset, length, _ = member
+
+    with open(archive_path, 'rb') as f:
+        f.seek(offset)
+        compressed = f.read(length)
+
+    return gzip.decompress(compressed).decode('utf-8').splitlines(keepends=True)
@@ -0,0 +1,292 @@
+import os
+import time
+import logging
+import sqlite3
+
+from contextlib import contextmanager
+from typing import List, Dict, Union
+
+from .config import JOBS_DB, JOBS_POLL_INTERVAL, DEFAULT_DATASET
+from .parse_dates import parse_dates
+from .analyze import has_results
+from .journal import pid_alive
+from .utils import filename_from_path
+
+logger = logging.getLogger(__name__)
+
+# runs that overlap share one queue of hours instead of each downloading their whole range:
+#   - a job is a submitted date range, expanded into one row of hours per url. an hour
+#     that another job already covers is shared, so every hour is queued once
+#   - runners claim pending hours in the order they were submitted, recording their pid.
+#     claims are made inside an exclusive transaction, so no two runners get the same hour,
+#     and hours claimed by a runner that died go back in the queue
+#   - once an hour is analyzed it is done, or skipped if it had no results (e.g. a 404),
+#     and every job whose hours are all done or skipped is finished
+# an hour's state is one of 'pending', 'claimed', 'done', or 'skipped'
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    start_date TEXT,
+    end_date TEXT,
+    dataset TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS hours (
+    url TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    claimed_by INTEGER
+);
+CREATE TABLE IF NOT EXISTS job_hours (
+    job_id INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (job_id, url)
+);
+'''
+
+
+@contextmanager
+def transaction(db_path: str = JOBS_DB):
+    """open the job queue and hold its write lock, committing if the block succeeds
+
+    Keyword Arguments:
+        db_path {str} -- path to the job queue's sqlite database (default: {config.JOBS_DB})
+
+    Yields:
+        sqlite3.Connection -- connection to the job queue
+    """
+    # other runners may hold the lock while they claim hours, so wait for it
+    db = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+
+    try:
+        db.executescript(SCHEMA)
+        db.execute('BEGIN IMMEDIATE')
+
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+        db.execute('COMMIT')
+    finally:
+        db.close()
+
+
+def submit(
+        start_date: Union[str, None] = None,
+        end_date: Union[str, None] = None,
+        dataset: str = DEFAULT_DATASET,
+        db_path: str = JOBS_DB) -> int:
+    """add a date range to the job queue
+
+    Keyword Arguments:
+        start_date {str, None} -- start date as a string, if None it is set to utcnow minus 24 hours (default: {None})
+        end_date {str, None} -- end date as a string, if None the job is only the start date (default: {None})
+        dataset {str} -- which of config.DATASETS to download (default: {config.DEFAULT_DATASET})
+        db_path {str} -- path to the job queue's sqlite database (default: {config.JOBS_DB})
+
+    Returns:
+        int -- id of the job
+    """
+    urls = parse_dates(start_date, end_date, exclude_processed=False, dataset=dataset)
+
+    with transaction(db_path) as db:
+        job_id = db.execute(
+            'INSERT INTO jobs (start_date, end_date, dataset, submitted_at) VALUES (?, ?, ?, ?)',
+            (start_date, end_date, dataset, time.time())).lastrowid
+
+        queued = 0
+        for url in urls:
+            state = 'done' if has_results(filename_from_path(url, remove_gz=True)) else 'pending'
+
+            # an hour already in the queue for another job is shared with it
+            inserted = db.execute(
+                'INSERT OR IGNORE INTO hours (url, state) VALUES (?, ?)',
+                (url, state)).rowcount
+
+            # unless it was skipped, e.g. because it wasn't published yet, then it is tried again
+            if not inserted and state == 'pending':
+                inserted = db.execute(
+                    "UPDATE hours SET state = 'pending' WHERE url = ? AND state = 'skipped'",
+                    (url,)).rowcount
+
+            if state == 'pending':
+                queued += inserted
+
+            db.execute(
+                'INSERT OR IGNORE INTO job_hours (job_id, url) VALUES (?, ?)',
+                (job_id, url))
+
+        finish_jobs(db)
+
+    logger.info(f'submitted job {job_id} of {len(urls)} hours, {queued} of them newly queued')
+    return job_id
+
+
+def claim(
+        num_hours: int,
+        pid: Union[int, None] = None,
+        db_path: str = JOBS_DB) -> List[str]:
+    """take pending hours from the job queue, in the order they were submitted
+
+    Arguments:
+        num_hours {int} -- most hours to take
+
+    Keyword Arguments:
+        pid {int, None} -- pid of the runner the hours are claimed for, None for this process (default: {None})
+        db_path {str} -- path to the job queue's sqlite database (default: {config.JOBS_DB})
+
+    Returns:
+        List[str] -- urls of the claimed hours, empty if none are pending
+    """
+    pid = pid or os.getpid()
+
+    with transaction(db_path) as db:
+        # hours claimed by runners that died go back in the queue
+        claimed = db.execute(
+            "SELECT url, claimed_by FROM hours WHERE state = 'claimed'").fetchall()
+        for url, claimed_by in claimed:
+            if not pid_alive(claimed_by):
+                logger.warning(f'runner {claimed_by} died holding {filename_from_path(url)}, queueing it again')
+                db.execute(
+                    "UPDATE hours SET state = 'pending', claimed_by = NULL WHERE url = ?",
+                    (url,))
+
+        urls = [url for url, in db.execute(
+            "SELECT url FROM hours WHERE state = 'pending' ORDER BY rowid LIMIT ?",
+            (num_hours,))]
+
+        db.executemany(
+            "UPDATE hours SET state = 'claimed', claimed_by = ? WHERE url = ?",
+            [(pid, url) for url in urls])
+
+    return urls
+
+
+def finish(
+        urls: List[str],
+        interrupted: bool = False,
+        db_path: str = JOBS_DB):
+    """record the outcome of claimed hours, and finish every job that has nothing left
+
+    Arguments:
+        urls {List[str]} -- urls of the hours that were claimed
+
+    Keyword Arguments:
+        interrupted {bool} -- if True, hours without results go back in the queue instead of being skipped (default: {False})
+        db_path {str} -- path to the job queue's sqlite database (default: {config.JOBS_DB})
+    """
+    with transaction(db_path) as db:
+        for url in urls:
+            if has_results(filename_from_path(url, remove_gz=True)):
+                state = 'done'
+            else:
+                state = 'pending' if interrupted else 'skipped'
+
+            db.execute(
+                'UPDATE hours SET state = ?, claimed_by = NULL WHERE url = ?',
+                (state, url))
+
+        finished = finish_jobs(db)
+
+    for job_id in finished:
+        logger.info(f'job {job_id} finished')
+
+
+def finish_jobs(db: sqlite3.Connection) -> List[int]:
+    """mark the jobs whose hours are all done or skipped as finished
+
+    Arguments:
+        db {sqlite3.Connection} -- connection to the job queue, in a transaction
+
+    Returns:
+        List[int] -- ids of the jobs that were just finished
+    """
+    finished = [job_id for job_id, in db.execute('''
+        SELECT id FROM jobs WHERE finished_at IS NULL AND NOT EXISTS (
+            SELECT 1 FROM job_hours JOIN hours USING (url)
+            WHERE job_hours.job_id = jobs.id AND hours.state IN ('pending', 'claimed'))''')]
+
+    db.executemany(
+        'UPDATE jobs SET finished_at = ? WHERE id = ?',
+        [(time.time(), job_id) for job_id in finished])
+
+    return finished
+
+
+def unfinished_hours(db_path: str = JOBS_DB) -> int:
+    """count the hours in the job queue that are pending or claimed
+
+    Keyword Arguments:
+        db_path {str} -- path to the job queue's sqlite database (default: {config.JOBS_DB})
+
+    Returns:
+        int -- number of hours that aren't done or skipped
+    """
+    with transaction(db_path) as db:
+        count, = db.execute(
+            "SELECT COUNT(*) FROM hours WHERE state IN ('pending', 'claimed')").fetchone()
+
+    return count
+
+
+def job_progress(job_id: int, db_path: str = JOBS_DB) -> Dict[str, int]:
+    """count a job's hours in each state
+
+    Arguments:
+        job_id {int} -- id of the job
+
+    Keyword Arguments:
+        db_path {str} -- path to the job queue's sqlite database (default: {config.JOBS_DB})
+
+    Raises:
+        ValueError: there is no job with the id
+
+    Returns:
+        Dict[str, int] -- number of hours of the job that are 'pending', 'claimed', 'done', and 'skipped'
+    """
+    with transaction(db_path) as db:
+        if db.execute('SELECT 1 FROM jobs WHERE id = ?', (job_id,)).fetchone() is None:
+            raise ValueError(f'no job with id {job_id}')
+
+        counts = dict(db.execute('''
+            SELECT state, COUNT(*) FROM job_hours JOIN hours USING (url)
+            WHERE job_id = ? GROUP BY state''', (job_id,)))
+
+    return {state: counts.get(state, 0)
+            for state in ('pending', 'claimed', 'done', 'skipped')}
+
+
+def wait(
+        job_id: int,
+        poll_interval: float = JOBS_POLL_INTERVAL,
+        db_path: str = JOBS_DB) -> Dict[str, int]:
+    """block until every hour of a job is done or skipped, by any runner
+
+    Arguments:
+        job_id {int} -- id of the job
+
+    Keyword Arguments:
+        poll_interval {float} -- seconds between checks of the job queue (default: {config.JOBS_POLL_INTERVAL})
+        db_path {str} -- path to the job queue's sqlite database (default: {config.JOBS_DB})
+
+    Returns:
+        Dict[str, int] -- number of hours of the job in each state, once it is finished
+    """
+    last_finished = None
+
+    while True:
+        progress = job_progress(job_id, db_path)
+        if not progress['pending'] and not progress['claimed']:
+            break
+
+        finished = progress['done'] + progress['skipped']
+        if finished != last_finished:
+            logger.info(f'job {job_id}: {finished} of {sum(progress.values())} hours finished')
+            last_finished = finished
+
+        time.sleep(poll_interval)
+
+    logger.info(f'job {job_id} finished, {progress["done"]} hours done and {progress["skipped"]} skipped')
+    return progress
@@ -0,0 +1,206 @@
+import os
+import glob
+import time
+import fcntl
+
+from contextlib import contextmanager
+from typing import List, Union
+
+from .config import JOURNAL_DIR, JOURNAL_EMPTY_ENTRY_SECONDS
+
+# the journal has one small file per hour being analyzed, named after the hour,
+# containing the pid of the analyzer working on it. the entry is created before
+# analysis starts and removed once the results are written and the archive is
+# retired, so after a crash the entries left behind by dead processes are exactly
+# the unfinished hours
+#
+# an entry is written in full to a hidden file first and then linked into place, so it
+# never exists without its pid. entries of dead processes are only taken over or removed
+# while holding the journal's lock file, so two processes can't both take one over
+
+# lock file that is held while a stale entry is taken over or removed
+LOCK_FILENAME = '.lock'
+
+
+def claim(filename: str, journal_dir: str = JOURNAL_DIR) -> bool:
+    """record that this process is analyzing an hour
+
+    Arguments:
+        filename {str} -- name of the results file for the hour, e.g. "pageviews-20200501-100000"
+
+    Keyword Arguments:
+        journal_dir {str} -- directory of the journal (default: {config.JOURNAL_DIR})
+
+    Returns:
+        bool -- True if this process now owns the hour, False if a live process is already analyzing it
+    """
+    path = os.path.join(journal_dir, filename)
+
+    # the finished entry, with this process's pid, waiting to be linked into place
+    new_path = os.path.join(journal_dir, f'.{filename}.{os.getpid()}')
+    with open(new_path, 'w') as f:
+        f.write(str(os.getpid()))
+
+    try:
+        # linking fails if the hour already has an entry, so only one process can win
+        try:
+            os.link(new_path, path)
+            return True
+        except FileExistsError:
+            pass
+
+        with locked(journal_dir):
+            if in_flight(filename, journal_dir):
+                return False
+
+            # the entry was left behind by a process that died, take it over
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # removed by something other than a takeover, which lost us the race
+                return False
+
+            try:
+                os.link(new_path, path)
+            except FileExistsError:
+                # created by a new claim between the remove and the link
+                return False
+
+            return True
+    finally:
+        os.remove(new_path)
+
+
+def release(filename: str, journal_dir: str = JOURNAL_DIR):
+    """record that an hour is finished
+
+    Arguments:
+        filename {str} -- name of the results file for the hour
+
+    Keyword Arguments:
+        journal_dir {str} -- directory of the journal (default: {config.JOURNAL_DIR})
+    """
+    try:
+        os.remove(os.path.join(journal_dir, filename))
+    except FileNotFoundError:
+        pass
+
+
+def release_stale(filename: str, journal_dir: str = JOURNAL_DIR) -> bool:
+    """remove an hour's entry if its process died, and leave it alone if a live process owns it
+
+    Arguments:
+        filename {str} -- name of the results file for the hour
+
+    Keyword Arguments:
+        journal_dir {str} -- directory of the journal (default: {config.JOURNAL_DIR})
+
+    Returns:
+        bool -- True if the hour has no entry now, False if a live process is analyzing it
+    """
+    with locked(journal_dir):
+        if in_flight(filename, journal_dir):
+            return False
+
+        release(filename, journal_dir)
+        return True
+
+
+@contextmanager
+def locked(journal_dir: str = JOURNAL_DIR):
+    """hold the journal's lock file, so stale entries are taken over or removed by one process at a time
+
+    Keyword Arguments:
+        journal_dir {str} -- directory of the journal (default: {config.JOURNAL_DIR})
+    """
+    fd = os.open(os.path.join(journal_dir, LOCK_FILENAME), os.O_CREAT | os.O_RDWR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    # closing the file releases the lock
+    finally:
+        os.close(fd)
+
+
+def in_flight(filename: str, journal_dir: str = JOURNAL_DIR) -> bool:
+    """check if a live process is analyzing an hour
+
+    Arguments:
+        filename {str} -- name of the results file for the hour
+
+    Keyword Arguments:
+        journal_dir {str} -- directory of the journal (default: {config.JOURNAL_DIR})
+
+    Returns:
+        bool -- True if the hour has a journal entry whose process is still running
+    """
+    pid = owner(filename, journal_dir)
+    if pid is None:
+        return False
+
+    # entries are never empty since they are linked into place whole, but an empty one
+    # may be left by an older version or a full disk, and can't be blocking the hour forever
+    if pid == 0:
+        try:
+            age = time.time() - os.path.getmtime(os.path.join(journal_dir, filename))
+        except FileNotFoundError:
+            return False
+        return age < JOURNAL_EMPTY_ENTRY_SECONDS
+
+    return pid_alive(pid)
+
+
+def unfinished(journal_dir: str = JOURNAL_DIR) -> List[str]:
+    """list the hours whose analyzer died before finishing them
+
+    Keyword Arguments:
+        journal_dir {str} -- directory of the journal (default: {config.JOURNAL_DIR})
+
+    Returns:
+        List[str] -- names of the results files for the unfinished hours
+    """
+    entries = [os.path.basename(p)
+               for p in glob.glob(os.path.join(journal_dir, '*'))]
+
+    return sorted(e for e in entries if not in_flight(e, journal_dir))
+
+
+def owner(filename: str, journal_dir: str = JOURNAL_DIR) -> Union[int, None]:
+    """get the pid of the process analyzing an hour
+
+    Arguments:
+        filename {str} -- name of the results file for the hour
+
+    Keyword Arguments:
+        journal_dir {str} -- directory of the journal (default: {config.JOURNAL_DIR})
+
+    Returns:
+        int, None -- pid recorded in the hour's journal entry, 0 if the entry is empty or garbled, or None if there is no entry
+    """
+    try:
+        with open(os.path.join(journal_dir, filename), 'r') as f:
+            return int(f.read() or 0)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        return 0
+
+
+def pid_alive(pid: int) -> bool:
+    """check if a process is running
+
+    Arguments:
+        pid {int} -- process id
+
+    Returns:
+        bool -- True if the process exists
+    """
+    try:
+        # signal 0 checks that the process exists without signalling it
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
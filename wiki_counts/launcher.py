@@ -0,0 +1,28 @@
+import multiprocessing
+
+from multiprocessing.context import BaseContext
+
+from .config import START_METHOD
+from .analyze import load_blacklist_set, blacklist_digest
+
+
+def get_context(start_method: str = START_METHOD) -> BaseContext:
+    """get the multiprocessing context that processes are started with, warmed up for the start method
+
+    Keyword Arguments:
+        start_method {str} -- 'forkserver', 'fork' or 'spawn' (default: {config.START_METHOD})
+
+    Returns:
+        BaseContext -- context to make processes, queues and shared values with
+    """
+    ctx = multiprocessing.get_context(start_method)
+
+    if start_method == 'forkserver':
+        # only takes effect before the fork server is started, by the first process made with ctx
+        ctx.set_forkserver_preload(['__main__', 'wiki_counts.warm'])
+    elif start_method == 'fork':
+        # forked processes inherit the blacklist, and its digest, if they are built here first
+        load_blacklist_set()
+        blacklist_digest()
+
+    return ctx
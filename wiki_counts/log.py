@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+import atexit
+import logging
+
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Union
+
+from .config import LOG_LEVEL, LOG_FILE
+
+# the listener that writes this process's log records, and the pid it was started in
+_listener: Union[QueueListener, None] = None
+_listener_pid: Union[int, None] = None
+
+
+def setup_logging(level: str = LOG_LEVEL, log_file: Union[str, None] = LOG_FILE):
+    """send this process's log records through a queue to a background thread that writes them
+
+    logging calls in hot loops then only put a record on a queue, and never block
+    on stdout or the log file. call this at the start of every process; a forked
+    process inherits its parent's handlers but not the parent's listener thread,
+    so it sets up its own
+
+    Keyword Arguments:
+        level {str} -- minimum level of records to write (default: {config.LOG_LEVEL})
+        log_file {str, None} -- file to also write records to, None for only stderr (default: {config.LOG_FILE})
+    """
+    global _listener, _listener_pid
+
+    if _listener_pid == os.getpid():
+        return
+
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+
+    formatter = logging.Formatter(
+        '%(asctime)s %(processName)s %(name)s %(levelname)s %(message)s')
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = SimpleQueue()
+
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers)
+    _listener.start()
+    _listener_pid = os.getpid()
+
+    # flush whatever is still queued when the main process exits. multiprocessing
+    # children leave through os._exit, which skips atexit, so they call shutdown themselves
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """write every record still queued, stop the listener, and write any later records directly
+
+    call this before a process that called setup_logging exits, safe to call more than once
+    """
+    global _listener, _listener_pid
+
+    if _listener is None or _listener_pid != os.getpid():
+        return
+
+    _listener.stop()
+    logging.getLogger().handlers = list(_listener.handlers)
+
+    _listener = None
+    _listener_pid = None
+
+
+def report_startup(launched_at: float, name: str):
+    """log how long a process took from being launched to being ready to work
+
+    Arguments:
+        launched_at {float} -- time.time() when the parent launched the process
+        name {str} -- what the process does, e.g. "file processor"
+    """
+    startup_seconds = time.time() - launched_at
+    logging.getLogger(__name__).info(
+        f'{name} started in {startup_seconds:.3f}s',
+        extra={'startup_seconds': startup_seconds})
@@ -1,20 +1,33 @@
+import logging
 import pandas as pd
 import glob
 import os
 
 from typing import Set, Union, Tuple, List
 
-from .config import ROOT_URL, RESULTS_DIR, TMP_DIR, EARLIEST_DATE
+from .config import ROOT_URL, RESULTS_DIR, TMP_DIR, EARLIEST_DATE, DATASETS, \
+    DEFAULT_DATASET, ARCHIVE_GLOB, SCHEDULE_ORDERS
 from .utils import filename_from_path
+from .shards import sharded_hours
 
+logger = logging.getLogger(__name__)
 
-def parse_dates(start: Union[str, None], end: Union[str, None]) -> List[str]:
+
+def parse_dates(
+        start: Union[str, None],
+        end: Union[str, None],
+        exclude_processed: bool = True,
+        dataset: str = DEFAULT_DATASET) -> List[str]:
     """From a start and end date, return a list of urls to download
 
     Arguments:
         start {string, None} -- start date as a string, if None it is set to utcnow minus 24 hours
         end {string, None} -- end date as a string, if None function returns only one URL for the start date
 
+    Keyword Arguments:
+        exclude_processed {bool} -- if True, leave out urls whose results or archives we already have (default: {True})
+        dataset {str} -- which of config.DATASETS to download (default: {config.DEFAULT_DATASET})
+
     Returns:
         List[str] -- list of urls to download
     """
@@ -25,12 +38,12 @@ def parse_dates(start: Union[str, None], end: Union[str, None]) -> List[str]:
     to_download = pd.date_range(start=start, end=end, freq='H')
 
     # load the names of files that we already have
-    exclusion_set = get_exclusion_set()
+    exclusion_set = get_exclusion_set() if exclude_processed else set()
 
     # convert dates to urls, while filtering out dates we already have info for
     date_map_and_filter = filter(
         lambda x: x, map(
-            lambda date: date_to_url(date, exclusion_set),
+            lambda date: date_to_url(date, exclusion_set, dataset),
             to_download))
 
     to_download = list(date_map_and_filter)
@@ -38,6 +51,38 @@ def parse_dates(start: Union[str, None], end: Union[str, None]) -> List[str]:
     return to_download
 
 
+def order_urls(urls: List[str], order: str) -> List[str]:
+    """put urls or paths of hourly files in the order they should be processed in
+
+    Arguments:
+        urls {List[str]} -- urls or paths whose filenames are like "pageviews-20200501-100000.gz"
+        order {str} -- one of config.SCHEDULE_ORDERS
+
+    Raises:
+        ValueError: order is not one of config.SCHEDULE_ORDERS
+
+    Returns:
+        List[str] -- the urls, reordered
+    """
+    if order not in SCHEDULE_ORDERS:
+        raise ValueError(f'unknown order "{order}", expected one of {SCHEDULE_ORDERS}')
+
+    # filenames end in the date and hour, so they sort chronologically within a dataset
+    oldest_first = sorted(
+        urls, key=lambda url: filename_from_path(url).split('-', 1)[-1])
+
+    if order == 'oldest':
+        return oldest_first
+
+    newest_first = oldest_first[::-1]
+    if order == 'newest':
+        return newest_first
+
+    # newest, oldest, second newest, second oldest, ...
+    return [newest_first[i // 2] if i % 2 == 0 else oldest_first[i // 2]
+            for i in range(len(urls))]
+
+
 def parse_start_and_end(
         start: Union[str, None],
         end: Union[str, None],
@@ -109,29 +154,40 @@ def str_to_timestamp(time_str: str) -> pd.Timestamp:
 
 def date_to_url(
         datetime: pd.Timestamp,
-        already_downloaded: Set[str]) -> Union[str, None]:
+        already_downloaded: Set[str],
+        dataset: str = DEFAULT_DATASET) -> Union[str, None]:
     """convert a datetime to its corresponding wiki dump url
 
     Arguments:
         datetime {Timestamp} -- Timestamp whose corresponding wiki pageviews dump will be downloaded
         already_downloaded {Set[str]} -- set of filenames for datetimes whose pageviews have already been downloaded and processed
 
+    Keyword Arguments:
+        dataset {str} -- which of config.DATASETS to get the url for (default: {config.DEFAULT_DATASET})
+
+    Raises:
+        ValueError: dataset is not one of config.DATASETS
+
     Returns:
         string, None -- url to download, or None if data already downloaded and processed
     """
+    if dataset not in DATASETS:
+        raise ValueError(f'unknown dataset "{dataset}", expected one of {list(DATASETS)}')
+
     year = datetime.strftime('%Y')
     year_month = datetime.strftime('%Y-%m')
-    pageviews = datetime.strftime('pageviews-%Y%m%d-%H0000.gz')
+    dump_filename = datetime.strftime(DATASETS[dataset])
 
     # check to see if the file has already been downloaded and processed
-    # we do "pageviews[:-3]" because the string ends in ".gz"
-    if pageviews[:-3] in already_downloaded:
-        print(f'already downloaded {pageviews[:-3]}')
+    # results files are named like the dump, without ".gz"
+    result_filename = filename_from_path(dump_filename, remove_gz=True)
+    if result_filename in already_downloaded:
+        logger.info(f'already downloaded {result_filename}')
         return None
 
     # url looks like:
     # https://dumps.wikimedia.org/other/pageviews/2020/2020-05/pageviews-20200501-100000.gz
-    url = os.path.join(ROOT_URL, year, year_month, pageviews)
+    url = os.path.join(ROOT_URL, year, year_month, dump_filename)
     return url
 
 
@@ -149,9 +205,12 @@ def get_exclusion_set() -> Set[str]:
     downloaded_filenames = set(
         [filename_from_path(p) for p in already_processed])
 
+    # hours stored in result containers are processed too
+    downloaded_filenames = downloaded_filenames.union(sharded_hours())
+
     # for every unprocessed gzip we have in tmp, add to filename
     # to the exclusion set
-    tmp_path = os.path.join(TMP_DIR, '*.gz')
+    tmp_path = os.path.join(TMP_DIR, ARCHIVE_GLOB)
     ready_for_processing = glob.glob(tmp_path)
     downloaded_filenames = downloaded_filenames.union(set(
         [filename_from_path(p, remove_gz=True) for p in ready_for_processing]))
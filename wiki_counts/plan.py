@@ -0,0 +1,361 @@
+import os
+import json
+import math
+import fcntl
+import time
+import asyncio
+import logging
+import statistics
+
+from aiohttp import ClientSession, ClientError
+from collections import deque
+from datetime import timedelta
+from typing import Dict, List, Union
+
+from .config import THROUGHPUT_HISTORY_FILE, PLAN_HISTORY_RECORDS, \
+    THROUGHPUT_HISTORY_RECORDS, THROUGHPUT_HISTORY_BYTES, \
+    DEFAULT_NUM_DOWNLOADERS, ARCHIVE_CACHE_DIR, ARCHIVE_CACHE_BYTES
+from .utils import filename_from_path, dataset_from_path, atomic_open
+from .session import make_session
+
+logger = logging.getLogger(__name__)
+
+# every line of the throughput history is a json object
+#   {"kind": "download" or "analyze", "filename": ..., "bytes": size of the archive,
+#    "seconds": time taken, "time": time.time() when it was recorded}
+# downloads are timed per connection, while sharing the mirror with the other downloaders,
+# so a run's download throughput is estimated as that rate times the number of downloaders
+# once the file is bigger than config.THROUGHPUT_HISTORY_BYTES, the process that appended
+# to it last keeps only its most recent config.THROUGHPUT_HISTORY_RECORDS records
+
+
+def record_throughput(
+        kind: str,
+        filename: str,
+        num_bytes: int,
+        seconds: float,
+        history_file: Union[str, None] = THROUGHPUT_HISTORY_FILE):
+    """append a download or an analysis to the throughput history
+
+    Arguments:
+        kind {str} -- "download" or "analyze"
+        filename {str} -- name of the archive
+        num_bytes {int} -- size of the archive
+        seconds {float} -- seconds it took
+
+    Keyword Arguments:
+        history_file {str, None} -- file to append to, None to not record anything (default: {config.THROUGHPUT_HISTORY_FILE})
+    """
+    if not history_file:
+        return
+
+    line = json.dumps({
+        'kind': kind, 'filename': filename, 'bytes': num_bytes,
+        'seconds': round(seconds, 3), 'time': round(time.time(), 3)})
+
+    # an append of one short line is a single write, so every process can share the file
+    with open(history_file, 'a') as f:
+        f.write(line + '\n')
+        size = f.tell()
+
+    if size > THROUGHPUT_HISTORY_BYTES:
+        trim_history(history_file)
+
+
+def trim_history(
+        history_file: str,
+        num_records: int = THROUGHPUT_HISTORY_RECORDS):
+    """keep only the most recent records of the throughput history
+
+    a record appended by another process while the file is rewritten can be lost,
+    which only leaves the estimates one record short
+
+    Arguments:
+        history_file {str} -- file to trim
+
+    Keyword Arguments:
+        num_records {int} -- number of records to keep (default: {config.THROUGHPUT_HISTORY_RECORDS})
+    """
+    with open(history_file, 'r') as f:
+        # the first process to get the lock trims the file, the others find it already replaced
+        fcntl.flock(f, fcntl.LOCK_EX)
+
+        try:
+            if os.stat(history_file).st_ino != os.fstat(f.fileno()).st_ino:
+                return
+        except FileNotFoundError:
+            return
+
+        lines = deque(f, maxlen=num_records)
+
+        with atomic_open(history_file) as trimmed:
+            trimmed.writelines(lines)
+
+
+def read_history(
+        history_file: Union[str, None] = THROUGHPUT_HISTORY_FILE,
+        num_records: int = THROUGHPUT_HISTORY_RECORDS) -> List[Dict]:
+    """read the most recent records in the throughput history, oldest first
+
+    Keyword Arguments:
+        history_file {str, None} -- file to read (default: {config.THROUGHPUT_HISTORY_FILE})
+        num_records {int} -- number of the most recent records to read (default: {config.THROUGHPUT_HISTORY_RECORDS})
+
+    Returns:
+        List[Dict] -- the records, empty if nothing has been recorded
+    """
+    records = []
+
+    try:
+        with open(history_file, 'r') as f:
+            # only the lines that are kept are parsed
+            for line in deque(f, maxlen=num_records):
+                try:
+                    records.append(json.loads(line))
+                # the last line may have been cut short by a crash
+                except ValueError:
+                    continue
+    except (FileNotFoundError, TypeError):
+        return []
+
+    return records
+
+
+def estimate_rate(
+        records: List[Dict],
+        kind: str,
+        dataset: str,
+        num_records: int = PLAN_HISTORY_RECORDS) -> Union[float, None]:
+    """get the typical throughput of one downloader or file processor from the history
+
+    Arguments:
+        records {List[Dict]} -- throughput history, oldest first
+        kind {str} -- "download" or "analyze"
+        dataset {str} -- which of config.DATASETS to estimate for
+
+    Keyword Arguments:
+        num_records {int} -- number of the most recent records to use (default: {config.PLAN_HISTORY_RECORDS})
+
+    Returns:
+        float, None -- median bytes per second, or None if there are no records
+    """
+    rates = [r['bytes'] / r['seconds'] for r in records
+             if r['kind'] == kind and r['seconds'] > 0
+             and dataset_from_path(r['filename']) == dataset]
+
+    # the median isn't thrown off by the odd stalled download
+    return statistics.median(rates[-num_records:]) if rates else None
+
+
+def estimate_sizes(
+        urls: List[str],
+        records: List[Dict],
+        head_sizes: Union[Dict[str, Union[int, None]], None] = None,
+        num_records: int = PLAN_HISTORY_RECORDS) -> List[Union[int, None]]:
+    """estimate the size of each hour's archive
+
+    a size from a HEAD request is used first, then the recorded size of the same archive,
+    then the median size of the dataset's most recent archives
+
+    Arguments:
+        urls {List[str]} -- urls of the hours
+        records {List[Dict]} -- throughput history, oldest first
+
+    Keyword Arguments:
+        head_sizes {Dict[str, int, None], None} -- sizes from HEAD requests by url, None if none were made (default: {None})
+        num_records {int} -- number of the most recent records to take the median size from (default: {config.PLAN_HISTORY_RECORDS})
+
+    Returns:
+        List[int, None] -- size of each archive, None where there is nothing to estimate it from
+    """
+    recorded = {r['filename']: r['bytes'] for r in records}
+
+    median_sizes = {}
+    for dataset in set(dataset_from_path(url) for url in urls):
+        sizes = [r['bytes'] for r in records
+                 if dataset_from_path(r['filename']) == dataset]
+        median_sizes[dataset] = \
+            statistics.median(sizes[-num_records:]) if sizes else None
+
+    estimates = []
+    for url in urls:
+        size = (head_sizes or {}).get(url)
+        if size is None:
+            size = recorded.get(filename_from_path(url))
+        if size is None:
+            size = median_sizes[dataset_from_path(url)]
+
+        estimates.append(size)
+
+    return estimates
+
+
+async def fetch_sizes(
+        urls: List[str],
+        num_workers: int = DEFAULT_NUM_DOWNLOADERS) -> Dict[str, Union[int, None]]:
+    """get the size of each hour's archive from HEAD requests, without downloading anything
+
+    Arguments:
+        urls {List[str]} -- urls of the hours
+
+    Keyword Arguments:
+        num_workers {int} -- number of requests made at once (default: {config.DEFAULT_NUM_DOWNLOADERS})
+
+    Returns:
+        Dict[str, int, None] -- size of each url's archive, None if it couldn't be found
+    """
+    async def fetch_size(session: ClientSession, url: str):
+        try:
+            async with session.head(url) as response:
+                if response.status == 200:
+                    return url, response.content_length
+
+                logger.warning(f'code {response.status}: no size for {filename_from_path(url)}')
+        except ClientError as e:
+            logger.warning(f'could not get the size of {filename_from_path(url)}: {e!r}')
+
+        return url, None
+
+    # the mirror only allows a few connections at once, HEAD requests included,
+    # which the session's connection limit keeps to
+    async with make_session(num_workers) as session:
+        return dict(await asyncio.gather(*(fetch_size(session, url) for url in urls)))
+
+
+def make_plan(
+        urls: List[str],
+        records: List[Dict],
+        head_sizes: Union[Dict[str, Union[int, None]], None] = None,
+        num_downloaders: int = DEFAULT_NUM_DOWNLOADERS,
+        cpu_count: int = 1) -> Dict:
+    """estimate what downloading and analyzing a range of hours will take
+
+    Arguments:
+        urls {List[str]} -- urls of the hours still to be processed, of one dataset
+        records {List[Dict]} -- throughput history, oldest first
+
+    Keyword Arguments:
+        head_sizes {Dict[str, int, None], None} -- sizes from HEAD requests by url, None to estimate them from the history (default: {None})
+        num_downloaders {int} -- number of downloaders the run will use (default: {config.DEFAULT_NUM_DOWNLOADERS})
+        cpu_count {int} -- number of cpus on the machine the run will use (default: {1})
+
+    Returns:
+        Dict -- "hours", "unknown_sizes", "total_bytes", "downloaders", "file_processors", "download_seconds",
+                "analyze_seconds", "duration_seconds", "tmp_bytes", and "cache_bytes", None where there is no history to estimate from
+    """
+    plan = dict.fromkeys([
+        'total_bytes', 'file_processors', 'download_seconds',
+        'analyze_seconds', 'duration_seconds', 'tmp_bytes', 'cache_bytes'])
+    plan['hours'] = len(urls)
+    plan['downloaders'] = min(num_downloaders, len(urls))
+
+    sizes = estimate_sizes(urls, records, head_sizes)
+    known_sizes = [size for size in sizes if size is not None]
+    plan['unknown_sizes'] = len(sizes) - len(known_sizes)
+
+    if not known_sizes:
+        return plan
+
+    # hours without a size are assumed to be as big as the others
+    total_bytes = sum(known_sizes) * len(sizes) / len(known_sizes)
+    largest = max(known_sizes)
+    plan['total_bytes'] = total_bytes
+
+    # archives are kept after being analyzed, up to the size of the cache
+    if ARCHIVE_CACHE_DIR:
+        plan['cache_bytes'] = min(total_bytes, ARCHIVE_CACHE_BYTES)
+
+    dataset = dataset_from_path(urls[0])
+    download_rate = estimate_rate(records, 'download', dataset)
+    analyze_rate = estimate_rate(records, 'analyze', dataset)
+
+    if download_rate is None or analyze_rate is None:
+        return plan
+
+    # enough file processors to keep up with the downloads, leaving a cpu for the downloader
+    download_throughput = download_rate * plan['downloaders']
+    file_processors = min(
+        max(1, math.ceil(download_throughput / analyze_rate)),
+        max(1, cpu_count - 1))
+    analyze_throughput = analyze_rate * file_processors
+
+    plan['file_processors'] = file_processors
+    plan['download_seconds'] = total_bytes / download_throughput
+    plan['analyze_seconds'] = total_bytes / analyze_throughput
+
+    # the analyzers can't finish before the downloads, and the last archive is analyzed after it arrives
+    plan['duration_seconds'] = \
+        max(plan['download_seconds'], plan['analyze_seconds']) + largest / analyze_rate
+
+    # archives being analyzed and waiting for a processor, plus the backlog that builds up
+    # over the run if the processors can't keep up
+    backlog = max(0, download_throughput - analyze_throughput) * plan['download_seconds']
+    plan['tmp_bytes'] = largest * (plan['downloaders'] + file_processors) + backlog
+
+    return plan
+
+
+def plan_lines(plan: Dict) -> List[str]:
+    """describe a plan made by make_plan
+
+    Arguments:
+        plan {Dict} -- the plan
+
+    Returns:
+        List[str] -- lines to log
+    """
+    if not plan['hours']:
+        return ['every hour in the range already has results, nothing to do']
+
+    lines = [f'{plan["hours"]} hours to download and analyze']
+
+    if plan['total_bytes'] is None:
+        lines.append('no recorded downloads to estimate sizes from, use --head to get them from the mirror')
+        return lines
+
+    lines.append(f'about {format_bytes(plan["total_bytes"])} to download')
+    if plan['unknown_sizes']:
+        lines.append(f'{plan["unknown_sizes"]} hours have no known size, and are assumed to be as big as the others')
+
+    if plan['duration_seconds'] is None:
+        lines.append('no recorded downloads and analyses of this dataset to estimate throughput from')
+    else:
+        lines.append(f'about {format_seconds(plan["duration_seconds"])} with {plan["downloaders"]} downloaders '
+                     f'and {plan["file_processors"]} file processors')
+        lines.append(f'downloading takes about {format_seconds(plan["download_seconds"])}, '
+                     f'analyzing about {format_seconds(plan["analyze_seconds"])}')
+        lines.append(f'tmp needs at most about {format_bytes(plan["tmp_bytes"])}')
+
+    if plan['cache_bytes'] is not None:
+        lines.append(f'the archive cache needs about {format_bytes(plan["cache_bytes"])}')
+
+    return lines
+
+
+def format_bytes(num_bytes: float) -> str:
+    """format a number of bytes for people
+
+    Arguments:
+        num_bytes {float} -- number of bytes
+
+    Returns:
+        str -- e.g. "1.5 GiB"
+    """
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if num_bytes < 1024:
+            return f'{num_bytes:.1f} {unit}'
+        num_bytes /= 1024
+
+    return f'{num_bytes:.1f} TiB'
+
+
+def format_seconds(seconds: float) -> str:
+    """format a duration for people
+
+    Arguments:
+        seconds {float} -- duration in seconds
+
+    Returns:
+        str -- e.g. "2 days, 3:04:05"
+    """
+    return str(timedelta(seconds=round(seconds)))
@@ -0,0 +1,347 @@
+import os
+import asyncio
+import pandas as pd
+
+from aiohttp import web
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, Tuple, Union
+
+from .config import RESULTS_DIR, QUERY_CACHE_HOURS, QUERY_MAX_RANGE_HOURS, \
+    TOP_N_PAGEVIEWS, TITLE_DICT_FILE, TITLE_SAVE_INTERVAL, SHARDS_DIR
+from .parse_dates import str_to_timestamp
+from .shards import read_hour, index_mtime
+from .titles import TitleDictionary, EncodedPages, encode_pages, merge_pages
+
+# a cached hour: keys are domains, values are (title ids, count_views), most viewed first
+EncodedHour = Dict[str, EncodedPages]
+
+
+class ResultsCache:
+    """least recently used cache of parsed results files
+
+    files are only parsed the first time an hour is asked for, and are
+    re-parsed if they have been rewritten since they were cached. page titles
+    are held as ids from a shared TitleDictionary, so a title that is popular
+    for many hours is only stored once
+
+    the dictionary only grows: titles of evicted hours keep their ids, in memory
+    and in the saved file, so a service that answers queries over many hours holds
+    every title it has seen. delete the titles file while the service is stopped
+    to start it over
+    """
+
+    def __init__(
+            self,
+            results_dir: str = RESULTS_DIR,
+            max_hours: int = QUERY_CACHE_HOURS,
+            titles_path: Union[str, None] = TITLE_DICT_FILE,
+            shards_dir: str = SHARDS_DIR):
+        """
+        Keyword Arguments:
+            results_dir {str} -- directory containing results files (default: {config.RESULTS_DIR})
+            max_hours {int} -- number of parsed hours to keep in memory (default: {config.QUERY_CACHE_HOURS})
+            titles_path {str, None} -- file the title dictionary is kept in, None to keep it in memory only (default: {config.TITLE_DICT_FILE})
+            shards_dir {str} -- directory containing result containers, for hours that are not in results_dir (default: {config.SHARDS_DIR})
+        """
+        self.results_dir = results_dir
+        self.shards_dir = shards_dir
+        self.max_hours = max_hours
+
+        # loading the saved dictionary keeps ids stable across restarts
+        self.titles_path = titles_path
+        self.titles = TitleDictionary.load(titles_path) if titles_path \
+            else TitleDictionary()
+
+        # filename -> (mtime of the file when parsed, parsed results)
+        self.hours: OrderedDict = OrderedDict()
+
+    def lookup(self, filename: str) -> Union[EncodedHour, None]:
+        """get a cached hour, if it is cached and up to date
+
+        Arguments:
+            filename {str} -- name of the results file, e.g. "pageviews-20200501-100000"
+
+        Returns:
+            EncodedHour, None -- parsed hour, or None if it needs to be loaded
+        """
+        if filename not in self.hours:
+            return None
+
+        mtime, parsed = self.hours[filename]
+
+        # the analyzer may have rewritten the file since we parsed it
+        if self.mtime(filename) != mtime:
+            del self.hours[filename]
+            return None
+
+        self.hours.move_to_end(filename)
+        return parsed
+
+    def load(self, filename: str) -> Union[Tuple[float, EncodedHour], None]:
+        """parse a results file from disk and encode its titles, without touching the cache
+
+        this is safe to call from an executor thread
+
+        Arguments:
+            filename {str} -- name of the results file
+
+        Returns:
+            Tuple[float, EncodedHour], None -- mtime and parsed hour, or None if there are no results for the hour
+        """
+        mtime = self.mtime(filename)
+        if mtime is None:
+            return None
+
+        result_path = os.path.join(self.results_dir, filename)
+        if os.path.exists(result_path):
+            with open(result_path, 'r') as f:
+                lines = f.readlines()
+        else:
+            lines = read_hour(filename, self.shards_dir)
+            if lines is None:
+                return None
+
+        parsed = parse_results_lines(lines)
+        encoded = {domain: encode_pages(self.titles, domain, pages)
+                   for domain, pages in parsed.items()}
+
+        return mtime, encoded
+
+    def save_titles(self):
+        """append the titles given ids since the last save to the titles file, if there are any"""
+        if self.titles_path:
+            self.titles.save(self.titles_path)
+
+    def store(
+            self, filename: str, mtime: float,
+            parsed: EncodedHour):
+        """add a parsed hour to the cache, evicting the least recently used hour if full
+
+        Arguments:
+            filename {str} -- name of the results file
+            mtime {float} -- mtime of the file when it was parsed
+            parsed {EncodedHour} -- parsed hour
+        """
+        self.hours[filename] = (mtime, parsed)
+        self.hours.move_to_end(filename)
+
+        while len(self.hours) > self.max_hours:
+            self.hours.popitem(last=False)
+
+    async def get(self, filename: str) -> Union[EncodedHour, None]:
+        """get a parsed hour, loading it from disk if needed
+
+        Arguments:
+            filename {str} -- name of the results file
+
+        Returns:
+            EncodedHour, None -- parsed hour, or None if there are no results for the hour
+        """
+        parsed = self.lookup(filename)
+        if parsed is not None:
+            return parsed
+
+        # parse off the event loop so hot hours keep being served meanwhile
+        loop = asyncio.get_running_loop()
+        loaded = await loop.run_in_executor(None, self.load, filename)
+        if loaded is None:
+            return None
+
+        mtime, parsed = loaded
+        self.store(filename, mtime, parsed)
+        return parsed
+
+    def mtime(self, filename: str) -> Union[float, None]:
+        try:
+            return os.stat(os.path.join(self.results_dir, filename)).st_mtime
+        # the hour may be stored in a container, which changes whenever any of its hours is appended
+        except FileNotFoundError:
+            return index_mtime(filename, self.shards_dir)
+
+
+def parse_results_file(result_path: str) -> Dict[str, List[Tuple[int, str]]]:
+    """read a file written by persist_results
+
+    Arguments:
+        result_path {str} -- path to the results file
+
+    Returns:
+        Dict[str, List[Tuple[int, str]]] -- keys are domains, values are (count_views, page_title) tuples, most viewed first
+    """
+    with open(result_path, 'r') as f:
+        return parse_results_lines(f)
+
+
+def parse_results_lines(lines: Iterable[str]) -> Dict[str, List[Tuple[int, str]]]:
+    """parse the lines of a results file
+
+    Arguments:
+        lines {Iterable[str]} -- lines of a results file
+
+    Returns:
+        Dict[str, List[Tuple[int, str]]] -- keys are domains, values are (count_views, page_title) tuples, most viewed first
+    """
+    parsed = defaultdict(list)
+
+    for line in lines:
+        domain, page_title, count_views = line.split()
+        parsed[domain].append((int(count_views), page_title))
+
+    # results files list each domain in increasing order of views
+    for heap in parsed.values():
+        heap.reverse()
+
+    return dict(parsed)
+
+
+def hour_to_filename(hour: Union[str, pd.Timestamp]) -> str:
+    """convert an hour to the name of its results file
+
+    Arguments:
+        hour {str, Timestamp} -- hour as a string or Timestamp
+
+    Returns:
+        str -- name of the results file, e.g. "pageviews-20200501-100000"
+    """
+    if isinstance(hour, str):
+        hour = str_to_timestamp(hour)
+
+    return hour.strftime('pageviews-%Y%m%d-%H0000')
+
+
+def top_over_hours(
+        hours: List[EncodedHour],
+        domain: str, n: int) -> EncodedPages:
+    """sum the views of a domain's pages over several hours, and get the top n
+
+    only pages that made an hour's results count towards that hour,
+    so totals are a lower bound for pages near the cutoff
+
+    Arguments:
+        hours {List[EncodedHour]} -- parsed hours
+        domain {str} -- domain code
+        n {int} -- number of pages to return
+
+    Returns:
+        EncodedPages -- (title ids, count_views) arrays, most viewed first
+    """
+    ids, counts = merge_pages(
+        [parsed[domain] for parsed in hours if domain in parsed])
+
+    return ids[:n], counts[:n]
+
+
+def pages_to_json(titles: TitleDictionary, pages: EncodedPages) -> List[Dict]:
+    ids, counts = pages
+    return [{'page_title': titles.lookup(title_id)[1],
+             'count_views': int(count_views)}
+            for title_id, count_views in zip(ids, counts)]
+
+
+async def handle_top(request: web.Request) -> web.Response:
+    """answer "top n for domain d at hour h", or "over range start to end"
+
+    query parameters: hour, or start and end at most config.QUERY_MAX_RANGE_HOURS apart, and optionally n
+    """
+    cache = request.app['cache']
+    domain = request.match_info['domain']
+    params = request.query
+
+    try:
+        n = int(params.get('n', TOP_N_PAGEVIEWS))
+        # slicing with n <= 0 would quietly return a truncated list
+        if n <= 0:
+            raise ValueError('n must be at least 1')
+
+        if 'hour' in params:
+            filename = hour_to_filename(params['hour'])
+            parsed = await cache.get(filename)
+            if parsed is None:
+                raise web.HTTPNotFound(text=f'no results for {filename}')
+
+            ids, counts = parsed.get(domain, merge_pages([]))
+
+            return web.json_response({
+                'domain': domain,
+                'hour': filename,
+                'pages': pages_to_json(cache.titles, (ids[:n], counts[:n]))})
+
+        start = str_to_timestamp(params['start'])
+        end = str_to_timestamp(params['end'])
+        # an empty parameter parses as NaT, which every comparison is False for
+        if pd.isnull(start) or pd.isnull(end):
+            raise ValueError('start and end must both be dates')
+    except (KeyError, ValueError) as e:
+        raise web.HTTPBadRequest(text=f'bad query: {e}')
+
+    if end < start:
+        raise web.HTTPBadRequest(text='end date cannot be before start date')
+
+    # checked before any filenames are built, so a huge range can't hold up the event loop
+    # the difference is taken in integer nanoseconds, as a Timedelta only covers 292 years
+    num_hours = (end.value - start.value) // pd.Timedelta(hours=1).value + 1
+    if num_hours > QUERY_MAX_RANGE_HOURS:
+        raise web.HTTPBadRequest(
+            text=f'range covers {num_hours} hours, at most {QUERY_MAX_RANGE_HOURS} are allowed')
+
+    filenames = [hour_to_filename(hour)
+                 for hour in pd.date_range(start=start, end=end, freq='H')]
+
+    # hours that aren't cached are loaded at once, rather than one after another
+    hours = await asyncio.gather(*(cache.get(filename) for filename in filenames))
+    hours = [parsed for parsed in hours if parsed is not None]
+
+    return web.json_response({
+        'domain': domain,
+        'start': filenames[0],
+        'end': filenames[-1],
+        'hours_found': len(hours),
+        'pages': pages_to_json(
+            cache.titles, top_over_hours(hours, domain, n))})
+
+
+def make_app(cache: Union[ResultsCache, None] = None) -> web.Application:
+    """build the query service
+
+    Keyword Arguments:
+        cache {ResultsCache, None} -- cache to serve results from, if None one is made over config.RESULTS_DIR (default: {None})
+
+    Returns:
+        web.Application -- aiohttp application
+    """
+    app = web.Application()
+    app['cache'] = cache if cache is not None else ResultsCache()
+    app.router.add_get('/top/{domain}', handle_top)
+    app.cleanup_ctx.append(save_titles_periodically)
+
+    return app
+
+
+async def save_titles_periodically(app: web.Application):
+    """save the title dictionary in batches while the service runs, and once more when it stops
+
+    Arguments:
+        app {web.Application} -- the query service
+    """
+    cache = app['cache']
+
+    async def save_every_interval():
+        while True:
+            await asyncio.sleep(TITLE_SAVE_INTERVAL)
+            await asyncio.get_running_loop().run_in_executor(None, cache.save_titles)
+
+    task = asyncio.create_task(save_every_interval())
+
+    yield
+
+    task.cancel()
+    cache.save_titles()
+
+
+def run_query_service(port: int):
+    """serve queries over the results directory until interrupted
+
+    Arguments:
+        port {int} -- port to listen on
+    """
+    web.run_app(make_app(), port=port)
@@ -0,0 +1,216 @@
+import io
+import queue
+import threading
+import zlib
+
+from typing import BinaryIO, Iterator, List, Union
+
+from .config import READAHEAD_BLOCK_BYTES, READAHEAD_BUFFERS
+
+# a file processor reads a gzip archive with two threads:
+#   - the read-ahead thread takes a free buffer from the pool, inflates the archive into it
+#     until it holds block_bytes, and puts (buffer, length) on the queue of full blocks
+#   - the main thread takes a full block, decodes its complete lines, puts the buffer back
+#     in the pool, and hands the lines to the analysis while the next block is inflated
+# zlib and file reads release the GIL, so inflating and parsing overlap on separate cores,
+# and the buffers are allocated once per archive instead of once per block
+
+# uncompressed bytes in each block of a reader opened directly, e.g. by the benchmark,
+# which is 1 MiB while config.READAHEAD_BLOCK_BYTES is None
+BLOCK_BYTES = READAHEAD_BLOCK_BYTES or 1024 ** 2
+
+# compressed bytes read from the archive at a time
+READ_BYTES = 256 * 1024
+
+# zlib wbits that accept a gzip header and trailer
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# put on the queue of full blocks once the whole archive has been inflated
+_END = None
+
+
+class ReadAheadReader:
+    """text lines of a gzip archive, inflated a block ahead of the reader in a background thread
+
+    iterating gives the same lines as gzip.open(..., 'rt'), split on "\\n" only. archives
+    made of several gzip members, like the ones gzip_index.index_archive writes, are read
+    through to the end
+    """
+
+    def __init__(
+            self,
+            fileobj: BinaryIO,
+            block_bytes: int = BLOCK_BYTES,
+            num_buffers: int = READAHEAD_BUFFERS):
+        """
+        Arguments:
+            fileobj {BinaryIO} -- binary file object of the archive, closed along with the reader
+
+        Keyword Arguments:
+            block_bytes {int} -- uncompressed bytes in each block (default: {config.READAHEAD_BLOCK_BYTES, or 1 MiB if it's None})
+            num_buffers {int} -- number of blocks in the pool, 2 parses one while the next is inflated (default: {config.READAHEAD_BUFFERS})
+        """
+        self.fileobj = fileobj
+        self.block_bytes = block_bytes
+
+        self.free = queue.Queue()
+        for _ in range(max(1, num_buffers)):
+            self.free.put(bytearray(block_bytes))
+
+        self.full = queue.Queue()
+        self.stopped = threading.Event()
+
+        self.thread = threading.Thread(target=self.inflate, daemon=True)
+        self.thread.start()
+
+    def next_buffer(self) -> Union[bytearray, None]:
+        """take a free buffer from the pool, or None if the reader was closed"""
+        buffer = self.free.get()
+        return None if self.stopped.is_set() else buffer
+
+    def inflate(self):
+        """read-ahead thread - inflate the archive into the pool's buffers, one block at a time"""
+        try:
+            decompressor = zlib.decompressobj(GZIP_WBITS)
+            pending = b''
+            in_member = False
+            # whether the last call filled the block, in which case zlib may still hold
+            # output for the input it has already taken
+            limited = False
+
+            buffer = self.next_buffer()
+            if buffer is None:
+                return
+            view = memoryview(buffer)
+            length = 0
+
+            while True:
+                if not pending and not limited:
+                    pending = self.fileobj.read(READ_BYTES)
+                    if not pending:
+                        break
+
+                # gzip files can be padded with zeroes between and after members
+                if not in_member:
+                    pending = pending.lstrip(b'\x00')
+                    if not pending:
+                        continue
+                    in_member = True
+
+                # max_length keeps the output within what's left of the block,
+                # the rest of the input is kept in unconsumed_tail for the next one
+                max_length = self.block_bytes - length
+                out = decompressor.decompress(pending, max_length)
+                view[length:length + len(out)] = out
+                length += len(out)
+                limited = len(out) == max_length
+
+                if decompressor.eof:
+                    # anything after the end of a member is the start of the next one
+                    pending = decompressor.unused_data
+                    decompressor = zlib.decompressobj(GZIP_WBITS)
+                    in_member = limited = False
+                else:
+                    pending = decompressor.unconsumed_tail
+
+                if length == self.block_bytes:
+                    view.release()
+                    self.full.put((buffer, length))
+
+                    buffer = self.next_buffer()
+                    if buffer is None:
+                        return
+                    view = memoryview(buffer)
+                    length = 0
+
+            if in_member:
+                raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+
+            view.release()
+            if length:
+                self.full.put((buffer, length))
+            self.full.put(_END)
+
+        # the main thread raises whatever went wrong when it gets to this block
+        except BaseException as e:
+            self.full.put(e)
+
+    def __iter__(self) -> Iterator[str]:
+        # the part of a line cut off at the end of the previous block
+        carry = b''
+
+        while True:
+            block = self.full.get()
+
+            if block is _END:
+                break
+            if isinstance(block, BaseException):
+                raise block
+
+            buffer, length = block
+            end = buffer.rfind(b'\n', 0, length) + 1
+
+            # blocks are only cut between lines, so a multi-byte character is never split
+            if end:
+                first = buffer.find(b'\n', 0, end) + 1
+                with memoryview(buffer) as view:
+                    head = (carry + view[:first]).decode('utf-8')
+                    text = str(view[first:end], 'utf-8')
+                    carry = bytes(view[end:length])
+            else:
+                # a single line longer than the block
+                head = text = ''
+                carry += buffer[:length]
+
+            # the thread can fill the buffer again while these lines are parsed
+            self.free.put(buffer)
+
+            if head:
+                yield head
+
+            lines = text.split('\n')
+            lines.pop()
+            for line in lines:
+                yield line + '\n'
+
+        if carry:
+            yield carry.decode('utf-8')
+
+    def readlines(self) -> List[str]:
+        return list(self)
+
+    def close(self):
+        """stop the read-ahead thread and close the archive"""
+        if not self.stopped.is_set():
+            self.stopped.set()
+
+            # wake the thread if it's waiting for a buffer, so it sees it was stopped
+            self.free.put(bytearray(0))
+            self.thread.join()
+
+            self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_readahead(file_path: str, fileobj=None, **kwargs) -> ReadAheadReader:
+    """open a gzip archive to read its lines with a read-ahead thread
+
+    Arguments:
+        file_path {str} -- path to the archive
+
+    Keyword Arguments:
+        fileobj {file object, None} -- binary file object to read the archive from instead of file_path (default: {None})
+        **kwargs -- passed to ReadAheadReader
+
+    Returns:
+        ReadAheadReader -- iterable of the archive's lines
+    """
+    if fileobj is not None:
+        return ReadAheadReader(io.BufferedReader(fileobj), **kwargs)
+
+    return ReadAheadReader(open(file_path, 'rb'), **kwargs)
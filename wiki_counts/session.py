@@ -0,0 +1,38 @@
+import inspect
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from .config import DEFAULT_NUM_DOWNLOADERS, HTTP_KEEPALIVE_SECONDS, \
+    HTTP_DNS_CACHE_SECONDS, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_READ_BUFSIZE
+
+# the read buffer can only be sized from aiohttp 3.7 on, env.yaml's 3.6.2 keeps its default
+READ_BUFSIZE_KWARGS = \
+    {'read_bufsize': HTTP_READ_BUFSIZE} \
+    if 'read_bufsize' in inspect.signature(ClientSession).parameters else {}
+
+
+def make_session(num_connections: int = DEFAULT_NUM_DOWNLOADERS) -> ClientSession:
+    """make a session for downloading from the mirror, tuned for a few long transfers
+
+    must be called, and used as "async with make_session(...) as session", inside a running event loop
+
+    Keyword Arguments:
+        num_connections {int} -- most connections open at once, usually the number of downloaders (default: {config.DEFAULT_NUM_DOWNLOADERS})
+
+    Returns:
+        ClientSession -- the session
+    """
+    # every download goes to the same host, so the per host limit is the real limit, and
+    # idle connections are kept for the next download instead of being opened again
+    connector = TCPConnector(
+        limit=num_connections,
+        limit_per_host=num_connections,
+        ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+        keepalive_timeout=HTTP_KEEPALIVE_SECONDS)
+
+    # aiohttp's default gives up on any request after 5 minutes, which a big archive can take
+    timeout = ClientTimeout(
+        total=None, connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT)
+
+    return ClientSession(
+        connector=connector, timeout=timeout, **READ_BUFSIZE_KWARGS)
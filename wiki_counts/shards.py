@@ -0,0 +1,222 @@
+import os
+import glob
+import zlib
+import fcntl
+import logging
+
+from typing import Dict, List, Set, Tuple, Union
+
+from .config import SHARDS_DIR, SHARD_PERIOD
+
+logger = logging.getLogger(__name__)
+
+# a container is two files:
+#   <shard>.data -- every hour's results file, compressed on its own with zlib, one after another
+#   <shard>.idx -- one line per hour, "filename offset length", giving where the hour is in .data
+# an hour is written to .data first and only then added to .idx, so a crash mid-append
+# leaves unreferenced bytes at the end of .data rather than a corrupt hour. if an hour
+# is appended again, its last line in .idx wins
+
+
+def shard_name(filename: str, period: str = SHARD_PERIOD) -> str:
+    """get the name of the container an hour belongs in
+
+    Arguments:
+        filename {str} -- name of the results file, e.g. "pageviews-20200501-100000"
+
+    Keyword Arguments:
+        period {str} -- 'day' or 'month' (default: {config.SHARD_PERIOD})
+
+    Returns:
+        str -- name of the container, e.g. "pageviews-20200501" for a day
+    """
+    dataset, date, _ = filename.split('-')
+    return f'{dataset}-{date[:8] if period == "day" else date[:6]}'
+
+
+def append_hour(
+        filename: str,
+        lines: List[str],
+        shards_dir: str = SHARDS_DIR,
+        period: str = SHARD_PERIOD):
+    """compress an hour's results and append them to their container
+
+    Arguments:
+        filename {str} -- name of the results file, e.g. "pageviews-20200501-100000"
+        lines {List[str]} -- lines of the results file
+
+    Keyword Arguments:
+        shards_dir {str} -- directory that contains the containers (default: {config.SHARDS_DIR})
+        period {str} -- 'day' or 'month' (default: {config.SHARD_PERIOD})
+    """
+    shard_path = os.path.join(shards_dir, shard_name(filename, period))
+    compressed = zlib.compress(''.join(lines).encode('utf-8'))
+
+    # several analyzers may finish hours of the same day at once
+    with open(shard_path + '.idx', 'a') as index:
+        fcntl.flock(index, fcntl.LOCK_EX)
+
+        with open(shard_path + '.data', 'ab') as data:
+            offset = data.seek(0, os.SEEK_END)
+            data.write(compressed)
+            data.flush()
+            os.fsync(data.fileno())
+
+        index.write(f'{filename} {offset} {len(compressed)}\n')
+        index.flush()
+        os.fsync(index.fileno())
+
+
+def read_index(shard_path: str) -> Dict[str, Tuple[int, int]]:
+    """read a container's index
+
+    Arguments:
+        shard_path {str} -- path to the container, without the .idx or .data extension
+
+    Returns:
+        Dict[str, Tuple[int, int]] -- keys are results filenames, values are (offset, length) in the data file
+    """
+    index = {}
+
+    try:
+        with open(shard_path + '.idx', 'r') as f:
+            for line in f:
+                split = line.split()
+
+                # a line cut short by a crash
+                if len(split) != 3:
+                    continue
+
+                filename, offset, length = split
+                index[filename] = (int(offset), int(length))
+    except FileNotFoundError:
+        pass
+
+    return index
+
+
+def read_hour(
+        filename: str,
+        shards_dir: str = SHARDS_DIR,
+        period: str = SHARD_PERIOD) -> Union[List[str], None]:
+    """read one hour's results out of its container, without decompressing the other hours
+
+    Arguments:
+        filename {str} -- name of the results file, e.g. "pageviews-20200501-100000"
+
+    Keyword Arguments:
+        shards_dir {str} -- directory that contains the containers (default: {config.SHARDS_DIR})
+        period {str} -- 'day' or 'month' (default: {config.SHARD_PERIOD})
+
+    Returns:
+        List[str], None -- lines of the results file, or None if the hour is not in its container
+    """
+    shard_path = os.path.join(shards_dir, shard_name(filename, period))
+    index = read_index(shard_path)
+
+    if filename not in index:
+        return None
+
+    offset, length = index[filename]
+
+    with open(shard_path + '.data', 'rb') as f:
+        f.seek(offset)
+        compressed = f.read(length)
+
+    return zlib.decompress(compressed).decode('utf-8').splitlines(keepends=True)
+
+
+def has_hour(
+        filename: str,
+        shards_dir: str = SHARDS_DIR,
+        period: str = SHARD_PERIOD) -> bool:
+    """check if an hour is in its container, from the index alone
+
+    Arguments:
+        filename {str} -- name of the results file, e.g. "pageviews-20200501-100000"
+
+    Keyword Arguments:
+        shards_dir {str} -- directory that contains the containers (default: {config.SHARDS_DIR})
+        period {str} -- 'day' or 'month' (default: {config.SHARD_PERIOD})
+
+    Returns:
+        bool -- True if the hour has been appended to its container
+    """
+    return filename in read_index(os.path.join(shards_dir, shard_name(filename, period)))
+
+
+def index_mtime(
+        filename: str,
+        shards_dir: str = SHARDS_DIR,
+        period: str = SHARD_PERIOD) -> Union[float, None]:
+    """get the last time the container an hour belongs in was appended to
+
+    Arguments:
+        filename {str} -- name of the results file
+
+    Keyword Arguments:
+        shards_dir {str} -- directory that contains the containers (default: {config.SHARDS_DIR})
+        period {str} -- 'day' or 'month' (default: {config.SHARD_PERIOD})
+
+    Returns:
+        float, None -- mtime of the container's index, or None if there is no container
+    """
+    shard_path = os.path.join(shards_dir, shard_name(filename, period))
+
+    try:
+        return os.stat(shard_path + '.idx').st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def sharded_hours(shards_dir: str = SHARDS_DIR) -> Set[str]:
+    """list every hour stored in any container
+
+    Keyword Arguments:
+        shards_dir {str} -- directory that contains the containers (default: {config.SHARDS_DIR})
+
+    Returns:
+        Set[str] -- names of the results files stored in containers
+    """
+    hours = set()
+
+    for index_path in glob.glob(os.path.join(shards_dir, '*.idx')):
+        hours.update(read_index(index_path[:-len('.idx')]))
+
+    return hours
+
+
+def convert_results_tree(
+        results_dir: str,
+        shards_dir: str = SHARDS_DIR,
+        period: str = SHARD_PERIOD) -> int:
+    """move every results file in a directory into containers
+
+    each file is only removed once it has been appended, so the conversion
+    can be stopped and run again
+
+    Arguments:
+        results_dir {str} -- directory of one results file per hour
+
+    Keyword Arguments:
+        shards_dir {str} -- directory that contains the containers (default: {config.SHARDS_DIR})
+        period {str} -- 'day' or 'month' (default: {config.SHARD_PERIOD})
+
+    Returns:
+        int -- number of results files converted
+    """
+    if not os.path.exists(shards_dir):
+        os.makedirs(shards_dir)
+
+    # results files are named like "pageviews-20200501-100000"
+    paths = sorted(glob.glob(os.path.join(results_dir, '*-*-*')))
+
+    for path in paths:
+        with open(path, 'r') as f:
+            lines = f.readlines()
+
+        append_hour(os.path.basename(path), lines, shards_dir, period)
+        os.remove(path)
+
+    logger.info(f'converted {len(paths)} results files into containers in {shards_dir}')
+    return len(paths)
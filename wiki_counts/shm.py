@@ -0,0 +1,123 @@
+import io
+import logging
+
+from contextlib import contextmanager
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Tuple, Union
+
+from .config import SHM_SEGMENTS, SHM_SEGMENT_BYTES
+
+logger = logging.getLogger(__name__)
+
+# the downloader and the file processors share a fixed pool of segments:
+#   - the parent process creates the segments and puts their names on a queue of free segments
+#   - the downloader takes a free segment, copies a downloaded archive into it, and puts
+#     (segment name, size of the archive, filename) on the queue of files to analyze
+#   - the file processor reads the archive straight out of the segment, then puts the
+#     segment's name back on the queue of free segments
+# so no more than SHM_SEGMENTS archives are ever held in memory
+
+# what is put on the queue of files to analyze for an archive in a segment
+SegmentItem = Tuple[str, int, str]
+
+
+class SegmentReader(io.RawIOBase):
+    """read-only file object over the start of a shared memory segment
+
+    reads are copied out of the segment into the caller's buffer, so the
+    archive is never copied whole
+    """
+
+    def __init__(self, buf: memoryview, size: int):
+        """
+        Arguments:
+            buf {memoryview} -- buffer of the segment
+            size {int} -- number of bytes of the segment that hold the archive
+        """
+        self.view = buf[:size]
+        self.pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = min(len(b), len(self.view) - self.pos)
+        b[:n] = self.view[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+    def close(self):
+        # the segment can't be closed while a view of it exists
+        if not self.closed:
+            self.view.release()
+        super().close()
+
+
+def create_segments(
+        num_segments: int = SHM_SEGMENTS,
+        segment_bytes: int = SHM_SEGMENT_BYTES) -> List[SharedMemory]:
+    """create the pool of segments, which the creating process is responsible for destroying
+
+    Keyword Arguments:
+        num_segments {int} -- number of segments (default: {config.SHM_SEGMENTS})
+        segment_bytes {int} -- size of each segment (default: {config.SHM_SEGMENT_BYTES})
+
+    Returns:
+        List[SharedMemory] -- the segments
+    """
+    return [SharedMemory(create=True, size=segment_bytes)
+            for _ in range(num_segments)]
+
+
+def destroy_segments(segments: List[SharedMemory]):
+    """free the memory of every segment in the pool
+
+    Arguments:
+        segments {List[SharedMemory]} -- segments made by create_segments
+    """
+    for segment in segments:
+        segment.close()
+        segment.unlink()
+
+
+def write_segment(name: str, contents: Union[bytes, bytearray]) -> bool:
+    """copy an archive into a segment
+
+    Arguments:
+        name {str} -- name of the segment
+        contents {bytes, bytearray} -- the archive
+
+    Returns:
+        bool -- True if it fit, False if the archive is bigger than the segment
+    """
+    segment = SharedMemory(name=name)
+
+    try:
+        if len(contents) > segment.size:
+            return False
+
+        segment.buf[:len(contents)] = contents
+        return True
+    finally:
+        segment.close()
+
+
+@contextmanager
+def open_segment(name: str, size: int):
+    """attach to a segment and read the archive in it
+
+    Arguments:
+        name {str} -- name of the segment
+        size {int} -- size of the archive in the segment
+
+    Yields:
+        SegmentReader -- binary file object over the archive
+    """
+    segment = SharedMemory(name=name)
+    reader = SegmentReader(segment.buf, size)
+
+    try:
+        yield reader
+    finally:
+        reader.close()
+        segment.close()
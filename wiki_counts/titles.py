@@ -0,0 +1,147 @@
+import os
+import threading
+import numpy as np
+
+from typing import Dict, List, Tuple
+
+# encoded pages of one domain for one hour: (title ids, count_views), most viewed first
+EncodedPages = Tuple[np.ndarray, np.ndarray]
+
+
+class TitleDictionary:
+    """maps every (domain_code, page_title) to a small integer id
+
+    holding ids instead of strings means a title that shows up in many hours is
+    only stored once, and merging hours is arithmetic on integer arrays. ids
+    are handed out in order, so the dictionary is saved as an append-only file
+    with the title for id i on line i
+    """
+
+    def __init__(self):
+        self.ids: Dict[Tuple[str, str], int] = {}
+        self.keys: List[Tuple[str, str]] = []
+        self.lock = threading.Lock()
+
+        # number of entries already written to disk by save
+        self.num_saved = 0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def id_for(self, domain_code: str, page_title: str) -> int:
+        """get the id of a page, giving it a new one if it has none
+
+        Arguments:
+            domain_code {str} -- domain code
+            page_title {str} -- page title
+
+        Returns:
+            int -- id of the page
+        """
+        key = (domain_code, page_title)
+        title_id = self.ids.get(key)
+        if title_id is not None:
+            return title_id
+
+        with self.lock:
+            # another thread may have added it while we waited for the lock
+            if key not in self.ids:
+                self.ids[key] = len(self.keys)
+                self.keys.append(key)
+
+            return self.ids[key]
+
+    def lookup(self, title_id: int) -> Tuple[str, str]:
+        """get the page an id refers to
+
+        Arguments:
+            title_id {int} -- id of the page
+
+        Returns:
+            Tuple[str, str] -- domain_code, page_title
+        """
+        return self.keys[title_id]
+
+    def save(self, path: str):
+        """append the entries added since the last save to the dictionary file
+
+        Arguments:
+            path {str} -- path to the dictionary file
+        """
+        with self.lock:
+            new_keys = self.keys[self.num_saved:]
+            if not new_keys:
+                return
+
+            with open(path, 'a') as f:
+                f.writelines(f'{domain} {title}\n' for domain, title in new_keys)
+
+            self.num_saved += len(new_keys)
+
+    @classmethod
+    def load(cls, path: str) -> 'TitleDictionary':
+        """read a dictionary file written by save
+
+        Arguments:
+            path {str} -- path to the dictionary file, which doesn't have to exist yet
+
+        Returns:
+            TitleDictionary -- dictionary with the same ids as when it was saved
+        """
+        titles = cls()
+
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    domain_code, page_title = line.split()
+                    titles.id_for(domain_code, page_title)
+
+        titles.num_saved = len(titles)
+        return titles
+
+
+def encode_pages(
+        titles: TitleDictionary,
+        domain_code: str,
+        pages: List[Tuple[int, str]]) -> EncodedPages:
+    """convert a domain's (count_views, page_title) tuples to arrays of ids and counts
+
+    Arguments:
+        titles {TitleDictionary} -- dictionary to get ids from
+        domain_code {str} -- domain code
+        pages {List[Tuple[int, str]]} -- (count_views, page_title) tuples
+
+    Returns:
+        EncodedPages -- (title ids, count_views) arrays, in the same order as pages
+    """
+    ids = np.fromiter(
+        (titles.id_for(domain_code, page_title) for _, page_title in pages),
+        dtype=np.uint32, count=len(pages))
+    counts = np.fromiter(
+        (count_views for count_views, _ in pages),
+        dtype=np.int64, count=len(pages))
+
+    return ids, counts
+
+
+def merge_pages(encoded: List[EncodedPages]) -> EncodedPages:
+    """sum the views of the same pages over several hours
+
+    Arguments:
+        encoded {List[EncodedPages]} -- (title ids, count_views) arrays, one pair per hour
+
+    Returns:
+        EncodedPages -- (title ids, summed count_views) arrays, most viewed first
+    """
+    if not encoded:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int64)
+
+    all_ids = np.concatenate([ids for ids, _ in encoded])
+    all_counts = np.concatenate([counts for _, counts in encoded])
+
+    ids, inverse = np.unique(all_ids, return_inverse=True)
+    counts = np.bincount(inverse, weights=all_counts).astype(np.int64)
+
+    # most viewed first, ties broken by id so the order is stable
+    order = np.lexsort((ids, -counts))
+    return ids[order], counts[order]
@@ -0,0 +1,117 @@
+import heapq
+import struct
+
+from typing import Dict, List, Tuple, Union
+
+from .utils import atomic_open
+
+# file layout, all integers little endian:
+#   header: magic, version, k, sha1 of the blacklist file, number of domains
+#   then for every domain:
+#     byte length of the rest of the domain's block, domain length, domain, number of pages
+#     then for every page, most viewed first: count_views, title length, title
+HEADER = struct.Struct('<4sHI20sI')
+DOMAIN = struct.Struct('<IH')
+NUM_PAGES = struct.Struct('<I')
+PAGE = struct.Struct('<QH')
+
+MAGIC = b'WTOP'
+VERSION = 1
+
+
+def write_top_k(
+        path: str,
+        most_viewed_map: Dict[str, List[Tuple[int, str]]],
+        k: int,
+        blacklist_digest: bytes):
+    """save the top k pages for each domain in a compact binary file
+
+    Arguments:
+        path {str} -- path to write to
+        most_viewed_map {Dict[str, List[Tuple[int, str]]]} -- keys are domains, values are heaps of at least the top k most viewed pages
+        k {int} -- number of pages kept per domain
+        blacklist_digest {bytes} -- sha1 digest of the blacklist the map was built with
+    """
+    with atomic_open(path, 'wb') as f:
+        f.write(HEADER.pack(
+            MAGIC, VERSION, k, blacklist_digest, len(most_viewed_map)))
+
+        for domain, heap in most_viewed_map.items():
+            pages = heapq.nlargest(k, heap)
+
+            block = bytearray()
+            for count_views, page_title in pages:
+                encoded = page_title.encode('utf-8')
+                block += PAGE.pack(count_views, len(encoded))
+                block += encoded
+
+            encoded_domain = domain.encode('utf-8')
+
+            # the block length lets readers skip pages they didn't ask for
+            block_len = 2 + len(encoded_domain) + NUM_PAGES.size + len(block)
+
+            f.write(DOMAIN.pack(block_len, len(encoded_domain)))
+            f.write(encoded_domain)
+            f.write(NUM_PAGES.pack(len(pages)))
+            f.write(block)
+
+
+def read_top_k(
+        path: str,
+        n: int,
+        blacklist_digest: Union[bytes, None] = None) -> Dict[str, List[Tuple[int, str]]]:
+    """read the top n pages for each domain from a file written by write_top_k
+
+    Arguments:
+        path {str} -- path to the binary top k file
+        n {int} -- number of pages to read per domain, at most the k the file was written with
+
+    Keyword Arguments:
+        blacklist_digest {bytes, None} -- if given, the file must have been written with this blacklist (default: {None})
+
+    Raises:
+        ValueError: file is not a top k file, n is larger than k, or the blacklist does not match
+
+    Returns:
+        Dict[str, List[Tuple[int, str]]] -- keys are domains, values are (count_views, page_title) tuples, most viewed first
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    magic, version, k, digest, num_domains = HEADER.unpack_from(data, 0)
+
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{path} is not a top k file')
+    if n > k:
+        raise ValueError(f'{path} only has the top {k} pages, asked for {n}')
+    if blacklist_digest is not None and digest != blacklist_digest:
+        raise ValueError(f'{path} was written with a different blacklist')
+
+    top_n_map = {}
+    offset = HEADER.size
+
+    for _ in range(num_domains):
+        block_len, domain_len = DOMAIN.unpack_from(data, offset)
+        block_end = offset + 4 + block_len
+        offset += DOMAIN.size
+
+        domain = data[offset:offset + domain_len].decode('utf-8')
+        offset += domain_len
+
+        num_pages, = NUM_PAGES.unpack_from(data, offset)
+        offset += NUM_PAGES.size
+
+        pages = []
+        for _ in range(min(n, num_pages)):
+            count_views, title_len = PAGE.unpack_from(data, offset)
+            offset += PAGE.size
+            pages.append(
+                (count_views, data[offset:offset + title_len].decode('utf-8')))
+            offset += title_len
+
+        top_n_map[domain] = pages
+
+        # skip the pages past n
+        offset = block_end
+
+    return top_n_map
@@ -0,0 +1,135 @@
+import os
+import heapq
+import logging
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple, Union
+
+from .config import DATASETS, TOP_K_DIR, TRENDING_DIR
+from .top_k import read_top_k
+from .utils import atomic_open, filename_from_path, dataset_from_path
+
+logger = logging.getLogger(__name__)
+
+# a trending file is written per hour, named like its results file, with one line
+# for each of the top k pages of every domain, most viewed first
+#   "domain page_title count_views rank rank_change view_change"
+# where rank starts at 1, rank_change is how many places the page rose since the
+# previous hour (negative if it fell), and view_change is how many more views it had.
+# both changes are "new" for a page that wasn't in the previous hour's top k
+
+
+def adjacent_hour(filename: str, hours: int) -> str:
+    """get the name of the results file a number of hours before or after another
+
+    Arguments:
+        filename {str} -- name of a results file, e.g. "pageviews-20200501-100000"
+        hours {int} -- hours to move, negative for earlier hours
+
+    Returns:
+        str -- name of the other hour's results file, e.g. "pageviews-20200501-090000" for -1
+    """
+    name_format = filename_from_path(
+        DATASETS[dataset_from_path(filename)], remove_gz=True)
+
+    hour = datetime.strptime(filename, name_format) + timedelta(hours=hours)
+    return hour.strftime(name_format)
+
+
+def trending_path(filename: str, trending_dir: str = TRENDING_DIR) -> str:
+    """get the path of an hour's trending file
+
+    Arguments:
+        filename {str} -- name of the hour's results file
+
+    Keyword Arguments:
+        trending_dir {str} -- directory of the trending files (default: {config.TRENDING_DIR})
+
+    Returns:
+        str -- path to the trending file
+    """
+    return os.path.join(trending_dir, filename)
+
+
+def load_state(
+        filename: str,
+        k: int,
+        blacklist_digest: bytes,
+        top_k_dir: str = TOP_K_DIR) -> Union[Dict[str, List[Tuple[int, str]]], None]:
+    """read the top k pages an hour was left with, to compare another hour to
+
+    Arguments:
+        filename {str} -- name of the hour's results file
+        k {int} -- number of pages to read per domain
+        blacklist_digest {bytes} -- sha1 digest of the blacklist the comparison is made with
+
+    Keyword Arguments:
+        top_k_dir {str} -- directory of the binary top k files (default: {config.TOP_K_DIR})
+
+    Returns:
+        Dict[str, List[Tuple[int, str]]], None -- top k pages of each domain, most viewed first,
+                                                  or None if the hour hasn't been analyzed or can't be compared
+    """
+    path = os.path.join(top_k_dir, filename)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        return read_top_k(path, k, blacklist_digest)
+    except ValueError as e:
+        # written with a smaller k or another blacklist, so the ranks wouldn't line up
+        logger.warning(f'not comparing to {filename}: {e}')
+        return None
+
+
+def compare_hours(
+        previous_map: Dict[str, List[Tuple[int, str]]],
+        current_map: Dict[str, List[Tuple[int, str]]],
+        k: int) -> List[str]:
+    """compare the top k pages of each domain in an hour to the hour before it
+
+    Arguments:
+        previous_map {Dict[str, List[Tuple[int, str]]]} -- keys are domains, values are at least the top k (count_views, page_title) tuples of the previous hour
+        current_map {Dict[str, List[Tuple[int, str]]]} -- same, for the hour being compared, heaps or lists
+
+    Returns:
+        List[str] -- lines of the trending file
+    """
+    lines = []
+
+    for domain, pages in current_map.items():
+        # page_title -> (rank, count_views) in the previous hour
+        previous = {
+            page_title: (rank, count_views)
+            for rank, (count_views, page_title)
+            in enumerate(heapq.nlargest(k, previous_map.get(domain, [])), 1)}
+
+        for rank, (count_views, page_title) in enumerate(heapq.nlargest(k, pages), 1):
+            if page_title in previous:
+                previous_rank, previous_views = previous[page_title]
+                rank_change = previous_rank - rank
+                view_change = count_views - previous_views
+            else:
+                rank_change = view_change = 'new'
+
+            lines.append(
+                f'{domain} {page_title} {count_views} {rank} {rank_change} {view_change}\n')
+
+    return lines
+
+
+def write_trending(
+        filename: str,
+        lines: List[str],
+        trending_dir: str = TRENDING_DIR):
+    """write an hour's trending file
+
+    Arguments:
+        filename {str} -- name of the hour's results file
+        lines {List[str]} -- lines produced by compare_hours
+
+    Keyword Arguments:
+        trending_dir {str} -- directory of the trending files (default: {config.TRENDING_DIR})
+    """
+    with atomic_open(trending_path(filename, trending_dir)) as f:
+        f.writelines(lines)
@@ -1,8 +1,18 @@
-import traceback
+import io
+import gzip
+import logging
 import os
+import signal
 
+from contextlib import contextmanager
 from functools import wraps
 
+from .config import READAHEAD_BLOCK_BYTES
+from .log import shutdown as shutdown_logging
+from .readahead import open_readahead
+
+logger = logging.getLogger(__name__)
+
 
 def killswitch_on_exception(func):
     """decorator - if the function fails unexpectedly, throw a killswitch that terminates other processes
@@ -25,16 +35,25 @@ def killswitch_on_exception(func):
         try:
             func(*args)
 
-        # should the function fail, print the traceback
+        # should the function fail, log the traceback
         # and communicate to all other processes that they should quit
         except:
-            traceback.print_exc()
-            print('killing all processes')
+            logger.exception('killing all processes')
             process_killswitch.value = True
 
+        # the process exits without running atexit, so its queued log records,
+        # the traceback above included, have to be written before it returns
+        finally:
+            shutdown_logging()
+
     return wrapper
 
 
+def ignore_interrupts():
+    """leave ctrl-c to the parent process, which stops the other processes by throwing the killswitch"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
 def filename_from_path(file_path: str, remove_gz: bool = False) -> str:
     """extract the filename from its path, works for urls too
 
@@ -52,3 +71,92 @@ def filename_from_path(file_path: str, remove_gz: bool = False) -> str:
         filename = filename[:-3]
 
     return filename
+
+
+def open_archive(file_path: str, fileobj=None):
+    """open a downloaded archive as text, whether it is gzipped (pageviews) or not (projectviews)
+
+    Arguments:
+        file_path {str} -- path to the archive
+
+    Keyword Arguments:
+        fileobj {file object, None} -- binary file object to read the archive from instead of file_path,
+                                       which is then only used for its name (default: {None})
+
+    Returns:
+        file object -- text file object, or ReadAheadReader for gzip archives if config.READAHEAD_BLOCK_BYTES is set, to read lines from
+    """
+    if file_path.endswith('.gz') and READAHEAD_BLOCK_BYTES:
+        return open_readahead(file_path, fileobj, block_bytes=READAHEAD_BLOCK_BYTES)
+
+    if fileobj is not None:
+        fileobj = io.BufferedReader(fileobj)
+
+        if file_path.endswith('.gz'):
+            return gzip.open(fileobj, mode='rt')
+
+        return io.TextIOWrapper(fileobj)
+
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, mode='rt')
+
+    return open(file_path, mode='r')
+
+
+def dataset_from_path(file_path: str) -> str:
+    """get which dataset a downloaded archive or results file belongs to
+
+    Arguments:
+        file_path {str} -- path to file, or url, e.g. ".../projectviews-20200501-100000"
+
+    Returns:
+        str -- name of the dataset, e.g. "projectviews"
+    """
+    return filename_from_path(file_path).split('-')[0]
+
+
+def partial_path(path: str) -> str:
+    """get the path a file is written to before it is renamed into place
+
+    the name starts with a dot, so globs like "*" and "*.gz" don't pick it up
+
+    Arguments:
+        path {str} -- final path of the file
+
+    Returns:
+        str -- path of the partially written file
+    """
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, f'.{filename}.partial')
+
+
+@contextmanager
+def atomic_open(path: str, mode: str = 'w'):
+    """open a file for writing so that it only appears at path once it is completely written
+
+    the file is written next to path, flushed to disk, then renamed over path.
+    if writing fails, the partial file is removed and path is left untouched
+
+    Arguments:
+        path {str} -- final path of the file
+
+    Keyword Arguments:
+        mode {str} -- mode to open the file with, "w" or "wb" (default: {'w'})
+
+    Yields:
+        file -- file object to write to
+    """
+    tmp_path = partial_path(path)
+
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # rename is atomic, so readers see either the old file or the whole new one
+    os.replace(tmp_path, path)
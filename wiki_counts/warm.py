@@ -0,0 +1,15 @@
+# imported by the fork server before it forks any process, so that every
+# process it starts already has the package imported and the blacklist built
+# each process still runs the main script again, so every module of the package
+# is imported here, which leaves only the script's own definitions to run
+import pkgutil
+import importlib
+
+from .analyze import load_blacklist_set, blacklist_digest
+
+package = importlib.import_module(__package__)
+for module in pkgutil.walk_packages(package.__path__, package.__name__ + '.'):
+    importlib.import_module(module.name)
+
+load_blacklist_set()
+blacklist_digest()